@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0001_initial"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alerta",
+            name="actualizado_en",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="alerta",
+            index=models.Index(
+                fields=["paciente", "actualizado_en"], name="alerta_pac_sync_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0002_alerta_actualizado_en"),
+        ("insumos", "0003_checkpointinsumo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alerta",
+            name="insumo",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="alertas",
+                to="insumos.insumo",
+            ),
+        ),
+    ]
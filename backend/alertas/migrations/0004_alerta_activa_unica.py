@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+PREFIJO = "Stock bajo en "
+
+
+# enlazo las alertas antiguas con su insumo a partir del mensaje
+def rellenar_insumo(apps, schema_editor):
+    Alerta = apps.get_model("alertas", "Alerta")
+    Insumo = apps.get_model("insumos", "Insumo")
+    sin_insumo = Alerta.objects.filter(
+        tipo="stock_bajo", insumo__isnull=True, mensaje__startswith=PREFIJO
+    ).order_by("paciente_id")
+    pacientes = sin_insumo.values_list("paciente_id", flat=True).distinct()
+    for paciente_id in pacientes.iterator():
+        # nombre mas largo primero: "Tiras XL" antes que "Tiras"
+        insumos = sorted(
+            Insumo.objects.filter(paciente_id=paciente_id).values_list("pk", "nombre"),
+            key=lambda x: -len(x[1]),
+        )
+        cambios = []
+        for alerta in sin_insumo.filter(paciente_id=paciente_id).only("mensaje"):
+            for pk, nombre in insumos:
+                if alerta.mensaje.startswith(f"{PREFIJO}{nombre}: "):
+                    alerta.insumo_id = pk
+                    cambios.append(alerta)
+                    break
+        Alerta.objects.bulk_update(cambios, ["insumo"], batch_size=1000)
+
+
+# me quedo con la activa mas reciente de cada (insumo, tipo); el resto se borra
+def colapsar_duplicados(apps, schema_editor):
+    Alerta = apps.get_model("alertas", "Alerta")
+    Borrado = apps.get_model("sync", "Borrado")
+    repetidas = (
+        Alerta.objects.filter(activa=True, insumo__isnull=False)
+        .values("insumo_id", "tipo")
+        .annotate(n=models.Count("id"), ultima=models.Max("id"))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    sobran = defaultdict(list)
+    for grupo in repetidas.iterator():
+        for pk, paciente_id in (
+            Alerta.objects.filter(
+                activa=True, insumo_id=grupo["insumo_id"], tipo=grupo["tipo"]
+            )
+            .exclude(pk=grupo["ultima"])
+            .values_list("pk", "paciente_id")
+        ):
+            sobran[paciente_id].append(pk)
+    for paciente_id, ids in sobran.items():
+        # lapida para que los clientes de delta-sync tambien las quiten
+        Borrado.objects.bulk_create(
+            [
+                Borrado(paciente_id=paciente_id, recurso="alertas", objeto_id=pk)
+                for pk in ids
+            ],
+            batch_size=1000,
+        )
+        Alerta.objects.filter(pk__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0003_alerta_insumo"),
+        ("insumos", "0004_insumo_insumo_stock_bajo_idx"),
+        ("pacientes", "0001_initial"),
+        ("sync", "0002_operacion_sync"),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_insumo, migrations.RunPython.noop),
+        migrations.RunPython(colapsar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="alerta",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("activa", True)),
+                fields=("insumo", "tipo"),
+                name="alerta_activa_unica",
+            ),
+        ),
+    ]
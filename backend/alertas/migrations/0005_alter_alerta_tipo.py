@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0004_alerta_activa_unica"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alerta",
+            name="tipo",
+            field=models.CharField(
+                choices=[("stock_bajo", "Stock bajo"), ("caducidad", "Caducidad")],
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0005_alter_alerta_tipo"),
+        ("insumos", "0005_insumo_insumo_caduca_idx"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alerta",
+            index=models.Index(
+                condition=models.Q(("activa", True)),
+                fields=["paciente", "tipo", "-creada_en"],
+                name="alerta_activa_pac_idx",
+            ),
+        ),
+    ]
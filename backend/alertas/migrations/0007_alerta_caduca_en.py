@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+# las de caducidad ya existentes se refieren a la fecha actual de su insumo
+def rellenar_caduca_en(apps, schema_editor):
+    Alerta = apps.get_model("alertas", "Alerta")
+    Insumo = apps.get_model("insumos", "Insumo")
+    Alerta.objects.filter(tipo="caducidad", insumo__isnull=False).update(
+        caduca_en=models.Subquery(
+            Insumo.objects.filter(pk=models.OuterRef("insumo_id")).values("caduca_en")[
+                :1
+            ]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alertas", "0006_alerta_activa_pac_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alerta",
+            name="caduca_en",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(rellenar_caduca_en, migrations.RunPython.noop),
+    ]
@@ -3,15 +3,47 @@ from django.db import models
 
 # modelo de la alerta
 class Alerta(models.Model):
-    TIPOS = (("stock_bajo", "Stock bajo"),)
+    TIPOS = (("stock_bajo", "Stock bajo"), ("caducidad", "Caducidad"))
     paciente = models.ForeignKey(
         "pacientes.Paciente", on_delete=models.CASCADE, related_name="alertas"
     )
+    # insumo al que se refiere la alerta (stock_bajo); clave real para deduplicar
+    insumo = models.ForeignKey(
+        "insumos.Insumo",
+        on_delete=models.CASCADE,
+        related_name="alertas",
+        null=True,
+        blank=True,
+    )
     tipo = models.CharField(max_length=20, choices=TIPOS)
     mensaje = models.TextField()
+    # fecha avisada (caducidad): atendida para esa fecha, el scan no la reabre
+    caduca_en = models.DateField(null=True, blank=True)
     activa = models.BooleanField(default=True)
     creada_en = models.DateTimeField(auto_now_add=True)
     atendida_en = models.DateTimeField(null=True, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)  # delta-sync
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["paciente", "actualizado_en"], name="alerta_pac_sync_idx"
+            ),
+            # parcial: solo activas (badge de conteo y listado ?activas=true)
+            models.Index(
+                fields=["paciente", "tipo", "-creada_en"],
+                condition=models.Q(activa=True),
+                name="alerta_activa_pac_idx",
+            ),
+        ]
+        constraints = [
+            # una sola alerta activa por insumo y tipo (upsert en alertas.services)
+            models.UniqueConstraint(
+                fields=["insumo", "tipo"],
+                condition=models.Q(activa=True),
+                name="alerta_activa_unica",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_display()} — {self.paciente}"
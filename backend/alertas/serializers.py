@@ -9,8 +9,28 @@ class AlertaSerializer(serializers.ModelSerializer):
         fields = [
             "id",
             "tipo",
+            "insumo",
             "mensaje",
             "activa",
             "creada_en",
             "atendida_en",
         ]
+        read_only_fields = ["insumo"]
+
+
+# filtros del atendido en bloque; sin ninguno hay que pedir todas=true
+class AtenderAlertasSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=1000
+    )
+    tipo = serializers.ChoiceField(choices=Alerta.TIPOS, required=False)
+    antes_de = serializers.DateTimeField(required=False)
+    todas = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not (data.get("ids") or data.get("tipo") or data.get("antes_de")):
+            if not data["todas"]:
+                raise serializers.ValidationError(
+                    "Indica ids, tipo, antes_de o todas=true."
+                )
+        return data
@@ -0,0 +1,67 @@
+from core.eventos import publicar
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Alerta
+
+
+def _upsert_on_conflict(filas, ahora):
+    # un INSERT multi-fila; el conflicto se infiere del indice parcial (activa)
+    tabla = connection.ops.quote_name(Alerta._meta.db_table)
+    valores = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(filas))
+    ts = connection.ops.adapt_datetimefield_value(ahora)
+    params = []
+    for paciente_id, insumo_id, tipo, mensaje, caduca_en in filas:
+        caduca_en = connection.ops.adapt_datefield_value(caduca_en)
+        params += [paciente_id, insumo_id, tipo, mensaje, caduca_en, True, ts, ts]
+    sql = (
+        f"INSERT INTO {tabla} "
+        "(paciente_id, insumo_id, tipo, mensaje, caduca_en, activa, creada_en, "
+        "actualizado_en) "
+        f"VALUES {valores} "
+        "ON CONFLICT (insumo_id, tipo) WHERE activa "
+        "DO UPDATE SET mensaje = excluded.mensaje, caduca_en = excluded.caduca_en, "
+        "actualizado_en = excluded.actualizado_en"
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+
+
+def _upsert_por_filas(filas, ahora):
+    for paciente_id, insumo_id, tipo, mensaje, caduca_en in filas:
+        for _ in range(2):
+            actualizadas = Alerta.objects.filter(
+                insumo_id=insumo_id, tipo=tipo, activa=True
+            ).update(mensaje=mensaje, caduca_en=caduca_en, actualizado_en=ahora)
+            if actualizadas:
+                break
+            try:
+                with transaction.atomic():
+                    Alerta.objects.create(
+                        paciente_id=paciente_id,
+                        insumo_id=insumo_id,
+                        tipo=tipo,
+                        mensaje=mensaje,
+                        caduca_en=caduca_en,
+                    )
+                break
+            except IntegrityError:
+                continue  # otra peticion la creo entre medias: la actualizo
+
+
+# crea o refresca la alerta activa de cada (insumo, tipo): como mucho una
+def upsert_alertas(filas):
+    """
+    filas: [(paciente_id, insumo_id, tipo, mensaje[, caduca_en])], con
+    insumo_id no nulo.
+    """
+    filas = [(*f, None)[:5] for f in filas]
+    if not filas:
+        return
+    ahora = timezone.now()
+    if connection.features.supports_update_conflicts_with_target:
+        _upsert_on_conflict(filas, ahora)
+    else:
+        _upsert_por_filas(filas, ahora)
+    for paciente_id in {f[0] for f in filas}:
+        publicar(paciente_id)
@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from alertas.models import Alerta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from insumos.models import Insumo
+from rest_framework.test import APITestCase
+
+
+class AlertaAPITest(APITestCase):
+    def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
+        self.user = User.objects.create_user("alertas", password="alertas1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "alertas", "password": "alertas1234"},
+            format="json",
+        )
+        assert r.status_code == 200, r.content
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {r.data['access']}")
+        self.client.get("/api/paciente/me/")
+        self.paciente = self.user.paciente
+
+    def _alerta(self, tipo="stock_bajo", dias=0, paciente=None):
+        a = Alerta.objects.create(
+            paciente=paciente or self.paciente, tipo=tipo, mensaje="x"
+        )
+        if dias:
+            Alerta.objects.filter(pk=a.pk).update(
+                creada_en=timezone.now() - timedelta(days=dias)
+            )
+        return a
+
+    def test_atender_por_ids(self):
+        a, b, c = self._alerta(), self._alerta(), self._alerta()
+        r = self.client.post(
+            "/api/alertas/atender/", {"ids": [a.pk, b.pk]}, format="json"
+        )
+        assert r.status_code == 200, r.content
+        assert r.data["atendidas"] == 2
+        a.refresh_from_db()
+        assert not a.activa and a.atendida_en is not None
+        assert Alerta.objects.get(pk=c.pk).activa
+
+    def test_reactivar_con_otra_activa_da_409(self):
+        insumo = Insumo.objects.create(
+            paciente=self.paciente, nombre="Tiras", tipo="TIR", stock_actual=0
+        )
+        vieja = Alerta.objects.create(
+            paciente=self.paciente,
+            insumo=insumo,
+            tipo="stock_bajo",
+            mensaje="x",
+            activa=False,
+        )
+        nueva = Alerta.objects.create(
+            paciente=self.paciente, insumo=insumo, tipo="stock_bajo", mensaje="y"
+        )
+        for metodo in (self.client.patch, self.client.put):
+            r = metodo(
+                f"/api/alertas/{vieja.pk}/",
+                {"tipo": "stock_bajo", "mensaje": "x", "activa": True},
+                format="json",
+            )
+            assert r.status_code == 409, r.content
+            assert r.data["activa_id"] == nueva.pk
+        assert not Alerta.objects.get(pk=vieja.pk).activa
+
+    def test_atender_por_filtro(self):
+        self._alerta(dias=5)
+        self._alerta(tipo="caducidad", dias=5)
+        self._alerta()
+        antes = (timezone.now() - timedelta(days=1)).isoformat()
+        r = self.client.post(
+            "/api/alertas/atender/",
+            {"tipo": "stock_bajo", "antes_de": antes},
+            format="json",
+        )
+        assert r.data["atendidas"] == 1
+        r = self.client.post("/api/alertas/atender/", {"todas": True}, format="json")
+        assert r.data["atendidas"] == 2
+        assert not Alerta.objects.filter(activa=True).exists()
+
+    def test_atender_exige_filtro_y_respeta_paciente(self):
+        r = self.client.post("/api/alertas/atender/", {}, format="json")
+        assert r.status_code == 400
+        otro = User.objects.create_user("otro", password="x")
+        ajena = self._alerta(paciente=otro.paciente)
+        r = self.client.post("/api/alertas/atender/", {"todas": True}, format="json")
+        assert r.data["atendidas"] == 0
+        assert Alerta.objects.get(pk=ajena.pk).activa
+
+    def test_conteo_con_etag(self):
+        self._alerta(), self._alerta(), self._alerta(tipo="caducidad")
+        Alerta.objects.filter(pk=self._alerta().pk).update(activa=False)
+        r = self.client.get("/api/alertas/conteo/")
+        assert r.status_code == 200
+        assert r.data == {"total": 3, "por_tipo": {"stock_bajo": 2, "caducidad": 1}}
+        etag = r["ETag"]
+
+        r = self.client.get("/api/alertas/conteo/", HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 304
+        assert not r.content
+
+        self._alerta(tipo="caducidad")
+        r = self.client.get("/api/alertas/conteo/", HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200
+        assert r.data["total"] == 4 and r["ETag"] != etag
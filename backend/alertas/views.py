@@ -1,9 +1,13 @@
+from core.http import con_etag
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.utils import timezone
-from rest_framework import permissions, status, viewsets
+from drf_spectacular.utils import OpenApiExample, extend_schema
+from rest_framework import decorators, permissions, status, viewsets
 from rest_framework.response import Response
 
 from .models import Alerta
-from .serializers import AlertaSerializer
+from .serializers import AlertaSerializer, AtenderAlertasSerializer
 
 
 class AlertaViewSet(viewsets.ModelViewSet):
@@ -23,6 +27,31 @@ class AlertaViewSet(viewsets.ModelViewSet):
                 qs = qs.filter(activa=False)
         return qs
 
+    def _conflicto(self, instance):
+        # alerta_activa_unica: ya hay otra activa del mismo (insumo, tipo)
+        otra = (
+            Alerta.objects.filter(
+                insumo_id=instance.insumo_id, tipo=instance.tipo, activa=True
+            )
+            .exclude(pk=instance.pk)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        return Response(
+            {
+                "detail": "Ya existe una alerta activa para este insumo y tipo.",
+                "activa_id": otra,
+            },
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    def update(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().update(request, *args, **kwargs)
+        except IntegrityError:
+            return self._conflicto(self.get_object())
+
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_queryset().get(
             pk=kwargs["pk"]
@@ -34,8 +63,65 @@ class AlertaViewSet(viewsets.ModelViewSet):
             instance.activa = bool(activa)
             if not instance.activa and instance.atendida_en is None:
                 instance.atendida_en = timezone.now()
-            instance.save(update_fields=["activa", "atendida_en"])
+            try:
+                with transaction.atomic():
+                    instance.save(
+                        update_fields=["activa", "atendida_en", "actualizado_en"]
+                    )
+            except IntegrityError:
+                return self._conflicto(instance)
             return Response(
                 self.get_serializer(instance).data, status=status.HTTP_200_OK
             )
         return super().partial_update(request, *args, **kwargs)
+
+    @extend_schema(
+        tags=["Alertas"],
+        request=AtenderAlertasSerializer,
+        examples=[
+            OpenApiExample(
+                "Atender las de stock de antes de ayer",
+                value={"tipo": "stock_bajo", "antes_de": "2025-11-10T00:00:00Z"},
+                request_only=True,
+            )
+        ],
+    )
+    @decorators.action(detail=False, methods=["post"], url_path="atender")
+    def atender(self, request):
+        """
+        Marca como atendidas (activa=false) varias alertas activas con un solo
+        UPDATE. Filtros combinables: ids, tipo, antes_de (creada_en), todas.
+        """
+        ser = AtenderAlertasSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        filtros = ser.validated_data
+        qs = Alerta.objects.filter(paciente__usuario=request.user, activa=True)
+        if filtros.get("ids"):
+            qs = qs.filter(pk__in=filtros["ids"])
+        if filtros.get("tipo"):
+            qs = qs.filter(tipo=filtros["tipo"])
+        if filtros.get("antes_de"):
+            qs = qs.filter(creada_en__lt=filtros["antes_de"])
+        ahora = timezone.now()
+        # update() no toca auto_now: actualizado_en a mano para el delta-sync
+        n = qs.update(activa=False, atendida_en=ahora, actualizado_en=ahora)
+        return Response({"atendidas": n})
+
+    @extend_schema(tags=["Alertas"])
+    @decorators.action(detail=False, methods=["get"], url_path="conteo")
+    def conteo(self, request):
+        """
+        Alertas activas por tipo, para el badge del dashboard. Responde con
+        ETag: si no ha cambiado nada (If-None-Match) devuelve 304 sin cuerpo.
+        """
+        # usa el indice parcial de activas: no lee las atendidas
+        por_tipo = dict(
+            Alerta.objects.filter(paciente__usuario=request.user, activa=True)
+            .values("tipo")
+            .annotate(n=Count("id"))
+            .order_by()
+            .values_list("tipo", "n")
+        )
+        return con_etag(
+            request, {"total": sum(por_tipo.values()), "por_tipo": por_tipo}
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comidas", "0001_initial"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comida",
+            name="actualizado_en",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="dosisinsulina",
+            name="actualizado_en",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="comida",
+            index=models.Index(
+                fields=["paciente", "actualizado_en"], name="comida_pac_sync_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dosisinsulina",
+            index=models.Index(
+                fields=["paciente", "actualizado_en"], name="dosis_pac_sync_idx"
+            ),
+        ),
+    ]
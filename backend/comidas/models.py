@@ -11,10 +11,16 @@ class Comida(models.Model):
     fecha = models.DateTimeField(default=timezone.now)
     carbohidratos_g = models.PositiveIntegerField(default=0)
     descripcion = models.CharField(max_length=255, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)  # delta-sync
 
     class Meta:
         # lo ordeno por fecha
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(
+                fields=["paciente", "actualizado_en"], name="comida_pac_sync_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -45,9 +51,15 @@ class DosisInsulina(models.Model):
         Comida, on_delete=models.SET_NULL, null=True, blank=True, related_name="dosis"
     )
     notas = models.CharField(max_length=255, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)  # delta-sync
 
     class Meta:
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(
+                fields=["paciente", "actualizado_en"], name="dosis_pac_sync_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -1,6 +1,12 @@
+import importlib
+
 from django.apps import AppConfig
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # registro los system checks sin gatillar F401
+        importlib.import_module("core.checks")
@@ -0,0 +1,43 @@
+# versiones de cache por paciente: invalidar = cambiar la version (las claves viejas
+# dejan de leerse y caducan solas), sin tener que conocer cada clave cacheada.
+# Requiere una cache compartida (CACHES en settings, ver core.checks): con LocMem
+# cada worker tendria su propia version.
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+def _clave_version(ambito, paciente_id):
+    return f"version:{ambito}:{paciente_id}"
+
+
+def _nueva_version():
+    # token aleatorio, no un contador: dos invalidaciones a la vez no se pisan y
+    # una version purgada de la cache nunca vuelve a un valor ya usado
+    return uuid.uuid4().hex[:12]
+
+
+def version(ambito, paciente_id):
+    v = cache.get(_clave_version(ambito, paciente_id))
+    if v is None:
+        cache.add(_clave_version(ambito, paciente_id), _nueva_version(), timeout=None)
+        v = cache.get(_clave_version(ambito, paciente_id))
+    return v
+
+
+def _subir(ambito, paciente_id):
+    cache.set(_clave_version(ambito, paciente_id), _nueva_version(), timeout=None)
+
+
+def invalidar(ambito, paciente_id):
+    if connection.in_atomic_block:
+        # ahora (esta transaccion ya lee lo suyo) y otra vez tras el commit: lo
+        # que otro lector cacheara entre medias con datos previos queda fuera
+        _subir(ambito, paciente_id)
+    transaction.on_commit(lambda: _subir(ambito, paciente_id))
+
+
+def clave(ambito, paciente_id, *partes):
+    sufijo = ":".join(str(p) for p in partes)
+    return f"{ambito}:{paciente_id}:v{version(ambito, paciente_id)}:{sufijo}"
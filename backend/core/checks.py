@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# caches que viven dentro de un solo proceso
+NO_COMPARTIDAS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register()
+def cache_compartida(app_configs, **kwargs):
+    # las versiones de core.cache, el payload publico de los kits y los
+    # throttles tienen que verse igual desde todos los workers y comandos
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend in NO_COMPARTIDAS:
+        return [
+            Error(
+                f"La cache por defecto ({backend}) no se comparte entre procesos.",
+                hint="Configura REDIS_URL o CACHE_DIR (FileBasedCache).",
+                id="core.E001",
+            )
+        ]
+    return []
+
+
+# backends con incr atomico entre procesos (core.throttling, contador "cache")
+INCR_ATOMICO = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+)
+
+
+@register()
+def contador_throttle(app_configs, **kwargs):
+    if settings.THROTTLE_CONTADOR not in ("cache", "bd"):
+        return [
+            Error(
+                f"THROTTLE_CONTADOR={settings.THROTTLE_CONTADOR!r} no es valido.",
+                hint='Usa "cache" (Redis/Memcached) o "bd".',
+                id="core.E002",
+            )
+        ]
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if settings.THROTTLE_CONTADOR == "cache" and backend not in INCR_ATOMICO:
+        return [
+            Error(
+                f"El contador de throttles en cache necesita un incr atomico "
+                f"entre procesos y {backend} no lo tiene.",
+                hint='Configura REDIS_URL o usa THROTTLE_CONTADOR="bd".',
+                id="core.E002",
+            )
+        ]
+    return []
+
+
+@register(deploy=True)
+def spool_persistente(app_configs, **kwargs):
+    # el write-behind de kits.auditoria solo es durable si el spool sobrevive
+    # a un redeploy: dentro de BASE_DIR vive en la capa efimera del contenedor
+    if settings.KIT_VERIFICACION_MODO != "buffer":
+        return []
+    spool = Path(settings.KIT_VERIFICACION_SPOOL).resolve()
+    if spool.is_relative_to(Path(settings.BASE_DIR).resolve()):
+        return [
+            Warning(
+                f"El spool de verificaciones ({spool}) esta en el disco del "
+                "contenedor: se pierde en cada despliegue.",
+                hint=(
+                    "Apunta KIT_VERIFICACION_SPOOL a un volumen persistente o usa "
+                    "KIT_VERIFICACION_MODO=sync."
+                ),
+                id="core.W001",
+            )
+        ]
+    return []
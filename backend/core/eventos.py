@@ -0,0 +1,56 @@
+# pub/sub en proceso para el stream SSE: despierta a los suscriptores de un
+# paciente al instante; los cambios de otros workers los detecta el sondeo
+# compartido de sync.sse
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+_suscriptores = defaultdict(set)  # paciente_id -> {(loop, asyncio.Event)}
+_lock = threading.Lock()
+
+
+def suscribir(paciente_id):
+    evento = asyncio.Event()
+    with _lock:
+        _suscriptores[paciente_id].add((asyncio.get_running_loop(), evento))
+    return evento
+
+
+def desuscribir(paciente_id, evento):
+    with _lock:
+        subs = _suscriptores.get(paciente_id, set())
+        subs.difference_update({s for s in subs if s[1] is evento})
+        if not subs:
+            _suscriptores.pop(paciente_id, None)
+
+
+def suscritos(loop):
+    """Pacientes con alguna conexion abierta en ese bucle de eventos."""
+    with _lock:
+        return {
+            pid
+            for pid, subs in _suscriptores.items()
+            if any(s[0] is loop for s in subs)
+        }
+
+
+def _avisar(paciente_id):
+    with _lock:
+        subs = list(_suscriptores.get(paciente_id, ()))
+    for loop, evento in subs:
+        try:
+            loop.call_soon_threadsafe(evento.set)
+        except RuntimeError:
+            pass  # el loop ya se cerro: se limpia al desuscribir
+
+
+def despertar(paciente_ids):
+    for paciente_id in paciente_ids:
+        _avisar(paciente_id)
+
+
+def publicar(paciente_id):
+    # tras el commit: si avisara antes, el stream leeria la BD sin el cambio
+    transaction.on_commit(lambda: _avisar(paciente_id))
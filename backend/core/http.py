@@ -0,0 +1,45 @@
+# ETag / 304 para endpoints que se consultan mucho (badges, QR, kits publicos)
+import hashlib
+import json
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def etag_de(datos):
+    # bytes tal cual; lo demas se serializa de forma estable
+    if not isinstance(datos, bytes):
+        datos = json.dumps(datos, sort_keys=True, default=str).encode()
+    return quote_etag(hashlib.sha256(datos).hexdigest()[:32])
+
+
+def no_modificado(request, etag):
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return "*" in etags or etag in etags
+
+
+def con_etag(request, datos, cache_control="private, no-cache"):
+    """Response DRF con ETag; 304 sin cuerpo si el cliente ya la tiene."""
+    etag = etag_de(datos)
+    if no_modificado(request, etag):
+        resp = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        resp = Response(datos)
+    resp["ETag"] = etag
+    if cache_control:
+        resp["Cache-Control"] = cache_control
+    return resp
+
+
+def binario_con_etag(request, contenido, content_type, cache_control):
+    """HttpResponse con bytes (imagenes) y ETag fuerte; 304 si no ha cambiado."""
+    etag = etag_de(contenido)
+    if no_modificado(request, etag):
+        resp = HttpResponseNotModified()
+    else:
+        resp = HttpResponse(contenido, content_type=content_type)
+    resp["ETag"] = etag
+    resp["Cache-Control"] = cache_control
+    return resp
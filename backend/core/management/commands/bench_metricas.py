@@ -0,0 +1,41 @@
+# mide la latencia del motor de metricas con 90 dias de sensor cada 5 minutos
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from reportes.metricas import calcular_metricas
+
+
+class Command(BaseCommand):
+    help = "Benchmark de reportes.metricas.calcular_metricas (datos sinteticos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=90)
+        parser.add_argument("--repeticiones", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        n = opts["dias"] * 24 * 12  # una lectura cada 5 min
+        rng = np.random.default_rng(0)
+        minutos = np.arange(n) * 5
+        # ciclo diario + ruido, recortado al dominio valido 20-600
+        valores = np.clip(
+            140 + 50 * np.sin(2 * np.pi * minutos / 1440) + rng.normal(0, 25, n),
+            20,
+            600,
+        ).round()
+
+        tiempos = []
+        for _ in range(opts["repeticiones"]):
+            t0 = time.perf_counter()
+            calcular_metricas(valores)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+
+        tiempos = np.array(tiempos)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{n} lecturas ({opts['dias']} dias): "
+                f"mediana {np.median(tiempos):.2f} ms, "
+                f"p95 {np.percentile(tiempos, 95):.2f} ms, "
+                f"max {tiempos.max():.2f} ms"
+            )
+        )
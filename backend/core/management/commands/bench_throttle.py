@@ -0,0 +1,101 @@
+# mide el coste por peticion de los throttles: historial en cache de DRF frente
+# al contador atomico de core.throttling ("bd" y, con Redis/Memcached, "cache"),
+# para los scopes globales user/anon y el publico del QR
+import time
+
+import numpy as np
+from core.checks import INCR_ATOMICO
+from core.models import ContadorThrottle
+from core.throttling import AnonRateThrottle, UserRateThrottle
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from kits.views import QRAnonRateThrottle
+from rest_framework import throttling
+
+SIN_LIMITE = "1000000/min"  # sin rechazos: medimos solo la contabilidad
+
+
+def _bench(base, scope):
+    # mismo scope que en produccion, pero con un prefijo propio y sin limite
+    return type(
+        f"Bench{base.__name__}",
+        (base,),
+        {
+            "scope": scope,
+            "rate": SIN_LIMITE,
+            "cache_format": "throttle_bench_%(scope)s_%(ident)s",
+        },
+    )
+
+
+class _Usuario:
+    is_authenticated = True
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+class Command(BaseCommand):
+    help = "Benchmark del overhead por peticion de los throttles (DRF vs contador)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--peticiones", type=int, default=2000)
+        parser.add_argument("--clientes", type=int, default=20, help="IPs/usuarios.")
+
+    def medir(self, clase, peticiones):
+        tiempos = []
+        for req in peticiones:
+            t0 = time.perf_counter()
+            clase().allow_request(req, None)
+            tiempos.append((time.perf_counter() - t0) * 1e6)
+        return np.array(tiempos)
+
+    def peticiones(self, n, clientes, autenticadas):
+        factory = RequestFactory()
+        reqs = []
+        for i in range(n):
+            req = factory.get("/", REMOTE_ADDR=f"10.0.0.{i % clientes}")
+            req.user = _Usuario(i % clientes) if autenticadas else AnonymousUser()
+            reqs.append(req)
+        return reqs
+
+    def handle(self, *args, **opts):
+        n, clientes = opts["peticiones"], opts["clientes"]
+        backend = settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1]
+        contadores = ["bd"]
+        if settings.CACHES["default"]["BACKEND"] in INCR_ATOMICO:
+            contadores.append("cache")
+        else:
+            self.stdout.write(f"{backend} sin incr atomico: se omite el contador cache")
+
+        casos = [
+            ("user", throttling.UserRateThrottle, UserRateThrottle, True),
+            ("anon", throttling.AnonRateThrottle, AnonRateThrottle, False),
+            ("qr", None, QRAnonRateThrottle, False),
+        ]
+        try:
+            for scope, drf, nuestro, autenticadas in casos:
+                reqs = self.peticiones(n, clientes, autenticadas)
+                variantes = []
+                if drf is not None:
+                    variantes.append((f"DRF historial ({backend})", drf, None))
+                variantes += [(f"contador {c}", nuestro, c) for c in contadores]
+                for nombre, base, contador in variantes:
+                    ajustes = {"THROTTLE_CONTADOR": contador} if contador else {}
+                    with override_settings(**ajustes):
+                        t = self.medir(_bench(base, scope), reqs)
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"{scope} / {nombre}: {len(t)} peticiones, "
+                            f"mediana {np.median(t):.0f} us, "
+                            f"p95 {np.percentile(t, 95):.0f} us, "
+                            f"max {t.max():.0f} us"
+                        )
+                    )
+        finally:
+            # las claves de cache (historial/contador) caducan solas en 1-2 min
+            ContadorThrottle.objects.filter(
+                clave__startswith="throttle_bench_"
+            ).delete()
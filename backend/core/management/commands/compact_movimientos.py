@@ -0,0 +1,26 @@
+# compacta el historial de movimientos antiguo en checkpoints de saldo
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from insumos.saldos import compactar
+
+
+class Command(BaseCommand):
+    help = "Resume los movimientos de insumos anteriores a N dias en checkpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=180)
+        parser.add_argument("--paciente", type=int, help="Solo este paciente (id).")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        antes_de = timezone.now() - timedelta(days=opts["dias"])
+        creados, borrados = compactar(
+            antes_de, paciente_id=opts.get("paciente"), batch_size=opts["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compactacion OK. Checkpoints: {creados}. Movimientos: {borrados}"
+            )
+        )
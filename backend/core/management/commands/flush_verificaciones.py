@@ -0,0 +1,11 @@
+# vuelca a la BD los spools de verificaciones QR que dejaron procesos muertos
+from django.core.management.base import BaseCommand
+from kits import auditoria
+
+
+class Command(BaseCommand):
+    help = "Reproduce los spools huerfanos de verificaciones QR (write-behind)."
+
+    def handle(self, *args, **opts):
+        n = auditoria.reproducir_huerfanos()
+        self.stdout.write(self.style.SUCCESS(f"Verificaciones volcadas: {n}"))
@@ -0,0 +1,19 @@
+# reconstruye el resumen diario de glucosa desde las lecturas (idempotente)
+from django.core.management.base import BaseCommand
+from glucosa.resumen import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de resumen diario de glucosa desde cero."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--paciente", type=int, help="Solo este paciente (id).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        total = reconstruir(
+            paciente_id=opts.get("paciente"), batch_size=opts["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Resumen diario reconstruido. Dias: {total}")
+        )
@@ -0,0 +1,25 @@
+# verifica stock_actual contra el libro (ultimo checkpoint + movimientos)
+from django.core.management.base import BaseCommand, CommandError
+from insumos.saldos import reconciliar
+
+
+class Command(BaseCommand):
+    help = "Comprueba que el stock de cada insumo cuadra con su libro de movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--paciente", type=int, help="Solo este paciente (id).")
+        parser.add_argument(
+            "--corregir", action="store_true", help="Deja el stock del libro."
+        )
+
+    def handle(self, *args, **opts):
+        descuadres = reconciliar(
+            paciente_id=opts.get("paciente"), corregir=opts["corregir"]
+        )
+        for pk, stock, saldo in descuadres:
+            self.stdout.write(f"insumo {pk}: stock_actual={stock} libro={saldo}")
+        if descuadres and not opts["corregir"]:
+            raise CommandError(f"Insumos descuadrados: {len(descuadres)}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciliacion OK. Corregidos: {len(descuadres)}")
+        )
@@ -0,0 +1,97 @@
+# alertas de caducidad (una activa por insumo) y baja opcional del stock caducado
+from datetime import timedelta
+
+from alertas.models import Alerta
+from alertas.services import upsert_alertas
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from insumos.models import Insumo
+from insumos.services import mensaje_caducidad, retirar_caducados
+
+
+class Command(BaseCommand):
+    help = "Busca insumos que caducan en los proximos N dias y crea alertas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=30)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--retirar",
+            action="store_true",
+            help="Registra movimientos de caducidad que dejan a 0 lo ya caducado.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Solo cuenta, no escribe nada."
+        )
+
+    def handle(self, *args, **opts):
+        hoy = timezone.localdate()
+        limite = hoy + timedelta(days=opts["dias"])
+        # una sola consulta (indice parcial sobre caduca_en) para todos los pacientes
+        proximos = Insumo.objects.filter(caduca_en__lte=limite, stock_actual__gt=0)
+
+        if opts["dry_run"]:
+            caducados = proximos.filter(caduca_en__lt=hoy).count()
+            self.stdout.write(
+                f"[dry-run] Caducan antes del {limite}: {proximos.count()}. "
+                f"Ya caducados con stock: {caducados}"
+            )
+            return
+
+        retirados = retirar_caducados(hoy, opts["batch_size"]) if opts["retirar"] else 0
+
+        # alertas por lotes (keyset); solo se escribe lo que cambia, para no
+        # mover actualizado_en (delta-sync) en cada pasada
+        filas_qs = proximos.order_by("pk").values_list(
+            "pk", "paciente_id", "nombre", "caduca_en"
+        )
+        alertas, ultimo = 0, 0
+        while True:
+            filas = list(filas_qs.filter(pk__gt=ultimo)[: opts["batch_size"]])
+            if not filas:
+                break
+            cambios = self._cambios(filas, hoy)
+            upsert_alertas(cambios)
+            alertas += len(cambios)
+            ultimo = filas[-1][0]
+
+        # las que ya no aplican (lote repuesto, fecha cambiada, sin stock) se cierran
+        cerradas = (
+            Alerta.objects.filter(tipo="caducidad", activa=True)
+            .exclude(Exists(proximos.filter(pk=OuterRef("insumo_id"))))
+            .update(
+                activa=False, atendida_en=timezone.now(), actualizado_en=timezone.now()
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Scan caducidad OK. Alertas escritas: {alertas}. "
+                f"Cerradas: {cerradas}. Retirados: {retirados}"
+            )
+        )
+
+    @staticmethod
+    def _cambios(filas, hoy):
+        """
+        Filas a upsertar: sin alerta activa o con otro mensaje. Si el paciente
+        ya atendio la alerta de esa misma fecha de caducidad no se reabre.
+        """
+        activas, atendidas = {}, set()
+        for insumo_id, activa, caduca_en, mensaje in Alerta.objects.filter(
+            tipo="caducidad", insumo_id__in=[f[0] for f in filas]
+        ).values_list("insumo_id", "activa", "caduca_en", "mensaje"):
+            if activa:
+                activas[insumo_id] = (caduca_en, mensaje)
+            else:
+                atendidas.add((insumo_id, caduca_en))
+        cambios = []
+        for pk, paciente_id, nombre, caduca in filas:
+            mensaje = mensaje_caducidad(nombre, caduca, hoy)
+            if pk in activas:
+                if activas[pk] == (caduca, mensaje):
+                    continue
+            elif (pk, caduca) in atendidas:
+                continue
+            cambios.append((paciente_id, pk, "caducidad", mensaje, caduca))
+        return cambios
@@ -1,30 +1,63 @@
-# para que si una señal falló re-crea alertas stock_bajo coherentes
+# re-crea las alertas stock_bajo que falten, por conjuntos y en lotes
 from alertas.models import Alerta
+from alertas.services import upsert_alertas
 from django.core.management.base import BaseCommand
+from django.db.models import Exists, F, OuterRef
 from insumos.models import Insumo
+from insumos.services import mensaje_stock_bajo
 
 
 class Command(BaseCommand):
     help = "Escanea inventario y asegura alertas de stock_bajo activas (idempotente)."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Solo cuenta, no crea alertas."
+        )
+
     def handle(self, *args, **opts):
-        creadas = 0
-        for ins in Insumo.objects.select_related("paciente").all():
-            if ins.stock_actual < ins.stock_minimo:
-                if not Alerta.objects.filter(
-                    paciente=ins.paciente,
-                    tipo="stock_bajo",
-                    activa=True,
-                    mensaje__icontains=ins.nombre,
-                ).exists():
-                    Alerta.objects.create(
-                        paciente=ins.paciente,
-                        tipo="stock_bajo",
-                        mensake=f"Stock bajo de {ins.nombre}",
-                        detalle=f"{ins.stock_actual} < mínimo {ins.stock_minimo}",
-                        activa=True,
+        # bajo minimo y sin alerta activa (anti-join por la FK insumo)
+        faltan = (
+            Insumo.objects.filter(stock_actual__lt=F("stock_minimo"))
+            .filter(
+                ~Exists(
+                    Alerta.objects.filter(
+                        insumo=OuterRef("pk"), tipo="stock_bajo", activa=True
                     )
-                    creadas += 1
+                )
+            )
+            .order_by("pk")
+            .values_list(
+                "pk", "paciente_id", "nombre", "stock_actual", "stock_minimo", "unidad"
+            )
+        )
+        if opts["dry_run"]:
+            bajos = Insumo.objects.filter(stock_actual__lt=F("stock_minimo")).count()
+            self.stdout.write(
+                f"[dry-run] Insumos bajo minimo: {bajos}. "
+                f"Alertas que se crearian: {faltan.count()}"
+            )
+            return
+
+        # por lotes en orden de pk (keyset): memoria acotada y un INSERT por lote
+        creadas, ultimo, tam = 0, 0, opts["batch_size"]
+        while True:
+            filas = list(faltan.filter(pk__gt=ultimo)[:tam])
+            if not filas:
+                break
+            # upsert: si otra peticion la creo entre medias solo refresca el mensaje
+            upsert_alertas(
+                (
+                    paciente_id,
+                    pk,
+                    "stock_bajo",
+                    mensaje_stock_bajo(nombre, stock, minimo, unidad),
+                )
+                for pk, paciente_id, nombre, stock, minimo, unidad in filas
+            )
+            creadas += len(filas)
+            ultimo = filas[-1][0]
         self.stdout.write(
             self.style.SUCCESS(f"Scan inventario OK. Alertas creadas: {creadas}")
         )
@@ -1,13 +1,14 @@
 import random
 from datetime import timedelta
 
-from alertas.models import Alerta
+from alertas.services import upsert_alertas
 from comidas.models import Comida, DosisInsulina
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from glucosa.models import GlucosaRegistro
 from insumos.models import Insumo, MovimientoInsumo
+from insumos.services import mensaje_stock_bajo, registrar_movimiento
 from kits.models import ElementoKit, Kit, VerificacionKit
 from pacientes.models import Paciente
 
@@ -42,8 +43,8 @@ class Command(BaseCommand):
             defaults={"stock_actual": 2, "stock_minimo": 5, "unidad": "u"},
         )
         if not MovimientoInsumo.objects.filter(insumo=tiras).exists():
-            MovimientoInsumo.objects.create(insumo=tiras, cantidad=+5, motivo="compra")
-            MovimientoInsumo.objects.create(insumo=tiras, cantidad=-4, motivo="uso")
+            registrar_movimiento(tiras.pk, +5, motivo="compra")
+            registrar_movimiento(tiras.pk, -4, motivo="uso")
 
         # Comidas & dosis
         hoy = timezone.now()
@@ -84,19 +85,23 @@ class Command(BaseCommand):
                 faltantes_json={"Tiras": 2},
             )
 
-        # Alerta stock_bajo si aplica
-        if (
-            tiras.stock_actual < tiras.stock_minimo
-            and not Alerta.objects.filter(
-                paciente=paciente, tipo="stock_bajo", activa=True
-            ).exists()
-        ):
-            Alerta.objects.create(
-                paciente=paciente,
-                tipo="stock_bajo",
-                titulo="Stock bajo de Tiras",
-                detalle="Por debajo del mínimo",
-                activa=True,
+        # Alerta stock_bajo si aplica (upsert: nunca duplica)
+        tiras.refresh_from_db()
+        if tiras.stock_actual < tiras.stock_minimo:
+            upsert_alertas(
+                [
+                    (
+                        paciente.pk,
+                        tiras.pk,
+                        "stock_bajo",
+                        mensaje_stock_bajo(
+                            tiras.nombre,
+                            tiras.stock_actual,
+                            tiras.stock_minimo,
+                            tiras.unidad,
+                        ),
+                    )
+                ]
             )
 
         self.stdout.write(self.style.SUCCESS("Seed demo ejecutado (idempotente)."))
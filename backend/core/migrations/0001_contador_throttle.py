@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ContadorThrottle",
+            fields=[
+                (
+                    "clave",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("ventana", models.BigIntegerField()),
+                ("actual", models.PositiveIntegerField(default=0)),
+                ("anterior", models.PositiveIntegerField(default=0)),
+                ("expira", models.BigIntegerField(db_index=True)),
+            ],
+        ),
+    ]
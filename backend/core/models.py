@@ -0,0 +1,13 @@
+from django.db import models
+
+
+# contador de ventana deslizante compartido por todos los workers (ver throttling)
+class ContadorThrottle(models.Model):
+    clave = models.CharField(max_length=255, primary_key=True)
+    ventana = models.BigIntegerField()  # numero de ventana: epoch // duracion
+    actual = models.PositiveIntegerField(default=0)
+    anterior = models.PositiveIntegerField(default=0)
+    expira = models.BigIntegerField(db_index=True)  # epoch: fila purgable
+
+    def __str__(self):
+        return f"{self.clave} ({self.actual}+{self.anterior})"
@@ -0,0 +1,33 @@
+# runner de tests: cache y spool en un directorio temporal. Los tests hacen
+# cache.clear() y vuelcan verificaciones; con los ajustes normales eso borraria
+# la cache real (var/cache o el Redis de REDIS_URL) y escribiria en var/spool
+import tempfile
+from pathlib import Path
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        self._tmp = tempfile.TemporaryDirectory(prefix="diaflow-tests-")
+        tmp = Path(self._tmp.name)
+        self._ajustes = override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": str(tmp / "cache"),
+                    "OPTIONS": {"MAX_ENTRIES": 20000},
+                }
+            },
+            # la cache de ficheros no tiene incr atomico (check core.E002)
+            THROTTLE_CONTADOR="bd",
+            KIT_VERIFICACION_SPOOL=str(tmp / "spool"),
+        )
+        self._ajustes.enable()
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        self._ajustes.disable()
+        self._tmp.cleanup()
@@ -0,0 +1,187 @@
+# throttles de DRF con contador compartido y atomico entre workers (los de DRF
+# reescriben un historial de timestamps con get+set: entre workers se pierden
+# cuentas). Ventana deslizante aproximada: peticiones de la ventana actual + las
+# de la anterior ponderadas por lo que aun solapa. Como en DRF, solo cuentan las
+# admitidas, y la rechazada no escribe nada. Dos contadores (THROTTLE_CONTADOR):
+# - "cache": add + incr sobre Redis/Memcached (INCR atomico, sin tocar la BD)
+# - "bd": una sentencia INSERT ... ON CONFLICT DO UPDATE ... WHERE <cabe>
+#   RETURNING; si no cabe no actualiza la fila
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from rest_framework import throttling
+
+from .models import ContadorThrottle
+
+PURGA_PROBABILIDAD = 0.001  # de vez en cuando borro contadores caducados
+
+
+def _clave(key):
+    # X-Forwarded-For largo o IPv6: la clave no debe pasar del max_length
+    if len(key) <= 255:
+        return key
+    return "sha1:" + hashlib.sha1(key.encode()).hexdigest()
+
+
+# -------- contador en BD --------
+# valores que tendria la fila en `ventana` contando esta peticion
+_ACTUAL = "CASE WHEN t.ventana = excluded.ventana THEN t.actual + 1 ELSE 1 END"
+_ANTERIOR = (
+    "CASE WHEN t.ventana = excluded.ventana THEN t.anterior "
+    "WHEN t.ventana = excluded.ventana - 1 THEN t.actual ELSE 0 END"
+)
+
+
+def _sumar_on_conflict(clave, ventana, expira, peso, limite):
+    tabla = connection.ops.quote_name(ContadorThrottle._meta.db_table)
+    # en el SET/WHERE las columnas de la tabla son los valores previos
+    sql = (
+        f"INSERT INTO {tabla} AS t (clave, ventana, actual, anterior, expira) "
+        "VALUES (%s, %s, 1, 0, %s) "
+        f"ON CONFLICT (clave) DO UPDATE SET anterior = {_ANTERIOR}, "
+        f"actual = {_ACTUAL}, ventana = excluded.ventana, expira = excluded.expira "
+        f"WHERE {_ACTUAL} + ({_ANTERIOR}) * %s <= %s "
+        "RETURNING actual"
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, [clave, ventana, expira, peso, limite])
+        return cur.fetchone() is not None
+
+
+def _sumar_por_filas(clave, ventana, expira, peso, limite):
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                c = (
+                    ContadorThrottle.objects.select_for_update()
+                    .filter(pk=clave)
+                    .first()
+                )
+                if c is None:
+                    ContadorThrottle.objects.create(
+                        clave=clave, ventana=ventana, actual=1, expira=expira
+                    )
+                    return True
+                actual, anterior = _desplazar(c.ventana, c.actual, c.anterior, ventana)
+                if actual + 1 + anterior * peso > limite:
+                    return False
+                c.actual, c.anterior = actual + 1, anterior
+                c.ventana, c.expira = ventana, expira
+                c.save()
+                return True
+        except IntegrityError:
+            continue  # otro worker creo la fila entre medias: la actualizo
+    raise RuntimeError(f"no se pudo incrementar el contador {clave}")
+
+
+def _desplazar(ventana_fila, actual, anterior, ventana):
+    # (actual, anterior) de la fila vistos desde `ventana`
+    if ventana_fila == ventana:
+        return actual, anterior
+    return 0, actual if ventana_fila == ventana - 1 else 0
+
+
+def sumar_bd(clave, ventana, expira, peso, limite):
+    """Suma la peticion si cabe en el limite. Devuelve si se admitio."""
+    if connection.features.can_return_columns_from_insert and (
+        connection.features.supports_update_conflicts_with_target
+    ):
+        return _sumar_on_conflict(clave, ventana, expira, peso, limite)
+    return _sumar_por_filas(clave, ventana, expira, peso, limite)
+
+
+def leer_bd(clave, ventana):
+    fila = (
+        ContadorThrottle.objects.filter(pk=clave)
+        .values_list("ventana", "actual", "anterior")
+        .first()
+    )
+    return _desplazar(*fila, ventana) if fila else (0, 0)
+
+
+def purgar(ahora):
+    return ContadorThrottle.objects.filter(expira__lt=int(ahora)).delete()[0]
+
+
+# -------- contador en cache (Redis/Memcached) --------
+# una clave por ventana; caduca sola cuando deja de ser la "anterior"
+def _claves_cache(clave, ventana):
+    return f"{clave}:{ventana}", f"{clave}:{ventana - 1}"
+
+
+def leer_cache(clave, ventana):
+    k_actual, k_anterior = _claves_cache(clave, ventana)
+    valores = cache.get_many([k_actual, k_anterior])
+    return valores.get(k_actual, 0), valores.get(k_anterior, 0)
+
+
+def sumar_cache(clave, ventana, duracion, peso, limite):
+    actual, anterior = leer_cache(clave, ventana)
+    if actual + 1 + anterior * peso > limite:
+        return False  # rechazo sin escribir
+    k_actual, _ = _claves_cache(clave, ventana)
+    cache.add(k_actual, 0, timeout=2 * duracion)
+    actual = cache.incr(k_actual)
+    if actual + anterior * peso > limite:
+        # otra peticion entro a la vez y el INCR paso del limite (solo en carrera)
+        cache.decr(k_actual)
+        return False
+    return True
+
+
+class VentanaDeslizanteMixin:
+    """Sustituye el historial en cache de SimpleRateThrottle por un contador
+    atomico (THROTTLE_CONTADOR: "cache" o "bd")."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        ventana, resto = divmod(self.now, self.duration)
+        self.ventana = int(ventana)
+        self.fraccion = resto / self.duration
+        peso = 1 - self.fraccion
+        clave = _clave(self.key)
+        if settings.THROTTLE_CONTADOR == "cache":
+            admitida = sumar_cache(
+                clave, self.ventana, self.duration, peso, self.num_requests
+            )
+        else:
+            # la fila sirve hasta que deja de ser la ventana "anterior"
+            expira = (self.ventana + 2) * self.duration
+            admitida = sumar_bd(clave, self.ventana, expira, peso, self.num_requests)
+            if random.random() < PURGA_PROBABILIDAD:
+                purgar(self.now)
+        return self.throttle_success() if admitida else self.throttle_failure()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        # solo tras un rechazo (Retry-After): leo el contador sin escribir
+        clave = _clave(self.key)
+        if settings.THROTTLE_CONTADOR == "cache":
+            actual, anterior = leer_cache(clave, self.ventana)
+        else:
+            actual, anterior = leer_bd(clave, self.ventana)
+        # segundos hasta que el estimado (con la siguiente peticion) cabe
+        libre = self.num_requests - actual - 1
+        if libre < 0 or not anterior:
+            return self.duration * (1 - self.fraccion)
+        fraccion_ok = 1 - libre / anterior
+        return max(0.0, (fraccion_ok - self.fraccion) * self.duration)
+
+
+class UserRateThrottle(VentanaDeslizanteMixin, throttling.UserRateThrottle):
+    pass
+
+
+class AnonRateThrottle(VentanaDeslizanteMixin, throttling.AnonRateThrottle):
+    pass
@@ -32,11 +32,12 @@ INSTALLED_APPS = [
     # Proyecto
     "pacientes.apps.PacientesConfig",
     "glucosa",
-    "insumos.apps.InsumosConfig",  # para cargar las señales en ready()
+    "insumos",
     "alertas",
     "comidas",
     "kits",
     "reportes",
+    "sync.apps.SyncConfig",  # lapidas via señales
     "corsheaders",
 ]
 
@@ -71,6 +72,61 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "diaflow.wsgi.application"
+ASGI_APPLICATION = "diaflow.asgi.application"  # SSE (/api/sync/eventos)
+# tests con cache y spool temporales (no tocan var/ ni el Redis real)
+TEST_RUNNER = "core.runner.TestRunner"
+
+# SSE: vida maxima de cada conexion, sondeo de la BD (uno por worker para todas
+# sus conexiones) y keep-alive (segundos)
+SSE_MAX_DURACION = int(os.getenv("SSE_MAX_DURACION", "300"))
+SSE_POLL_SEGUNDOS = float(os.getenv("SSE_POLL_SEGUNDOS", "0.5"))
+SSE_PING_SEGUNDOS = int(os.getenv("SSE_PING_SEGUNDOS", "15"))
+# validez del ?ticket= del stream (basta para abrir la conexion; luego se renueva)
+SSE_TICKET_SEGUNDOS = int(os.getenv("SSE_TICKET_SEGUNDOS", "60"))
+
+# delta-sync: el cursor no pasa de ahora - margen (commits tardios de auto_now)
+SYNC_MARGEN_SEGUNDOS = int(os.getenv("SYNC_MARGEN_SEGUNDOS", "30"))
+
+# verificaciones QR publicas: "buffer" (write-behind con spool local) o "sync"
+KIT_VERIFICACION_MODO = os.getenv("KIT_VERIFICACION_MODO", "buffer")
+KIT_VERIFICACION_LOTE = int(os.getenv("KIT_VERIFICACION_LOTE", "100"))
+KIT_VERIFICACION_FLUSH_SEGUNDOS = float(
+    os.getenv("KIT_VERIFICACION_FLUSH_SEGUNDOS", "2")
+)
+# fsync del spool agrupado: como mucho uno cada N segundos (0 = uno por fila)
+KIT_VERIFICACION_FSYNC_SEGUNDOS = float(
+    os.getenv("KIT_VERIFICACION_FSYNC_SEGUNDOS", "0.5")
+)
+# el spool tiene que sobrevivir al contenedor: en produccion, un volumen
+# persistente (el defecto dentro del codigo solo vale en local; check --deploy)
+KIT_VERIFICACION_SPOOL = os.getenv(
+    "KIT_VERIFICACION_SPOOL", str(BASE_DIR / "var" / "spool")
+)
+
+# cache compartida por todos los workers y comandos (core.checks la exige): las
+# versiones de core.cache y las invalidaciones deben verse en todos los procesos.
+# Un solo host: FileBasedCache; varias instancias: REDIS_URL
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_DIR", str(BASE_DIR / "var" / "cache")),
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        }
+    }
+
+# contador de los throttles (core.throttling): INCR de Redis si lo hay (sin
+# tocar la BD); si no, una sentencia en la BD por peticion admitida
+THROTTLE_CONTADOR = os.getenv(
+    "THROTTLE_CONTADOR", "cache" if os.getenv("REDIS_URL") else "bd"
+)
 
 DATABASES = {
     "default": dj_database_url.config(
@@ -123,8 +179,10 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_THROTTLE_CLASSES": (
-        "rest_framework.throttling.UserRateThrottle",
-        "rest_framework.throttling.AnonRateThrottle",
+        # contador atomico compartido (THROTTLE_CONTADOR): limite comun a todos
+        # los workers, sin el historial get+set de DRF
+        "core.throttling.UserRateThrottle",
+        "core.throttling.AnonRateThrottle",
     ),
     "DEFAULT_THROTTLE_RATES": {
         "user": "120/min",
@@ -149,6 +207,7 @@ SPECTACULAR_SETTINGS = {
         {"name": "Kits", "description": "Kits privados del usuario"},
         {"name": "QR Público", "description": "Verificación sin login por QR"},
         {"name": "Reportes", "description": "KPIs y resúmenes"},
+        {"name": "Sync", "description": "Sincronización incremental (móvil)"},
     ],
 }
 
@@ -40,6 +40,8 @@ urlpatterns = [
     path("api/", include(router.urls)),
     # los reportes
     path("api/reportes/", include("reportes.urls")),
+    # sincronizacion incremental para el movil
+    path("api/sync/", include("sync.urls")),
     # Schema y los Docs
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="docs"),
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import GlucosaRegistro
+from .models import GlucosaDiaria, GlucosaRegistro
 
 
 @admin.register(GlucosaRegistro)
@@ -8,3 +8,9 @@ class GlucosaRegistroAdmin(admin.ModelAdmin):
     list_display = ("id", "paciente", "valor_mg_dl", "medido_en", "fuente")
     list_filter = ("fuente",)
     search_fields = ("paciente__nombre",)
+
+
+@admin.register(GlucosaDiaria)
+class GlucosaDiariaAdmin(admin.ModelAdmin):
+    list_display = ("id", "paciente", "fecha", "n", "minimo", "maximo", "en_rango")
+    list_filter = ("fecha",)
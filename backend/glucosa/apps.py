@@ -1,6 +1,12 @@
+import importlib
+
 from django.apps import AppConfig
 
 
 class GlucosaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "glucosa"
+
+    def ready(self):
+        # señales que mantienen el resumen diario
+        importlib.import_module("glucosa.signals")
@@ -0,0 +1,64 @@
+import math
+import zlib
+
+import numpy as np
+
+# dominio valido de las lecturas (ver GlucosaRegistroSerializer)
+VALOR_MIN = 20
+VALOR_MAX = 600
+BINS = VALOR_MAX - VALOR_MIN + 1  # un bin por mg/dL
+
+
+def vacio():
+    return np.zeros(BINS, dtype=np.int64)
+
+
+def desde_valores(valores, cuentas=None):
+    """Histograma de valores (opcionalmente con cuantas veces aparece cada uno)."""
+    idx = np.clip(np.asarray(valores, dtype=np.int64), VALOR_MIN, VALOR_MAX) - VALOR_MIN
+    return np.bincount(idx, weights=cuentas, minlength=BINS).astype(np.int64)
+
+
+# se guarda como uint16 denso comprimido: un dia de sensor ocupa pocos cientos de bytes
+def codificar(hist):
+    return zlib.compress(np.asarray(hist, dtype=np.uint16).tobytes(), 1)
+
+
+def decodificar(blob):
+    if not blob:
+        return vacio()
+    return np.frombuffer(zlib.decompress(bytes(blob)), dtype=np.uint16).astype(np.int64)
+
+
+def sumar(blobs):
+    total = vacio()
+    for b in blobs:
+        total += decodificar(b)
+    return total
+
+
+def prefijos(hist):
+    """Sumas acumuladas: prefijos[i] = lecturas con valor <= VALOR_MIN + i."""
+    return np.cumsum(hist)
+
+
+def contar_rango(pref, minimo, maximo):
+    """Lecturas con minimo <= valor <= maximo, en O(1) sobre los prefijos."""
+    lo = max(math.ceil(minimo), VALOR_MIN) - VALOR_MIN
+    hi = min(math.floor(maximo), VALOR_MAX) - VALOR_MIN
+    if hi < lo or hi < 0 or lo >= BINS:
+        return 0
+    return int(pref[hi] - (pref[lo - 1] if lo > 0 else 0))
+
+
+def percentil(pref, q):
+    """Percentil q (0-100) con interpolacion lineal, igual que np.percentile."""
+    n = int(pref[-1]) if len(pref) else 0
+    if n == 0:
+        return None
+    pos = (n - 1) * q / 100.0
+    abajo, arriba = math.floor(pos), math.ceil(pos)
+    # valor en el rango r (0-based) = primer bin cuyo acumulado supera r
+    v_abajo = int(np.searchsorted(pref, abajo, side="right")) + VALOR_MIN
+    v_arriba = int(np.searchsorted(pref, arriba, side="right")) + VALOR_MIN
+    return v_abajo + (v_arriba - v_abajo) * (pos - abajo)
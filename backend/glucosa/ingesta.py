@@ -0,0 +1,129 @@
+import numpy as np
+from core.cache import invalidar
+from core.eventos import publicar
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import GlucosaRegistro
+from .resumen import dia_local, recalcular_dias
+
+VALOR_MIN = 20
+VALOR_MAX = 600
+MAX_LECTURAS = 10000  # por peticion
+CHUNK_SIZE = 1000  # filas por INSERT
+
+
+def _parse_medido_en(v):
+    dt = parse_datetime(v) if isinstance(v, str) else None
+    if dt is not None and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def _existentes(paciente, fechas):
+    return set(
+        GlucosaRegistro.objects.filter(
+            paciente=paciente,
+            medido_en__gte=min(fechas),
+            medido_en__lte=max(fechas),
+        ).values_list("medido_en", "fuente")
+    )
+
+
+def _insertar(nuevos):
+    # un INSERT por chunk; si otra ingesta gano la carrera el chunk entero falla
+    # y lo repito fila a fila para saber cuales entraron de verdad
+    insertados = []
+    for i in range(0, len(nuevos), CHUNK_SIZE):
+        chunk = nuevos[i : i + CHUNK_SIZE]
+        try:
+            with transaction.atomic():
+                GlucosaRegistro.objects.bulk_create(chunk)
+            insertados += chunk
+        except IntegrityError:
+            for g in chunk:
+                try:
+                    with transaction.atomic():
+                        GlucosaRegistro.objects.bulk_create([g])
+                    insertados.append(g)
+                except IntegrityError:
+                    pass  # duplicada en carrera
+    return insertados
+
+
+# ingesta masiva de lecturas (CGM): valida en bloque, deduplica e inserta por lotes
+def ingerir_lecturas(paciente, filas, fuente_defecto="sensor"):
+    n = len(filas)
+    valores = np.zeros(n, dtype=np.int64)
+    medidos = [None] * n
+    fuentes = [fuente_defecto] * n
+    errores = {}
+
+    # 1) parseo fila a fila (fechas); el rango se valida despues de una vez
+    for i, fila in enumerate(filas):
+        if not isinstance(fila, dict):
+            errores[i] = "Fila inválida."
+            continue
+        try:
+            valores[i] = int(fila.get("valor_mg_dl"))
+        except (TypeError, ValueError, OverflowError):
+            errores[i] = "valor_mg_dl inválido."
+            continue
+        medidos[i] = _parse_medido_en(fila.get("medido_en"))
+        if medidos[i] is None:
+            errores[i] = "medido_en inválido."
+            continue
+        fuente = fila.get("fuente") or fuente_defecto
+        if not isinstance(fuente, str) or len(fuente) > 20:
+            errores[i] = "fuente inválida."
+            continue
+        fuentes[i] = fuente
+
+    # 2) validacion vectorizada del rango 20-600
+    validas = np.ones(n, dtype=bool)
+    validas[list(errores)] = False
+    fuera = validas & ((valores < VALOR_MIN) | (valores > VALOR_MAX))
+    for i in np.flatnonzero(fuera).tolist():
+        errores[i] = f"Valor fuera de rango ({VALOR_MIN}-{VALOR_MAX} mg/dL)."
+    validas &= ~fuera
+    indices = np.flatnonzero(validas).tolist()
+
+    # 3) duplicados: contra la BD (una consulta por indice) y dentro del lote
+    existentes = set()
+    if indices:
+        existentes = _existentes(paciente, [medidos[i] for i in indices])
+    nuevos = []
+    duplicadas = 0
+    for i in indices:
+        clave = (medidos[i], fuentes[i])
+        if clave in existentes:
+            duplicadas += 1
+            continue
+        existentes.add(clave)
+        nuevos.append(
+            GlucosaRegistro(
+                paciente=paciente,
+                valor_mg_dl=int(valores[i]),
+                medido_en=medidos[i],
+                fuente=fuentes[i],
+            )
+        )
+
+    # 4) insercion por lotes; lo que perdio una carrera cuenta como duplicada
+    insertados = _insertar(nuevos)
+    duplicadas += len(nuevos) - len(insertados)
+    nuevos = insertados
+    # bulk_create no lanza señales: recalculo el resumen de los dias tocados
+    recalcular_dias(paciente.pk, {dia_local(g.medido_en) for g in nuevos})
+    if nuevos:
+        invalidar("glucosa", paciente.pk)
+        publicar(paciente.pk)
+
+    return {
+        "recibidas": n,
+        "aceptadas": len(nuevos),
+        "duplicadas": duplicadas,
+        "rechazadas": len(errores),
+        "errores": [{"indice": i, "error": errores[i]} for i in sorted(errores)],
+    }
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("glucosa", "0001_initial"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="glucosaregistro",
+            index=models.Index(
+                fields=["paciente", "-medido_en", "-id"], name="glucosa_pac_medido_idx"
+            ),
+        ),
+    ]
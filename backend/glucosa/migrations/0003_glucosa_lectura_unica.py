@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# antes de crear la restriccion borro las lecturas repetidas (me quedo con la 1ª)
+def borrar_duplicados(apps, schema_editor):
+    GlucosaRegistro = apps.get_model("glucosa", "GlucosaRegistro")
+    repetidos = (
+        GlucosaRegistro.objects.values("paciente", "medido_en", "fuente")
+        .annotate(n=Count("id"), primero=Min("id"))
+        .filter(n__gt=1)
+    )
+    for r in repetidos:
+        GlucosaRegistro.objects.filter(
+            paciente=r["paciente"], medido_en=r["medido_en"], fuente=r["fuente"]
+        ).exclude(id=r["primero"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("glucosa", "0002_glucosa_indices"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="glucosaregistro",
+            constraint=models.UniqueConstraint(
+                fields=("paciente", "medido_en", "fuente"), name="glucosa_lectura_unica"
+            ),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+
+# relleno el resumen con las lecturas que ya existen
+def rellenar_resumen(apps, schema_editor):
+    GlucosaRegistro = apps.get_model("glucosa", "GlucosaRegistro")
+    GlucosaDiaria = apps.get_model("glucosa", "GlucosaDiaria")
+    grupos = (
+        GlucosaRegistro.objects.annotate(
+            dia=TruncDate("medido_en", tzinfo=timezone.get_current_timezone())
+        )
+        .values("paciente_id", "dia")
+        .annotate(
+            n=Count("id"),
+            suma=Sum("valor_mg_dl"),
+            suma_cuadrados=Sum(
+                Cast("valor_mg_dl", BigIntegerField()) * F("valor_mg_dl")
+            ),
+            minimo=Min("valor_mg_dl"),
+            maximo=Max("valor_mg_dl"),
+            bajos=Count("id", filter=Q(valor_mg_dl__lt=70)),
+            en_rango=Count("id", filter=Q(valor_mg_dl__gte=70, valor_mg_dl__lte=180)),
+            altos=Count("id", filter=Q(valor_mg_dl__gt=180)),
+        )
+        .order_by()
+    )
+    GlucosaDiaria.objects.bulk_create(
+        [
+            GlucosaDiaria(paciente_id=g.pop("paciente_id"), fecha=g.pop("dia"), **g)
+            for g in grupos
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("glucosa", "0003_glucosa_lectura_unica"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GlucosaDiaria",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField()),
+                ("n", models.PositiveIntegerField(default=0)),
+                ("suma", models.BigIntegerField(default=0)),
+                ("suma_cuadrados", models.BigIntegerField(default=0)),
+                ("minimo", models.PositiveSmallIntegerField(null=True)),
+                ("maximo", models.PositiveSmallIntegerField(null=True)),
+                ("bajos", models.PositiveIntegerField(default=0)),
+                ("en_rango", models.PositiveIntegerField(default=0)),
+                ("altos", models.PositiveIntegerField(default=0)),
+                (
+                    "paciente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="glucosa_diaria",
+                        to="pacientes.paciente",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["fecha"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("paciente", "fecha"), name="glucosa_diaria_unica"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(rellenar_resumen, migrations.RunPython.noop),
+    ]
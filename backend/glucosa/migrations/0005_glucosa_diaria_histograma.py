@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:35
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from glucosa import histograma
+
+
+# relleno el histograma de los dias ya resumidos
+def rellenar_histogramas(apps, schema_editor):
+    GlucosaRegistro = apps.get_model("glucosa", "GlucosaRegistro")
+    GlucosaDiaria = apps.get_model("glucosa", "GlucosaDiaria")
+    grupos = (
+        GlucosaRegistro.objects.annotate(
+            dia=TruncDate("medido_en", tzinfo=timezone.get_current_timezone())
+        )
+        .values("paciente_id", "dia", "valor_mg_dl")
+        .annotate(c=Count("id"))
+        .order_by("paciente_id", "dia")
+    )
+    dias = {(d.paciente_id, d.fecha): d for d in GlucosaDiaria.objects.all()}
+    for clave, grupo in groupby(grupos, key=lambda g: (g["paciente_id"], g["dia"])):
+        grupo = list(grupo)
+        if clave in dias:
+            dias[clave].histograma = histograma.codificar(
+                histograma.desde_valores(
+                    [g["valor_mg_dl"] for g in grupo], [g["c"] for g in grupo]
+                )
+            )
+    GlucosaDiaria.objects.bulk_update(dias.values(), ["histograma"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("glucosa", "0004_glucosa_diaria"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="glucosadiaria",
+            name="histograma",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(rellenar_histogramas, migrations.RunPython.noop),
+    ]
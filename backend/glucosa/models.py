@@ -13,6 +13,54 @@ class GlucosaRegistro(models.Model):
     )  # manual(sangre), sensor, etc
     notas = models.CharField(max_length=255, blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)  # delta-sync
 
     class Meta:
         ordering = ["-medido_en"]  # ordenado
+        # cubre el filtro por paciente + rango desde/hasta y el orden del listado
+        # (y el keyset de la paginacion por cursor)
+        indexes = [
+            models.Index(
+                fields=["paciente", "-medido_en", "-id"],
+                name="glucosa_pac_medido_idx",
+            ),
+            models.Index(
+                fields=["paciente", "actualizado_en"], name="glucosa_pac_sync_idx"
+            ),
+        ]
+        # una misma lectura (sensor reenviando datos) no se guarda dos veces
+        constraints = [
+            models.UniqueConstraint(
+                fields=["paciente", "medido_en", "fuente"],
+                name="glucosa_lectura_unica",
+            ),
+        ]
+
+
+# resumen diario (dia local) por paciente; se mantiene desde glucosa/resumen.py
+class GlucosaDiaria(models.Model):
+    paciente = models.ForeignKey(
+        "pacientes.Paciente", on_delete=models.CASCADE, related_name="glucosa_diaria"
+    )
+    fecha = models.DateField()
+    n = models.PositiveIntegerField(default=0)
+    suma = models.BigIntegerField(default=0)
+    suma_cuadrados = models.BigIntegerField(default=0)
+    minimo = models.PositiveSmallIntegerField(null=True)
+    maximo = models.PositiveSmallIntegerField(null=True)
+    bajos = models.PositiveIntegerField(default=0)  # < 70
+    en_rango = models.PositiveIntegerField(default=0)  # 70-180
+    altos = models.PositiveIntegerField(default=0)  # > 180
+    # conteo por mg/dL (20-600) comprimido; ver glucosa/histograma.py
+    histograma = models.BinaryField(default=bytes)
+
+    class Meta:
+        ordering = ["fecha"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["paciente", "fecha"], name="glucosa_diaria_unica"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente_id} {self.fecha} (n={self.n})"
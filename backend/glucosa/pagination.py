@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# paginacion por cursor (keyset) sobre medido_en/id: sin COUNT ni OFFSET
+class GlucosaCursorPagination(CursorPagination):
+    ordering = ("-medido_en", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+# por defecto paginas numeradas; con ?paginacion=cursor (o ?cursor=) modo keyset
+class GlucosaPagination(PageNumberPagination):
+    def __init__(self):
+        self.cursor = GlucosaCursorPagination()
+        self.modo_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        self.modo_cursor = params.get("paginacion") == "cursor" or "cursor" in params
+        if self.modo_cursor:
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.modo_cursor:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
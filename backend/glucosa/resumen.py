@@ -0,0 +1,133 @@
+from datetime import datetime, time, timedelta
+from itertools import groupby, islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import histograma
+from .models import GlucosaDiaria, GlucosaRegistro
+
+# bandas fijas del resumen diario (consenso internacional de TIR)
+RANGO_BAJO = 70
+RANGO_ALTO = 180
+
+_VALORES = np.arange(histograma.VALOR_MIN, histograma.VALOR_MAX + 1, dtype=np.int64)
+
+
+def dia_local(dt):
+    return timezone.localdate(dt)
+
+
+# todos los campos del dia salen del histograma de valores
+def _campos(hist):
+    presentes = np.flatnonzero(hist)
+    pref = histograma.prefijos(hist)
+    return {
+        "n": int(pref[-1]),
+        "suma": int(hist @ _VALORES),
+        "suma_cuadrados": int(hist @ (_VALORES * _VALORES)),
+        "minimo": int(_VALORES[presentes[0]]) if len(presentes) else None,
+        "maximo": int(_VALORES[presentes[-1]]) if len(presentes) else None,
+        "bajos": histograma.contar_rango(pref, histograma.VALOR_MIN, RANGO_BAJO - 1),
+        "en_rango": histograma.contar_rango(pref, RANGO_BAJO, RANGO_ALTO),
+        "altos": histograma.contar_rango(pref, RANGO_ALTO + 1, histograma.VALOR_MAX),
+        "histograma": histograma.codificar(hist),
+    }
+
+
+def _por_dia(qs):
+    """Una sola consulta: cuantas lecturas de cada valor por (paciente, dia local)."""
+    tz = timezone.get_current_timezone()
+    return (
+        qs.annotate(dia=TruncDate("medido_en", tzinfo=tz))
+        .values("paciente_id", "dia", "valor_mg_dl")
+        .annotate(c=Count("id"))
+        .order_by("paciente_id", "dia")
+    )
+
+
+def _filas(agrupado):
+    for (paciente_id, dia), grupo in groupby(
+        agrupado, key=lambda g: (g["paciente_id"], g["dia"])
+    ):
+        grupo = list(grupo)
+        hist = histograma.desde_valores(
+            [g["valor_mg_dl"] for g in grupo], [g["c"] for g in grupo]
+        )
+        yield GlucosaDiaria(paciente_id=paciente_id, fecha=dia, **_campos(hist))
+
+
+# suma una lectura nueva al resumen de su dia (bloquea solo esa fila)
+def aplicar_lectura(registro):
+    with transaction.atomic():
+        dia, _ = GlucosaDiaria.objects.select_for_update().get_or_create(
+            paciente_id=registro.paciente_id, fecha=dia_local(registro.medido_en)
+        )
+        hist = histograma.decodificar(dia.histograma)
+        hist += histograma.desde_valores([registro.valor_mg_dl])
+        for campo, valor in _campos(hist).items():
+            setattr(dia, campo, valor)
+        dia.save()
+
+
+def _tramos(fechas):
+    """Fechas ordenadas -> [(primera, ultima)] de cada tramo de dias seguidos."""
+    tramos = []
+    for f in fechas:
+        if tramos and f - tramos[-1][1] == timedelta(days=1):
+            tramos[-1][1] = f
+        else:
+            tramos.append([f, f])
+    return tramos
+
+
+# recalcula desde las lecturas los dias indicados (ediciones, borrados, bulk)
+def recalcular_dias(paciente_id, fechas):
+    fechas = set(fechas)
+    if not fechas:
+        return
+    tz = timezone.get_current_timezone()
+    # solo esos dias (no todo lo que hay entre el primero y el ultimo): un rango
+    # por cada tramo de dias seguidos, sobre el indice (paciente, medido_en)
+    rangos = Q()
+    for inicio, fin in _tramos(sorted(fechas)):
+        rangos |= Q(
+            medido_en__gte=datetime.combine(inicio, time.min, tzinfo=tz),
+            medido_en__lte=datetime.combine(fin, time.max, tzinfo=tz),
+        )
+    lecturas = GlucosaRegistro.objects.filter(rangos, paciente_id=paciente_id)
+    with transaction.atomic():
+        GlucosaDiaria.objects.filter(paciente_id=paciente_id, fecha__in=fechas).delete()
+        GlucosaDiaria.objects.bulk_create(
+            _filas(g for g in _por_dia(lecturas) if g["dia"] in fechas)
+        )
+
+
+# reconstruye todo el resumen (o el de un paciente) desde cero
+def reconstruir(paciente_id=None, batch_size=1000):
+    lecturas = GlucosaRegistro.objects.all()
+    diarios = GlucosaDiaria.objects.all()
+    if paciente_id is not None:
+        lecturas = lecturas.filter(paciente_id=paciente_id)
+        diarios = diarios.filter(paciente_id=paciente_id)
+    filas = _filas(_por_dia(lecturas).iterator(chunk_size=batch_size))
+    total = 0
+    with transaction.atomic():
+        diarios.delete()
+        while lote := list(islice(filas, batch_size)):
+            GlucosaDiaria.objects.bulk_create(lote)
+            total += len(lote)
+    return total
+
+
+# histograma acumulado de un rango de dias (para TIR de cualquier objetivo,
+# medianas y percentiles sin tocar las lecturas crudas)
+def histograma_rango(paciente, desde, hasta):
+    return histograma.sumar(
+        GlucosaDiaria.objects.filter(
+            paciente=paciente, fecha__gte=desde, fecha__lte=hasta
+        ).values_list("histograma", flat=True)
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+# agrupa en `puntos` intervalos de igual duracion y devuelve min/media/max por tramo
+def buckets_min_avg_max(t, v, puntos):
+    """
+    t: segundos epoch ordenados ascendente, v: valores (mismo largo).
+    Devuelve (t_inicio, minimo, media, maximo, n) solo de los tramos con datos.
+    """
+    if len(t) == 0:
+        return (np.empty(0),) * 4 + (np.empty(0, dtype=np.int64),)
+    bordes = np.linspace(t[0], t[-1], puntos + 1)
+    idx = np.clip(np.searchsorted(bordes, t, side="right") - 1, 0, puntos - 1)
+
+    # t viene ordenado, asi que cada tramo es un bloque contiguo
+    inicios = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    tramos = idx[inicios]
+    n = np.diff(np.r_[inicios, len(v)])
+    minimo = np.minimum.reduceat(v, inicios)
+    maximo = np.maximum.reduceat(v, inicios)
+    media = np.add.reduceat(v, inicios) / n
+    return bordes[tramos], minimo, media, maximo, n
+
+
+# Largest-Triangle-Three-Buckets: conserva la forma visual con `puntos` muestras
+def lttb(t, v, puntos):
+    """Devuelve los indices seleccionados (siempre incluye primero y ultimo)."""
+    n = len(t)
+    if puntos >= n:
+        return np.arange(n)
+    if puntos < 3:
+        # sin tramos interiores: solo los extremos (o el primero con puntos=1)
+        return np.array([0, n - 1][: max(puntos, 0)], dtype=np.int64)
+
+    # limites de los n-2 puntos interiores repartidos en puntos-2 tramos
+    limites = (np.arange(puntos - 1) * (n - 2) / (puntos - 2)).astype(np.int64) + 1
+    limites[-1] = n - 1
+    # medias de cada tramo con sumas acumuladas (sin bucles)
+    ct = np.r_[0.0, np.cumsum(t)]
+    cv = np.r_[0.0, np.cumsum(v)]
+    ini, fin = limites[:-1], limites[1:]
+    media_t = (ct[fin] - ct[ini]) / (fin - ini)
+    media_v = (cv[fin] - cv[ini]) / (fin - ini)
+    # el "siguiente" del ultimo tramo es el ultimo punto
+    sig_t = np.r_[media_t[1:], t[-1]]
+    sig_v = np.r_[media_v[1:], v[-1]]
+
+    sel = np.empty(puntos, dtype=np.int64)
+    sel[0], sel[-1] = 0, n - 1
+    a = 0
+    for i in range(puntos - 2):
+        ts, vs = t[ini[i] : fin[i]], v[ini[i] : fin[i]]
+        area = np.abs((t[a] - sig_t[i]) * (vs - v[a]) - (t[a] - ts) * (sig_v[i] - v[a]))
+        a = ini[i] + int(np.argmax(area))
+        sel[i + 1] = a
+    return sel
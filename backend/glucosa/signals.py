@@ -0,0 +1,42 @@
+from core.cache import invalidar
+from core.eventos import publicar
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from pacientes.signals import borra_paciente_entero
+
+from .models import GlucosaRegistro
+from .resumen import aplicar_lectura, dia_local, recalcular_dias
+
+
+# guardo el dia de la lectura antes de editarla (puede cambiar medido_en)
+@receiver(pre_save, sender=GlucosaRegistro)
+def recordar_dia_anterior(sender, instance, **kwargs):
+    instance._dia_anterior = None
+    if instance.pk:
+        anterior = (
+            sender.objects.filter(pk=instance.pk).values_list("medido_en", flat=True)
+        ).first()
+        if anterior is not None:
+            instance._dia_anterior = dia_local(anterior)
+
+
+@receiver(post_save, sender=GlucosaRegistro)
+def actualizar_resumen_diario(sender, instance, created, **kwargs):
+    invalidar("glucosa", instance.paciente_id)
+    publicar(instance.paciente_id)
+    if created:
+        aplicar_lectura(instance)
+        return
+    dias = {dia_local(instance.medido_en)}
+    if getattr(instance, "_dia_anterior", None):
+        dias.add(instance._dia_anterior)
+    recalcular_dias(instance.paciente_id, dias)
+
+
+@receiver(post_delete, sender=GlucosaRegistro)
+def descontar_resumen_diario(sender, instance, origin=None, **kwargs):
+    # en cascada desde el paciente su resumen diario se borra con el
+    if borra_paciente_entero(origin):
+        return
+    invalidar("glucosa", instance.paciente_id)
+    recalcular_dias(instance.paciente_id, {dia_local(instance.medido_en)})
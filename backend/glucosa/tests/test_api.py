@@ -1,8 +1,17 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from glucosa import resumen
+from glucosa.models import GlucosaDiaria, GlucosaRegistro
 from pacientes.models import Paciente
 from rest_framework.test import APITestCase
 
 
+# el export es un generador asincrono (streaming real bajo ASGI)
 # prueba de la api del modelo de la glucosa
 class GlucosaApiTest(APITestCase):
     def setUp(self):
@@ -57,3 +66,193 @@ class GlucosaApiTest(APITestCase):
         )
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.data["count"], 1)
+
+
+# lecturas de sensor: paginacion por cursor e ingesta masiva
+class GlucosaSensorTest(APITestCase):
+    def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
+        self.user = User.objects.create_user("cursor", password="cursor1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "cursor", "password": "cursor1234"},
+            format="json",
+        )
+        self.auth = f"Bearer {r.data['access']}"
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+        self.paciente = self.user.paciente
+        base = timezone.now()
+        GlucosaRegistro.objects.bulk_create(
+            [
+                GlucosaRegistro(
+                    paciente=self.paciente,
+                    valor_mg_dl=100 + i,
+                    medido_en=base - timedelta(minutes=5 * i),
+                )
+                for i in range(25)
+            ]
+        )
+
+    def test_borrar_paciente_no_recalcula_dia_a_dia(self):
+        with mock.patch("glucosa.signals.recalcular_dias") as recalcular:
+            self.user.delete()
+        recalcular.assert_not_called()
+        self.assertFalse(GlucosaDiaria.objects.exists())
+
+    def test_recalcular_solo_lee_los_dias_pedidos(self):
+        base = timezone.now() - timedelta(days=30)
+        dias = [base, base + timedelta(days=1), base + timedelta(days=10)]
+        GlucosaRegistro.objects.bulk_create(
+            GlucosaRegistro(paciente=self.paciente, valor_mg_dl=90, medido_en=d)
+            for d in dias
+        )
+        fechas = {resumen.dia_local(d) for d in dias}
+        leidas = []
+        por_dia = resumen._por_dia
+
+        def contar(qs):
+            leidas.extend(qs.values_list("medido_en", flat=True))
+            return por_dia(qs)
+
+        with mock.patch.object(resumen, "_por_dia", contar):
+            resumen.recalcular_dias(self.paciente.pk, fechas)
+        # dos tramos (dias 0-1 y 10), ninguna lectura de los dias intermedios
+        self.assertEqual(len(resumen._tramos(sorted(fechas))), 2)
+        self.assertEqual(sorted(leidas), dias)
+        self.assertEqual(
+            GlucosaDiaria.objects.filter(
+                paciente=self.paciente, fecha__in=fechas
+            ).count(),
+            3,
+        )
+
+    def test_recorre_todas_las_paginas_sin_count(self):
+        r = self.client.get("/api/glucemias/?paginacion=cursor&page_size=10")
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn("count", r.data)
+        vistos = [x["id"] for x in r.data["results"]]
+        while r.data["next"]:
+            r = self.client.get(r.data["next"])
+            self.assertEqual(r.status_code, 200)
+            vistos += [x["id"] for x in r.data["results"]]
+        self.assertEqual(len(vistos), 25)
+        self.assertEqual(len(set(vistos)), 25)
+
+    def test_por_defecto_sigue_paginando_por_numero(self):
+        r = self.client.get("/api/glucemias/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["count"], 25)
+
+    def test_bulk_valida_y_deduplica(self):
+        items = [
+            {"valor_mg_dl": 120, "medido_en": "2025-11-11T08:00:00Z"},
+            {"valor_mg_dl": 130, "medido_en": "2025-11-11T08:05:00Z"},
+            # repetida dentro del lote
+            {"valor_mg_dl": 130, "medido_en": "2025-11-11T08:05:00Z"},
+            {"valor_mg_dl": 5, "medido_en": "2025-11-11T08:10:00Z"},
+            {"valor_mg_dl": 140, "medido_en": "no-es-fecha"},
+        ]
+        r = self.client.post("/api/glucemias/bulk/", {"items": items}, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        self.assertEqual(r.data["aceptadas"], 2)
+        self.assertEqual(r.data["duplicadas"], 1)
+        self.assertEqual(r.data["rechazadas"], 2)
+        self.assertEqual([e["indice"] for e in r.data["errores"]], [3, 4])
+
+        # reenviar el mismo lote no inserta nada nuevo
+        r = self.client.post("/api/glucemias/bulk/", {"items": items}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(r.data["aceptadas"], 0)
+        self.assertEqual(r.data["duplicadas"], 3)
+        self.assertEqual(
+            GlucosaRegistro.objects.filter(paciente=self.paciente).count(), 27
+        )
+
+    def test_bulk_carrera_no_cuenta_como_aceptadas(self):
+        items = [
+            {"valor_mg_dl": 120, "medido_en": "2025-11-11T08:00:00Z"},
+            {"valor_mg_dl": 130, "medido_en": "2025-11-11T08:05:00Z"},
+        ]
+        self.client.post("/api/glucemias/bulk/", {"items": items[:1]}, format="json")
+        # otra ingesta inserto entre la deduplicacion y el INSERT
+        with mock.patch("glucosa.ingesta._existentes", return_value=set()):
+            r = self.client.post(
+                "/api/glucemias/bulk/", {"items": items}, format="json"
+            )
+        self.assertEqual(r.data["aceptadas"], 1)
+        self.assertEqual(r.data["duplicadas"], 1)
+
+    def test_patch_a_lectura_existente_da_400(self):
+        a, b = GlucosaRegistro.objects.filter(paciente=self.paciente)[:2]
+        r = self.client.patch(
+            f"/api/glucemias/{a.id}/",
+            {"medido_en": b.medido_en.isoformat()},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 400, r.content)
+
+    def test_exportar_ndjson_y_csv_con_filtro(self):
+        desde = (timezone.now() - timedelta(minutes=22)).isoformat()
+        r = self.client.get("/api/glucemias/exportar/", {"desde": desde})
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        lineas = b"".join(r.streaming_content).decode().splitlines()
+        filas = [json.loads(x) for x in lineas]
+        # i = 0..4 caen dentro de los ultimos 22 minutos, en orden cronologico
+        self.assertEqual([f["valor_mg_dl"] for f in filas], [104, 103, 102, 101, 100])
+
+        # bloques pequeños: el keyset no pierde ni repite filas entre bloques
+        with mock.patch("glucosa.views.EXPORT_CHUNK", 4):
+            r = self.client.get("/api/glucemias/exportar/", {"formato": "csv"})
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(r["Content-Type"].startswith("text/csv"))
+            lineas = b"".join(r.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], "medido_en,valor_mg_dl,fuente,notas")
+        self.assertEqual(len(lineas), 26)
+        self.assertEqual(len(set(lineas)), 26)
+
+    def test_exportar_en_streaming_bajo_wsgi(self):
+        # iterador sincrono: Django no lo junta en memoria; un bloque por consulta
+        with mock.patch("glucosa.views.EXPORT_CHUNK", 10):
+            r = self.client.get("/api/glucemias/exportar/")
+            self.assertFalse(r.is_async)
+            contenido = iter(r.streaming_content)
+            with self.assertNumQueries(1):
+                for _ in range(10):
+                    next(contenido)
+            with self.assertNumQueries(1):
+                next(contenido)
+            self.assertEqual(len(list(contenido)), 14)
+
+    async def test_exportar_en_streaming_bajo_asgi(self):
+        # generador asincrono: ASGI lo va enviando sin juntarlo en memoria
+        r = await self.async_client.get(
+            "/api/glucemias/exportar/", headers={"Authorization": self.auth}
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.is_async)
+        lineas = b"".join([t async for t in r.streaming_content]).splitlines()
+        self.assertEqual(len(lineas), 25)
+
+    def test_serie_reducida(self):
+        r = self.client.get("/api/glucemias/serie/", {"puntos": 5})
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(r.data["originales"], 25)
+        self.assertLessEqual(r.data["puntos"], 5)
+        self.assertEqual(sum(p["n"] for p in r.data["serie"]), 25)
+        self.assertEqual(min(p["min"] for p in r.data["serie"]), 100)
+        self.assertEqual(max(p["max"] for p in r.data["serie"]), 124)
+
+        r = self.client.get("/api/glucemias/serie/", {"puntos": 6, "metodo": "lttb"})
+        self.assertEqual(r.status_code, 200, r.content)
+        valores = [p["valor"] for p in r.data["serie"]]
+        self.assertEqual(len(valores), 6)
+        # conserva los extremos (primer y ultimo punto de la ventana)
+        self.assertEqual(valores[0], 124)
+        self.assertEqual(valores[-1], 100)
+
+        # con 2 puntos solo quedan los extremos, no toda la serie
+        r = self.client.get("/api/glucemias/serie/", {"puntos": 2, "metodo": "lttb"})
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual([p["valor"] for p in r.data["serie"]], [124, 100])
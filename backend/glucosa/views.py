@@ -1,30 +1,356 @@
+import csv
+import json
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from rest_framework import permissions, viewsets
+from drf_spectacular.utils import (
+    OpenApiExample,
+    OpenApiParameter,
+    extend_schema,
+    inline_serializer,
+)
+from rest_framework import permissions, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from .ingesta import MAX_LECTURAS, ingerir_lecturas
 from .models import GlucosaRegistro
+from .pagination import GlucosaPagination
 from .serializers import GlucosaRegistroSerializer
+from .series import buckets_min_avg_max, lttb
+
+EXPORT_CAMPOS = ("medido_en", "valor_mg_dl", "fuente", "notas")
+EXPORT_CHUNK = 2000
+SERIE_PUNTOS = 300
+SERIE_MAX_PUNTOS = 5000
+SERIE_DIAS_DEFECTO = 14
+
+
+def _filtrar_rango(qs, params):
+    # Filtros ?desde=&hasta=
+    d = params.get("desde")
+    h = params.get("hasta")
+    if d:
+        d_dt = parse_datetime(d) or d
+        qs = qs.filter(medido_en__gte=d_dt)
+    if h:
+        h_dt = parse_datetime(h) or h
+        qs = qs.filter(medido_en__lte=h_dt)
+    return qs
+
+
+# buffer de "escritura" para csv.writer: devuelve la linea en vez de guardarla
+class _Eco:
+    def write(self, value):
+        return value
+
+
+def _bloque_export(qs, ultimo):
+    """Siguiente bloque del export tras ultimo=(medido_en, id), por keyset."""
+    if ultimo is not None:
+        t, pk = ultimo
+        qs = qs.filter(Q(medido_en__gt=t) | Q(medido_en=t, id__gt=pk))
+    return list(qs.values_list("id", *EXPORT_CAMPOS)[:EXPORT_CHUNK])
+
+
+def _leer_export(qs):
+    """Filas del export en bloques cortos: una consulta por EXPORT_CHUNK filas."""
+    ultimo = None
+    while True:
+        filas = _bloque_export(qs, ultimo)
+        for fila in filas:
+            yield fila[1:]
+        if len(filas) < EXPORT_CHUNK:
+            return
+        ultimo = (filas[-1][1], filas[-1][0])
+
+
+async def _leer_export_async(qs):
+    # igual que _leer_export, con cada consulta fuera del bucle de eventos
+    ultimo = None
+    while True:
+        filas = await sync_to_async(_bloque_export)(qs, ultimo)
+        for fila in filas:
+            yield fila[1:]
+        if len(filas) < EXPORT_CHUNK:
+            return
+        ultimo = (filas[-1][1], filas[-1][0])
+
+
+def _linea_ndjson(medido_en, valor, fuente, notas):
+    return (
+        json.dumps(
+            {
+                "medido_en": medido_en.isoformat(),
+                "valor_mg_dl": valor,
+                "fuente": fuente,
+                "notas": notas,
+            },
+            ensure_ascii=False,
+        )
+        + "\n"
+    )
+
+
+def _linea_csv(medido_en, valor, fuente, notas):
+    return csv.writer(_Eco()).writerow([medido_en.isoformat(), valor, fuente, notas])
+
+
+def _cuerpo_export(formato, filas):
+    linea = _linea_ndjson
+    if formato == "csv":
+        linea = _linea_csv
+        yield csv.writer(_Eco()).writerow(EXPORT_CAMPOS)
+    for fila in filas:
+        yield linea(*fila)
+
+
+async def _cuerpo_export_async(formato, filas):
+    linea = _linea_ndjson
+    if formato == "csv":
+        linea = _linea_csv
+        yield csv.writer(_Eco()).writerow(EXPORT_CAMPOS)
+    async for fila in filas:
+        yield linea(*fila)
+
+
+def _iso(segundos):
+    return datetime.fromtimestamp(segundos, tz=dt_timezone.utc).isoformat()
 
 
 # el view set del refgtistro de la glucosa
 class GlucosaRegistroViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = GlucosaRegistroSerializer
+    pagination_class = GlucosaPagination
+    ordering = ("-medido_en", "-id")
 
     def get_queryset(self):
         qs = GlucosaRegistro.objects.filter(
             paciente__usuario=self.request.user
-        ).order_by("-medido_en")
-        # Filtros ?desde=&hasta=
-        d = self.request.query_params.get("desde")
-        h = self.request.query_params.get("hasta")
-        if d:
-            d_dt = parse_datetime(d) or d
-            qs = qs.filter(medido_en__gte=d_dt)
-        if h:
-            h_dt = parse_datetime(h) or h
-            qs = qs.filter(medido_en__lte=h_dt)
-        return qs
+        ).order_by("-medido_en", "-id")
+        return _filtrar_rango(qs, self.request.query_params)
+
+    def _guardar(self, serializer, **kwargs):
+        # (paciente, medido_en, fuente) es unico: choque -> 400, no 500
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                "Ya existe una lectura con esa fecha y fuente."
+            )
 
     def perform_create(self, serializer):
-        paciente = self.request.user.paciente
-        serializer.save(paciente=paciente)
+        self._guardar(serializer, paciente=self.request.user.paciente)
+
+    def perform_update(self, serializer):
+        self._guardar(serializer)
+
+    @extend_schema(
+        tags=["Glucosa"],
+        request=inline_serializer(
+            name="GlucosaBulk",
+            fields={
+                "items": serializers.ListField(
+                    child=inline_serializer(
+                        name="GlucosaBulkItem",
+                        fields={
+                            "valor_mg_dl": serializers.IntegerField(),
+                            "medido_en": serializers.DateTimeField(),
+                            "fuente": serializers.CharField(required=False),
+                        },
+                    )
+                )
+            },
+        ),
+        responses={
+            200: inline_serializer(
+                name="GlucosaBulkResultado",
+                fields={
+                    "recibidas": serializers.IntegerField(),
+                    "aceptadas": serializers.IntegerField(),
+                    "duplicadas": serializers.IntegerField(),
+                    "rechazadas": serializers.IntegerField(),
+                    "errores": serializers.ListField(child=serializers.DictField()),
+                },
+            )
+        },
+        examples=[
+            OpenApiExample(
+                "Lecturas de sensor",
+                value={
+                    "items": [
+                        {
+                            "valor_mg_dl": 112,
+                            "medido_en": "2025-11-11T08:35:00Z",
+                            "fuente": "sensor",
+                        }
+                    ]
+                },
+                request_only=True,
+            )
+        ],
+    )
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Ingesta masiva (CGM). Cuerpo:
+        {"items":[{"valor_mg_dl":112,"medido_en":"...","fuente":"sensor"}, ...]}
+        Las lecturas repetidas (paciente, medido_en, fuente) se ignoran.
+        """
+        items = request.data.get("items") if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            return Response({"detail": "items debe ser lista"}, status=400)
+        if len(items) > MAX_LECTURAS:
+            return Response(
+                {"detail": f"Máximo {MAX_LECTURAS} lecturas por petición."},
+                status=400,
+            )
+        resultado = ingerir_lecturas(request.user.paciente, items)
+        return Response(
+            resultado,
+            status=(
+                status.HTTP_201_CREATED
+                if resultado["aceptadas"]
+                else status.HTTP_200_OK
+            ),
+        )
+
+    @extend_schema(
+        tags=["Glucosa"],
+        parameters=[
+            OpenApiParameter(
+                name="formato", description="ndjson|csv", required=False, type=str
+            ),
+            OpenApiParameter(
+                name="desde", description="ISO 8601", required=False, type=str
+            ),
+            OpenApiParameter(
+                name="hasta", description="ISO 8601", required=False, type=str
+            ),
+        ],
+        responses={(200, "application/x-ndjson"): str, (200, "text/csv"): str},
+    )
+    @action(detail=False, methods=["get"])
+    def exportar(self, request):
+        """
+        Exporta el historico completo en streaming (NDJSON o CSV), en orden
+        cronologico, con memoria constante: bloques por keyset de EXPORT_CHUNK
+        filas (ver _leer_export). Django solo hace streaming del iterador que
+        coincide con el servidor: bajo ASGI (produccion, uvicorn) consume de
+        golpe los sincronos y bajo WSGI los asincronos, asi que cada uno recibe
+        el suyo.
+        """
+        formato = request.query_params.get("formato", "ndjson").lower()
+        if formato not in ("ndjson", "csv"):
+            return Response({"detail": "formato debe ser ndjson o csv"}, status=400)
+
+        qs = _filtrar_rango(
+            GlucosaRegistro.objects.filter(paciente__usuario=request.user),
+            request.query_params,
+        ).order_by("medido_en", "id")
+        if isinstance(request._request, ASGIRequest):
+            cuerpo = _cuerpo_export_async(formato, _leer_export_async(qs))
+        else:
+            cuerpo = _cuerpo_export(formato, _leer_export(qs))
+
+        tipo = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+        resp = StreamingHttpResponse(cuerpo, content_type=tipo)
+        resp["Content-Disposition"] = f'attachment; filename="glucemias.{formato}"'
+        return resp
+
+    @extend_schema(
+        tags=["Glucosa"],
+        parameters=[
+            OpenApiParameter(
+                name="desde", description="ISO 8601", required=False, type=str
+            ),
+            OpenApiParameter(
+                name="hasta", description="ISO 8601", required=False, type=str
+            ),
+            OpenApiParameter(
+                name="puntos",
+                description=f"Puntos objetivo (2-{SERIE_MAX_PUNTOS})",
+                required=False,
+                type=int,
+            ),
+            OpenApiParameter(
+                name="metodo", description="buckets|lttb", required=False, type=str
+            ),
+        ],
+    )
+    @action(detail=False, methods=["get"])
+    def serie(self, request):
+        """
+        Serie reducida para graficas. Por defecto ultimos 14 dias.
+        - metodo=buckets: min/media/max por intervalo de tiempo
+        - metodo=lttb: muestras originales elegidas con LTTB
+        """
+        metodo = request.query_params.get("metodo", "buckets").lower()
+        if metodo not in ("buckets", "lttb"):
+            return Response({"detail": "metodo debe ser buckets o lttb"}, status=400)
+        try:
+            puntos = int(request.query_params.get("puntos", SERIE_PUNTOS))
+        except ValueError:
+            return Response({"detail": "puntos debe ser entero"}, status=400)
+        if not 2 <= puntos <= SERIE_MAX_PUNTOS:
+            return Response(
+                {"detail": f"puntos debe estar entre 2 y {SERIE_MAX_PUNTOS}"},
+                status=400,
+            )
+
+        params = request.query_params.copy()
+        if not params.get("desde"):
+            params["desde"] = (
+                timezone.now() - timedelta(days=SERIE_DIAS_DEFECTO)
+            ).isoformat()
+        qs = _filtrar_rango(
+            GlucosaRegistro.objects.filter(paciente__usuario=request.user), params
+        ).order_by("medido_en", "id")
+
+        # una sola consulta; el resto se calcula sobre arrays
+        filas = list(qs.values_list("medido_en", "valor_mg_dl"))
+        t = np.fromiter((m.timestamp() for m, _ in filas), float, count=len(filas))
+        v = np.fromiter((x for _, x in filas), float, count=len(filas))
+
+        if metodo == "lttb":
+            sel = lttb(t, v, puntos)
+            serie = [
+                {"t": _iso(ts), "valor": int(val)}
+                for ts, val in zip(t[sel].tolist(), v[sel].tolist())
+            ]
+        else:
+            inicio, minimo, media, maximo, n = buckets_min_avg_max(t, v, puntos)
+            serie = [
+                {
+                    "t": _iso(ts),
+                    "min": int(mn),
+                    "avg": round(av, 1),
+                    "max": int(mx),
+                    "n": c,
+                }
+                for ts, mn, av, mx, c in zip(
+                    inicio.tolist(),
+                    minimo.tolist(),
+                    media.tolist(),
+                    maximo.tolist(),
+                    n.tolist(),
+                )
+            ]
+        return Response(
+            {
+                "metodo": metodo,
+                "originales": len(filas),
+                "puntos": len(serie),
+                "serie": serie,
+            }
+        )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Insumo, MovimientoInsumo
+from .models import CheckpointInsumo, Insumo, MovimientoInsumo
 
 
 @admin.register(Insumo)
@@ -17,7 +17,25 @@ class InsumoAdmin(admin.ModelAdmin):
     list_filter = ("tipo",)
 
 
+class SoloLecturaAdmin(admin.ModelAdmin):
+    # el libro de movimientos solo se escribe con insumos.services, que mueve el
+    # stock a la vez: tocarlo desde el admin descuadraria stock y checkpoints
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(MovimientoInsumo)
-class MovimientoAdmin(admin.ModelAdmin):
+class MovimientoAdmin(SoloLecturaAdmin):
     list_display = ("id", "insumo", "cantidad", "motivo", "fecha")
     list_filter = ("motivo",)
+
+
+@admin.register(CheckpointInsumo)
+class CheckpointAdmin(SoloLecturaAdmin):
+    list_display = ("id", "insumo", "fecha", "saldo", "movimientos")
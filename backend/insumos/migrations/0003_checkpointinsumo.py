@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+# checkpoint inicial: saldo al crear = stock actual - movimientos registrados
+def checkpoints_iniciales(apps, schema_editor):
+    Insumo = apps.get_model("insumos", "Insumo")
+    MovimientoInsumo = apps.get_model("insumos", "MovimientoInsumo")
+    CheckpointInsumo = apps.get_model("insumos", "CheckpointInsumo")
+    sumas = dict(
+        MovimientoInsumo.objects.values("insumo_id")
+        .annotate(s=Sum("cantidad"))
+        .order_by()
+        .values_list("insumo_id", "s")
+    )
+    CheckpointInsumo.objects.bulk_create(
+        [
+            CheckpointInsumo(
+                insumo_id=pk, fecha=creado_en, saldo=stock - (sumas.get(pk) or 0)
+            )
+            for pk, creado_en, stock in Insumo.objects.values_list(
+                "pk", "creado_en", "stock_actual"
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("insumos", "0002_insumo_actualizado_en"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckpointInsumo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateTimeField()),
+                ("saldo", models.IntegerField()),
+                ("movimientos", models.PositiveIntegerField(default=0)),
+                ("creado_en", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ("-fecha",),
+            },
+        ),
+        migrations.AddIndex(
+            model_name="movimientoinsumo",
+            index=models.Index(fields=["insumo", "fecha"], name="mov_insumo_fecha_idx"),
+        ),
+        migrations.AddField(
+            model_name="checkpointinsumo",
+            name="insumo",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="checkpoints",
+                to="insumos.insumo",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="checkpointinsumo",
+            index=models.Index(
+                fields=["insumo", "-fecha"], name="checkpoint_insumo_idx"
+            ),
+        ),
+        migrations.RunPython(checkpoints_iniciales, migrations.RunPython.noop),
+    ]
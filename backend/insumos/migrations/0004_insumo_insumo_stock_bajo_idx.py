@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("insumos", "0003_checkpointinsumo"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="insumo",
+            index=models.Index(
+                condition=models.Q(("stock_actual__lt", models.F("stock_minimo"))),
+                fields=["id"],
+                name="insumo_stock_bajo_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("insumos", "0004_insumo_insumo_stock_bajo_idx"),
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="insumo",
+            index=models.Index(
+                condition=models.Q(("caduca_en__isnull", False)),
+                fields=["caduca_en"],
+                name="insumo_caduca_idx",
+            ),
+        ),
+    ]
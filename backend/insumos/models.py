@@ -21,10 +21,39 @@ class Insumo(models.Model):
     unidad = models.CharField(max_length=20, default="u")
     caduca_en = models.DateField(null=True, blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)  # delta-sync
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["paciente", "actualizado_en"], name="insumo_pac_sync_idx"
+            ),
+            # parcial: solo los insumos bajo minimo (lo que recorre scan_inventory)
+            models.Index(
+                fields=["id"],
+                condition=models.Q(stock_actual__lt=models.F("stock_minimo")),
+                name="insumo_stock_bajo_idx",
+            ),
+            # parcial: solo los que tienen fecha de caducidad (scan_caducidad)
+            models.Index(
+                fields=["caduca_en"],
+                condition=models.Q(caduca_en__isnull=False),
+                name="insumo_caduca_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.stock_actual}{self.unidad})"
 
+    def save(self, *args, **kwargs):
+        nuevo = self._state.adding
+        super().save(*args, **kwargs)
+        if nuevo:
+            # saldo inicial: el libro de movimientos arranca desde aqui
+            CheckpointInsumo.objects.create(
+                insumo=self, fecha=self.creado_en, saldo=self.stock_actual
+            )
+
 
 # modelo del movimiento del insumoi del paciente
 class MovimientoInsumo(models.Model):
@@ -46,3 +75,26 @@ class MovimientoInsumo(models.Model):
     # ordeno por fecha
     class Meta:
         ordering = ("-fecha",)
+        indexes = [
+            models.Index(fields=["insumo", "fecha"], name="mov_insumo_fecha_idx"),
+        ]
+
+
+# saldo del insumo a una fecha; stock = ultimo checkpoint + movimientos posteriores
+class CheckpointInsumo(models.Model):
+    insumo = models.ForeignKey(
+        Insumo, on_delete=models.CASCADE, related_name="checkpoints"
+    )
+    fecha = models.DateTimeField()
+    saldo = models.IntegerField()
+    movimientos = models.PositiveIntegerField(default=0)  # compactados en este punto
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-fecha",)
+        indexes = [
+            models.Index(fields=["insumo", "-fecha"], name="checkpoint_insumo_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.insumo_id} @ {self.fecha:%Y-%m-%d}: {self.saldo}"
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+# historial de movimientos por cursor sobre (insumo, fecha): lecturas acotadas
+class MovimientoPagination(CursorPagination):
+    ordering = ("-fecha", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
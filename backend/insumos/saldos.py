@@ -0,0 +1,153 @@
+# libro de stock: saldo = ultimo checkpoint + movimientos posteriores
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from core.cache import invalidar
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DateTimeField,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CheckpointInsumo, Insumo, MovimientoInsumo
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _checkpoint(campo):
+    return Subquery(
+        CheckpointInsumo.objects.filter(insumo=OuterRef("pk"))
+        .order_by("-fecha", "-id")
+        .values(campo)[:1]
+    )
+
+
+def _movimientos(agregado, salida, hasta=None):
+    # agregado de los movimientos posteriores al checkpoint (y anteriores a `hasta`)
+    qs = MovimientoInsumo.objects.filter(
+        insumo=OuterRef("pk"), fecha__gt=OuterRef("cp_fecha")
+    )
+    if hasta is not None:
+        qs = qs.filter(fecha__lt=hasta)
+    return Subquery(
+        qs.order_by().values("insumo").annotate(x=agregado).values("x"),
+        output_field=salida,
+    )
+
+
+def con_checkpoint(qs):
+    # sin checkpoint (p.ej. bulk_create) el libro empieza en 0
+    return qs.annotate(
+        cp_fecha=Coalesce(
+            _checkpoint("fecha"), Value(EPOCA), output_field=DateTimeField()
+        ),
+        cp_saldo=Coalesce(_checkpoint("saldo"), Value(0)),
+    )
+
+
+def con_saldo_libro(qs):
+    return con_checkpoint(qs).annotate(
+        saldo_libro=F("cp_saldo")
+        + Coalesce(_movimientos(Sum("cantidad"), IntegerField()), Value(0))
+    )
+
+
+def _descuadres(qs):
+    return list(
+        con_saldo_libro(qs)
+        .exclude(stock_actual=F("saldo_libro"))
+        .order_by("pk")
+        .values_list("pk", "stock_actual", "saldo_libro")
+    )
+
+
+def reconciliar(paciente_id=None, corregir=False):
+    """
+    Devuelve [(insumo_id, stock_actual, saldo_libro)] de los insumos cuyo stock
+    no cuadra con el libro. Con corregir=True se deja el stock del libro.
+    """
+    qs = Insumo.objects.all()
+    if paciente_id:
+        qs = qs.filter(paciente_id=paciente_id)
+    descuadres = _descuadres(qs)
+    if not (corregir and descuadres):
+        return descuadres
+
+    with transaction.atomic():
+        # bloqueo las filas y recalculo: un movimiento confirmado entre la
+        # lectura y la escritura ya cuenta (y el siguiente espera al bloqueo)
+        pks = [pk for pk, _, _ in descuadres]
+        list(
+            Insumo.objects.select_for_update()
+            .filter(pk__in=pks)
+            .order_by("pk")
+            .values_list("pk")
+        )
+        descuadres = _descuadres(Insumo.objects.filter(pk__in=pks))
+        ahora = timezone.now()
+        Insumo.objects.bulk_update(
+            [
+                Insumo(pk=pk, stock_actual=saldo, actualizado_en=ahora)
+                for pk, _, saldo in descuadres
+            ],
+            ["stock_actual", "actualizado_en"],
+        )
+    return descuadres
+
+
+def compactar(antes_de, paciente_id=None, batch_size=500):
+    """
+    Resume los movimientos anteriores a `antes_de` en un checkpoint por insumo y
+    los borra. Devuelve (checkpoints creados, movimientos borrados).
+    """
+    ids = MovimientoInsumo.objects.filter(fecha__lt=antes_de)
+    if paciente_id:
+        ids = ids.filter(insumo__paciente_id=paciente_id)
+    ids = list(ids.order_by("insumo_id").values_list("insumo_id", flat=True).distinct())
+
+    creados = borrados = 0
+    for i in range(0, len(ids), batch_size):
+        lote = ids[i : i + batch_size]
+        with transaction.atomic():
+            # bloqueo los insumos para no cruzarme con otra compactacion
+            pacientes = set(
+                Insumo.objects.select_for_update()
+                .filter(pk__in=lote)
+                .order_by("pk")
+                .values_list("paciente_id", flat=True)
+            )
+            filas = (
+                con_checkpoint(Insumo.objects.filter(pk__in=lote))
+                .annotate(
+                    n=_movimientos(Count("id"), IntegerField(), antes_de),
+                    suma=_movimientos(Sum("cantidad"), IntegerField(), antes_de),
+                    ultima=_movimientos(Max("fecha"), DateTimeField(), antes_de),
+                )
+                .filter(n__gt=0)
+                .values_list("pk", "cp_saldo", "n", "suma", "ultima")
+            )
+            nuevos = CheckpointInsumo.objects.bulk_create(
+                [
+                    CheckpointInsumo(
+                        insumo_id=pk, fecha=ultima, saldo=saldo + suma, movimientos=n
+                    )
+                    for pk, saldo, n, suma, ultima in filas
+                ]
+            )
+            creados += len(nuevos)
+            borrados += MovimientoInsumo.objects.filter(
+                insumo_id__in=lote, fecha__lt=antes_de
+            ).delete()[0]
+            # el pronostico cacheado sumaba los "uso" que se acaban de borrar
+            for paciente_id in pacientes:
+                invalidar("insumos", paciente_id)
+    return creados, borrados
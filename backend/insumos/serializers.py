@@ -19,14 +19,17 @@ class InsumoSerializer(serializers.ModelSerializer):
         read_only_fields = ["creado_en"]
 
 
+# el stock no negativo lo garantiza insumos.services.registrar_movimiento
 class MovimientoSerializer(serializers.ModelSerializer):
     class Meta:
         model = MovimientoInsumo
         fields = ["id", "cantidad", "motivo", "nota", "fecha"]
         read_only_fields = ["fecha"]
 
-    def validate(self, data):
-        insumo = self.context["insumo"]
-        if insumo.stock_actual + data["cantidad"] < 0:
-            raise serializers.ValidationError("El stock no puede quedar en negativo.")
-        return data
+
+# item del endpoint de movimientos en bloque
+class MovimientoLoteSerializer(MovimientoSerializer):
+    insumo_id = serializers.IntegerField()
+
+    class Meta(MovimientoSerializer.Meta):
+        fields = ["insumo_id", *MovimientoSerializer.Meta.fields]
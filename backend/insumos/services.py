@@ -0,0 +1,217 @@
+from alertas.services import upsert_alertas
+from core.cache import invalidar
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Insumo, MovimientoInsumo
+
+MAX_MOVIMIENTOS_LOTE = 200
+
+
+class StockNegativo(Exception):
+    """El movimiento dejaria el stock por debajo de cero."""
+
+    def __init__(self, mensaje, insumos=()):
+        super().__init__(mensaje)
+        self.insumos = list(insumos)
+
+
+def mensaje_stock_bajo(nombre, stock, minimo, unidad):
+    return f"Stock bajo en {nombre}: {stock}{unidad} (<{minimo})"
+
+
+def _aplicar_delta_returning(insumo_id, cantidad, paciente_id):
+    # UPDATE condicional atomico: la comprobacion y la suma van en la misma fila
+    tabla = connection.ops.quote_name(Insumo._meta.db_table)
+    sql = (
+        f"UPDATE {tabla} SET stock_actual = stock_actual + %s, actualizado_en = %s "
+        "WHERE id = %s AND stock_actual + %s >= 0"
+    )
+    params = [
+        cantidad,
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+        insumo_id,
+        cantidad,
+    ]
+    if paciente_id is not None:
+        sql += " AND paciente_id = %s"
+        params.append(paciente_id)
+    sql += " RETURNING stock_actual, stock_minimo, paciente_id, nombre, unidad"
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()
+
+
+def _aplicar_delta_bloqueando(insumo_id, cantidad, paciente_id):
+    # sin RETURNING: bloqueo la fila y compruebo dentro de la transaccion
+    qs = Insumo.objects.select_for_update().filter(pk=insumo_id)
+    if paciente_id is not None:
+        qs = qs.filter(paciente_id=paciente_id)
+    insumo = qs.only(
+        "stock_actual", "stock_minimo", "paciente_id", "nombre", "unidad"
+    ).first()
+    if insumo is None or insumo.stock_actual + cantidad < 0:
+        return None
+    insumo.stock_actual += cantidad
+    insumo.save(update_fields=["stock_actual", "actualizado_en"])
+    return (
+        insumo.stock_actual,
+        insumo.stock_minimo,
+        insumo.paciente_id,
+        insumo.nombre,
+        insumo.unidad,
+    )
+
+
+# registra un movimiento y actualiza el stock en una transaccion, sin lecturas extra
+def registrar_movimiento(insumo_id, cantidad, motivo="uso", nota="", paciente_id=None):
+    """
+    Devuelve (movimiento, stock_actual). Lanza Insumo.DoesNotExist si el insumo
+    no existe (o no es del paciente) y StockNegativo si no hay stock suficiente.
+    """
+    aplicar = (
+        _aplicar_delta_returning
+        if connection.features.can_return_columns_from_insert
+        else _aplicar_delta_bloqueando
+    )
+    with transaction.atomic():
+        fila = aplicar(insumo_id, cantidad, paciente_id)
+        if fila is None:
+            existe = Insumo.objects.filter(pk=insumo_id)
+            if paciente_id is not None:
+                existe = existe.filter(paciente_id=paciente_id)
+            if not existe.exists():
+                raise Insumo.DoesNotExist
+            raise StockNegativo("El stock no puede quedar en negativo.")
+
+        stock, minimo, paciente, nombre, unidad = fila
+        mov = MovimientoInsumo.objects.create(
+            insumo_id=insumo_id, cantidad=cantidad, motivo=motivo, nota=nota
+        )
+        if stock < minimo:
+            upsert_alertas(
+                [
+                    (
+                        paciente,
+                        insumo_id,
+                        "stock_bajo",
+                        mensaje_stock_bajo(nombre, stock, minimo, unidad),
+                    )
+                ]
+            )
+    invalidar("insumos", paciente)
+    return mov, stock
+
+
+# varios movimientos (p.ej. recogida en farmacia) con un solo bloqueo y un solo UPDATE
+def registrar_movimientos(paciente_id, items):
+    """
+    items: [{"insumo_id", "cantidad", "motivo", "nota"}]. Todo o nada: si algun
+    insumo no es del paciente lanza Insumo.DoesNotExist y si alguno quedaria en
+    negativo (en el orden del lote) StockNegativo. Devuelve (movimientos, stocks).
+    """
+    ids = {it["insumo_id"] for it in items}
+    with transaction.atomic():
+        # un SELECT ... FOR UPDATE para todos, en orden de pk para no cruzar bloqueos
+        insumos = {
+            i.pk: i
+            for i in Insumo.objects.select_for_update()
+            .filter(paciente_id=paciente_id, pk__in=ids)
+            .order_by("pk")
+        }
+        faltan = sorted(ids - insumos.keys())
+        if faltan:
+            raise Insumo.DoesNotExist(f"Insumos no encontrados: {faltan}")
+
+        stock = {pk: i.stock_actual for pk, i in insumos.items()}
+        negativos = []
+        for it in items:
+            stock[it["insumo_id"]] += it["cantidad"]
+            if stock[it["insumo_id"]] < 0 and it["insumo_id"] not in negativos:
+                negativos.append(it["insumo_id"])
+        if negativos:
+            raise StockNegativo("El stock no puede quedar en negativo.", negativos)
+
+        movs = MovimientoInsumo.objects.bulk_create(
+            [
+                MovimientoInsumo(
+                    insumo_id=it["insumo_id"],
+                    cantidad=it["cantidad"],
+                    motivo=it.get("motivo", "uso"),
+                    nota=it.get("nota", ""),
+                )
+                for it in items
+            ]
+        )
+        # bulk_update no aplica auto_now: pongo actualizado_en a mano
+        ahora = timezone.now()
+        for pk, insumo in insumos.items():
+            insumo.stock_actual = stock[pk]
+            insumo.actualizado_en = ahora
+        Insumo.objects.bulk_update(insumos.values(), ["stock_actual", "actualizado_en"])
+
+        # una alerta como mucho por insumo, con el stock final
+        upsert_alertas(
+            (
+                paciente_id,
+                i.pk,
+                "stock_bajo",
+                mensaje_stock_bajo(i.nombre, i.stock_actual, i.stock_minimo, i.unidad),
+            )
+            for i in insumos.values()
+            if i.stock_actual < i.stock_minimo
+        )
+    invalidar("insumos", paciente_id)
+    return movs, stock
+
+
+def mensaje_caducidad(nombre, caduca_en, hoy):
+    if caduca_en < hoy:
+        return f"{nombre} caducó el {caduca_en:%d/%m/%Y}"
+    return f"{nombre} caduca el {caduca_en:%d/%m/%Y}"
+
+
+# da de baja el stock caducado (movimiento "caducidad" por insumo) en lotes
+def retirar_caducados(hoy, batch_size=500):
+    """Devuelve cuantos insumos se han dejado a 0."""
+    retirados, ultimo = 0, 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                Insumo.objects.select_for_update()
+                .filter(pk__gt=ultimo, caduca_en__lt=hoy, stock_actual__gt=0)
+                .order_by("pk")[:batch_size]
+            )
+            if not lote:
+                break
+            MovimientoInsumo.objects.bulk_create(
+                [
+                    MovimientoInsumo(
+                        insumo_id=i.pk,
+                        cantidad=-i.stock_actual,
+                        motivo="caducidad",
+                        nota=f"caducado el {i.caduca_en:%d/%m/%Y}",
+                    )
+                    for i in lote
+                ]
+            )
+            ahora = timezone.now()
+            for i in lote:
+                i.stock_actual = 0
+                i.actualizado_en = ahora
+            Insumo.objects.bulk_update(lote, ["stock_actual", "actualizado_en"])
+            upsert_alertas(
+                (
+                    i.paciente_id,
+                    i.pk,
+                    "stock_bajo",
+                    mensaje_stock_bajo(i.nombre, 0, i.stock_minimo, i.unidad),
+                )
+                for i in lote
+                if i.stock_minimo > 0
+            )
+        for paciente_id in {i.paciente_id for i in lote}:
+            invalidar("insumos", paciente_id)
+        retirados += len(lote)
+        ultimo = lote[-1].pk
+    return retirados
@@ -1,4 +1,22 @@
+import io
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from alertas.models import Alerta
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from insumos import saldos
+from insumos.models import CheckpointInsumo, Insumo, MovimientoInsumo
+from insumos.saldos import reconciliar
+from insumos.services import StockNegativo, registrar_movimiento
+from insumos.views import InsumoViewSet
+from pacientes.models import Paciente
 from rest_framework.test import APITestCase
 
 
@@ -16,6 +34,8 @@ def _as_list(data):
 
 class InsumoAPITestCase(APITestCase):
     def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
         # Crea usuario de pruebas
         self.user = User.objects.create_user("demo", password="demo1234")
 
@@ -108,3 +128,369 @@ class InsumoAPITestCase(APITestCase):
             any((item.get("tipo") == "stock_bajo") for item in items),
             f"Respuesta sin 'stock_bajo': {r.data}",
         )
+
+    def test_movimiento_devuelve_stock(self):
+        insumo_id = self.crear_insumo_api(stock_actual=4)
+        r = self.client.post(
+            f"/api/insumos/{insumo_id}/movimientos/",
+            {"cantidad": -1, "motivo": "uso"},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 201, r.content)
+        self.assertEqual(r.data["stock_actual"], 3)
+
+    def test_movimiento_insumo_ajeno_404(self):
+        otro = User.objects.create_user("otro", password="x")
+        pac = Paciente.objects.get(usuario=otro)
+        ajeno = Insumo.objects.create(paciente=pac, nombre="X", tipo="TIR")
+        r = self.client.post(
+            f"/api/insumos/{ajeno.pk}/movimientos/",
+            {"cantidad": 1, "motivo": "compra"},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 404, r.content)
+        self.assertFalse(MovimientoInsumo.objects.filter(insumo=ajeno).exists())
+
+    def test_servicio_consultas(self):
+        """UPDATE ... RETURNING + INSERT (+ savepoint) sin releer el insumo."""
+        insumo_id = self.crear_insumo_api(stock_actual=10, stock_minimo=2)
+        # savepoint, update, insert, release
+        with self.assertNumQueries(4):
+            registrar_movimiento(insumo_id, -1)
+        # + insert de la alerta
+        with self.assertNumQueries(5):
+            registrar_movimiento(insumo_id, -8)
+
+    def test_servicio_sin_returning(self):
+        insumo_id = self.crear_insumo_api(stock_actual=3)
+        with mock.patch.object(
+            connection.features, "can_return_columns_from_insert", False
+        ):
+            _, stock = registrar_movimiento(insumo_id, -2)
+            self.assertEqual(stock, 1)
+            with self.assertRaises(StockNegativo):
+                registrar_movimiento(insumo_id, -2)
+        insumo = Insumo.objects.get(pk=insumo_id)
+        self.assertEqual(insumo.stock_actual, 1)
+        self.assertEqual(insumo.movimientos.count(), 1)
+
+    def test_movimientos_bulk(self):
+        tiras = self.crear_insumo_api(stock_actual=1, stock_minimo=5)
+        agujas = self.crear_insumo_api(
+            nombre="Agujas", tipo="AGU", stock_actual=3, stock_minimo=0
+        )
+        r = self.client.post(
+            "/api/insumos/movimientos_bulk/",
+            {
+                "items": [
+                    {"insumo_id": tiras, "cantidad": 2, "motivo": "compra"},
+                    {"insumo_id": agujas, "cantidad": -3, "motivo": "uso"},
+                    {"insumo_id": tiras, "cantidad": -1, "motivo": "uso"},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(r.status_code, 201, r.content)
+        self.assertEqual(len(r.data["movimientos"]), 3)
+        self.assertEqual(r.data["stock"], {str(tiras): 2, str(agujas): 0})
+        self.assertEqual(Insumo.objects.get(pk=tiras).stock_actual, 2)
+        # una sola alerta para tiras aunque tenga dos movimientos
+        alertas = _as_list(self.client.get("/api/alertas/?activas=true").data)
+        self.assertEqual(sum(a["tipo"] == "stock_bajo" for a in alertas), 1)
+
+    def test_movimientos_bulk_todo_o_nada(self):
+        tiras = self.crear_insumo_api(stock_actual=5)
+        agujas = self.crear_insumo_api(nombre="Agujas", tipo="AGU", stock_actual=1)
+        r = self.client.post(
+            "/api/insumos/movimientos_bulk/",
+            [
+                {"insumo_id": tiras, "cantidad": -1},
+                {"insumo_id": agujas, "cantidad": -2},
+            ],
+            format="json",
+        )
+        self.assertEqual(r.status_code, 400, r.content)
+        self.assertEqual(r.data["insumos"], [str(agujas)])
+        self.assertEqual(Insumo.objects.get(pk=tiras).stock_actual, 5)
+        self.assertFalse(MovimientoInsumo.objects.exists())
+
+    def test_movimientos_bulk_insumo_ajeno(self):
+        otro = User.objects.create_user("otro", password="x")
+        ajeno = Insumo.objects.create(
+            paciente=Paciente.objects.get(usuario=otro), nombre="X", tipo="TIR"
+        )
+        r = self.client.post(
+            "/api/insumos/movimientos_bulk/",
+            {"items": [{"insumo_id": ajeno.pk, "cantidad": 1}]},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 400, r.content)
+        self.assertEqual(Insumo.objects.get(pk=ajeno.pk).stock_actual, 0)
+
+    def test_movimientos_paginados(self):
+        insumo_id = self.crear_insumo_api()
+        items = [{"insumo_id": insumo_id, "cantidad": 1, "motivo": "compra"}] * 5
+        self.client.post("/api/insumos/movimientos_bulk/", items, format="json")
+        r = self.client.get(f"/api/insumos/{insumo_id}/movimientos/?page_size=2")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(len(r.data["results"]), 2)
+        self.assertIsNotNone(r.data["next"])
+
+    def test_edicion_stock_queda_en_libro(self):
+        insumo_id = self.crear_insumo_api(stock_actual=3)
+        self.assertEqual(CheckpointInsumo.objects.get(insumo_id=insumo_id).saldo, 3)
+        r = self.client.patch(
+            f"/api/insumos/{insumo_id}/", {"stock_actual": 7}, format="json"
+        )
+        self.assertEqual(r.status_code, 200, r.content)
+        mov = MovimientoInsumo.objects.get(insumo_id=insumo_id)
+        self.assertEqual((mov.cantidad, mov.motivo), (4, "ajuste"))
+        self.assertEqual(reconciliar(), [])
+
+    def test_edicion_no_pisa_movimiento_concurrente(self):
+        insumo_id = self.crear_insumo_api(stock_actual=5)
+        get_object = InsumoViewSet.get_object
+
+        def con_movimiento(vista):
+            obj = get_object(vista)
+            registrar_movimiento(insumo_id, -2)  # llega tras leer la instancia
+            return obj
+
+        with mock.patch.object(InsumoViewSet, "get_object", con_movimiento):
+            r = self.client.patch(
+                f"/api/insumos/{insumo_id}/", {"nombre": "Tiras XL"}, format="json"
+            )
+            self.assertEqual(r.status_code, 200, r.content)
+            self.assertEqual(Insumo.objects.get(pk=insumo_id).stock_actual, 3)
+            r = self.client.patch(
+                f"/api/insumos/{insumo_id}/", {"stock_actual": 10}, format="json"
+            )
+        self.assertEqual(r.status_code, 200, r.content)
+        ajuste = MovimientoInsumo.objects.get(insumo_id=insumo_id, motivo="ajuste")
+        self.assertEqual(ajuste.cantidad, 9)  # 10 - (3 - 2)
+        self.assertEqual(reconciliar(), [])
+
+    def test_reconciliar_no_pisa_movimiento_concurrente(self):
+        insumo_id = self.crear_insumo_api(stock_actual=10)
+        Insumo.objects.filter(pk=insumo_id).update(stock_actual=99)
+        descuadres = saldos._descuadres
+        llamadas = []
+
+        def con_movimiento(qs):
+            filas = descuadres(qs)
+            if not llamadas:
+                llamadas.append(filas)
+                registrar_movimiento(insumo_id, -1)  # entre lectura y correccion
+            return filas
+
+        with mock.patch.object(saldos, "_descuadres", con_movimiento):
+            reconciliar(corregir=True)
+        self.assertEqual(Insumo.objects.get(pk=insumo_id).stock_actual, 9)
+        self.assertEqual(reconciliar(), [])
+
+    def test_compactar_y_reconciliar(self):
+        insumo_id = self.crear_insumo_api(stock_actual=10)
+        for cantidad in (-1, -2, 5):
+            registrar_movimiento(insumo_id, cantidad)
+        # los dos primeros pasan a ser historial antiguo
+        viejos = MovimientoInsumo.objects.filter(insumo_id=insumo_id).order_by("id")
+        hace = timezone.now() - timedelta(days=200)
+        for i, mov in enumerate(viejos[:2]):
+            MovimientoInsumo.objects.filter(pk=mov.pk).update(
+                fecha=hace + timedelta(minutes=i)
+            )
+        CheckpointInsumo.objects.filter(insumo_id=insumo_id).update(
+            fecha=hace - timedelta(days=1)
+        )
+
+        call_command("compact_movimientos", "--dias", "180", stdout=io.StringIO())
+        self.assertEqual(
+            MovimientoInsumo.objects.filter(insumo_id=insumo_id).count(), 1
+        )
+        cp = CheckpointInsumo.objects.filter(insumo_id=insumo_id).first()
+        self.assertEqual((cp.saldo, cp.movimientos), (7, 2))
+        call_command("reconcile_stock", stdout=io.StringIO())
+
+        # un descuadre se detecta y se corrige desde el libro
+        Insumo.objects.filter(pk=insumo_id).update(stock_actual=99)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_stock", stdout=io.StringIO())
+        call_command("reconcile_stock", "--corregir", stdout=io.StringIO())
+        self.assertEqual(Insumo.objects.get(pk=insumo_id).stock_actual, 12)
+
+    def test_scan_inventory(self):
+        pac = Paciente.objects.get(usuario=self.user)
+        bajos = [
+            Insumo.objects.create(
+                paciente=pac, nombre=f"I{i}", tipo="OTR", stock_minimo=3
+            )
+            for i in range(3)
+        ]
+        Insumo.objects.create(paciente=pac, nombre="Ok", tipo="OTR", stock_actual=9)
+        registrar_movimiento(bajos[0].pk, 1)  # ya deja su alerta activa
+        alertas = Alerta.objects.filter(tipo="stock_bajo")
+        self.assertEqual(
+            list(alertas.values_list("insumo_id", flat=True)), [bajos[0].pk]
+        )
+
+        out = io.StringIO()
+        call_command("scan_inventory", "--dry-run", stdout=out)
+        self.assertIn("se crearian: 2", out.getvalue())
+        self.assertEqual(alertas.count(), 1)
+
+        call_command("scan_inventory", "--batch-size", "1", stdout=io.StringIO())
+        self.assertEqual(
+            sorted(alertas.values_list("insumo_id", flat=True)),
+            [i.pk for i in bajos],
+        )
+        out = io.StringIO()
+        call_command("scan_inventory", stdout=out)
+        self.assertIn("creadas: 0", out.getvalue())
+
+    def test_alerta_stock_bajo_sin_duplicados(self):
+        insumo_id = self.crear_insumo_api(stock_actual=10, stock_minimo=8)
+        for _ in range(5):
+            registrar_movimiento(insumo_id, -1)
+        alertas = Alerta.objects.filter(insumo_id=insumo_id, activa=True)
+        self.assertEqual(alertas.count(), 1)
+        self.assertIn(": 5u", alertas.get().mensaje)  # mensaje refrescado
+
+        # sin ON CONFLICT: update y, si no hay fila, insert
+        with mock.patch.object(
+            connection.features, "supports_update_conflicts_with_target", False
+        ):
+            registrar_movimiento(insumo_id, -1)
+            self.assertIn(": 4u", alertas.get().mensaje)
+            # atendida la anterior, la siguiente salida abre una nueva
+            alertas.update(activa=False)
+            registrar_movimiento(insumo_id, -1)
+        self.assertEqual(alertas.count(), 1)
+        self.assertEqual(Alerta.objects.filter(insumo_id=insumo_id).count(), 2)
+
+    def test_scan_caducidad(self):
+        pac = Paciente.objects.get(usuario=self.user)
+        hoy = timezone.localdate()
+
+        def crear(nombre, dias):
+            return Insumo.objects.create(
+                paciente=pac,
+                nombre=nombre,
+                tipo="INS",
+                stock_actual=3,
+                caduca_en=hoy + timedelta(days=dias) if dias is not None else None,
+            )
+
+        caducado, pronto = crear("Vial A", -2), crear("Vial B", 10)
+        crear("Vial C", 60), crear("Sin fecha", None)
+        alertas = Alerta.objects.filter(tipo="caducidad", activa=True)
+
+        call_command("scan_caducidad", "--dias", "30", stdout=io.StringIO())
+        call_command("scan_caducidad", "--dias", "30", stdout=io.StringIO())
+        self.assertEqual(
+            sorted(alertas.values_list("insumo_id", flat=True)),
+            [caducado.pk, pronto.pk],
+        )
+        self.assertIn("caducó", alertas.get(insumo=caducado).mensaje)
+
+        call_command("scan_caducidad", "--retirar", stdout=io.StringIO())
+        caducado.refresh_from_db()
+        self.assertEqual(caducado.stock_actual, 0)
+        mov = caducado.movimientos.get()
+        self.assertEqual((mov.cantidad, mov.motivo), (-3, "caducidad"))
+        # sin stock ya no hay nada que avisar: su alerta se cierra
+        self.assertEqual(list(alertas.values_list("insumo_id", flat=True)), [pronto.pk])
+        self.assertEqual(reconciliar(), [])
+
+    def test_scan_caducidad_solo_escribe_cambios(self):
+        pac = Paciente.objects.get(usuario=self.user)
+        hoy = timezone.localdate()
+        vial = Insumo.objects.create(
+            paciente=pac,
+            nombre="Vial",
+            tipo="INS",
+            stock_actual=3,
+            caduca_en=hoy + timedelta(days=5),
+        )
+        alertas = Alerta.objects.filter(insumo=vial, tipo="caducidad")
+        call_command("scan_caducidad", stdout=io.StringIO())
+        hace_rato = timezone.now() - timedelta(hours=1)
+        alertas.update(actualizado_en=hace_rato)
+
+        # sin cambios no se toca la alerta (los clientes no la re-descargan)
+        out = io.StringIO()
+        call_command("scan_caducidad", stdout=out)
+        self.assertIn("Alertas escritas: 0", out.getvalue())
+        self.assertEqual(alertas.get().actualizado_en, hace_rato)
+
+        # atendida para esa fecha: no se reabre, ni al pasar a "caducó"
+        alertas.update(activa=False, atendida_en=timezone.now())
+        call_command("scan_caducidad", stdout=io.StringIO())
+        with mock.patch(
+            "django.utils.timezone.localdate", return_value=hoy + timedelta(days=6)
+        ):
+            call_command("scan_caducidad", stdout=io.StringIO())
+        self.assertFalse(alertas.filter(activa=True).exists())
+
+        # un lote nuevo con otra fecha si vuelve a avisar
+        Insumo.objects.filter(pk=vial.pk).update(caduca_en=hoy + timedelta(days=20))
+        call_command("scan_caducidad", stdout=io.StringIO())
+        nueva = alertas.get(activa=True)
+        self.assertEqual(nueva.caduca_en, hoy + timedelta(days=20))
+        self.assertEqual(alertas.count(), 2)
+
+    def test_admin_de_movimientos_es_solo_lectura(self):
+        insumo_id = self.crear_insumo_api(stock_actual=5)
+        mov, _ = registrar_movimiento(insumo_id, -1)
+        User.objects.create_superuser("admin", password="admin1234")
+        self.client.credentials()
+        self.client.login(username="admin", password="admin1234")
+        base = "/admin/insumos/movimientoinsumo/"
+        self.assertEqual(self.client.get(base).status_code, 200)
+        self.assertEqual(self.client.get(f"{base}add/").status_code, 403)
+        r = self.client.post(
+            f"{base}{mov.pk}/change/",
+            {"insumo": insumo_id, "cantidad": -50, "motivo": "uso"},
+        )
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(self.client.get(f"{base}{mov.pk}/delete/").status_code, 403)
+        mov.refresh_from_db()
+        self.assertEqual(mov.cantidad, -1)
+        self.assertEqual(Insumo.objects.get(pk=insumo_id).stock_actual, 4)
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "requiere escrituras concurrentes reales"
+)
+class MovimientoConcurrenteTest(TransactionTestCase):
+    def test_consumos_concurrentes_no_dejan_negativo(self):
+        user = User.objects.create_user("conc", password="x")
+        pac, _ = Paciente.objects.get_or_create(usuario=user)
+        insumo = Insumo.objects.create(
+            paciente=pac, nombre="Tiras", tipo="TIR", stock_actual=20
+        )
+        hilos, ok, rechazados = 8, [], []
+        barrera = threading.Barrier(hilos)
+
+        def consumir():
+            barrera.wait()
+            try:
+                for _ in range(5):
+                    try:
+                        registrar_movimiento(insumo.pk, -1)
+                        ok.append(1)
+                    except StockNegativo:
+                        rechazados.append(1)
+            finally:
+                connection.close()
+
+        ts = [threading.Thread(target=consumir) for _ in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        insumo.refresh_from_db()
+        self.assertEqual(len(ok), 20)
+        self.assertEqual(len(rechazados), hilos * 5 - 20)
+        self.assertEqual(insumo.stock_actual, 0)
+        self.assertEqual(insumo.movimientos.count(), 20)
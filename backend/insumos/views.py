@@ -1,9 +1,30 @@
+from core.cache import invalidar
+from django.db import transaction
+from django.http import Http404
 from drf_spectacular.utils import OpenApiExample, extend_schema
 from pacientes.models import Paciente
-from rest_framework import decorators, permissions, response, status, viewsets
+from rest_framework import (
+    decorators,
+    permissions,
+    response,
+    serializers,
+    status,
+    viewsets,
+)
 
 from .models import Insumo, MovimientoInsumo
-from .serializers import InsumoSerializer, MovimientoSerializer
+from .pagination import MovimientoPagination
+from .serializers import (
+    InsumoSerializer,
+    MovimientoLoteSerializer,
+    MovimientoSerializer,
+)
+from .services import (
+    MAX_MOVIMIENTOS_LOTE,
+    StockNegativo,
+    registrar_movimiento,
+    registrar_movimientos,
+)
 
 
 @extend_schema(
@@ -36,18 +57,107 @@ class InsumoViewSet(viewsets.ModelViewSet):
         return paciente
 
     def perform_create(self, serializer):
-        serializer.save(paciente=self._get_or_create_paciente(self.request.user))
+        insumo = serializer.save(
+            paciente=self._get_or_create_paciente(self.request.user)
+        )
+        invalidar("insumos", insumo.paciente_id)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # releo con bloqueo: la instancia de get_object puede ir por detras
+            # de un movimiento y save() escribiria su stock viejo
+            serializer.instance = Insumo.objects.select_for_update().get(
+                pk=serializer.instance.pk
+            )
+            anterior = serializer.instance.stock_actual
+            insumo = serializer.save()
+            # una edicion manual del stock queda en el libro como ajuste
+            if insumo.stock_actual != anterior:
+                MovimientoInsumo.objects.create(
+                    insumo=insumo,
+                    cantidad=insumo.stock_actual - anterior,
+                    motivo="ajuste",
+                    nota="edición manual",
+                )
+        invalidar("insumos", insumo.paciente_id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidar("insumos", instance.paciente_id)
 
     @decorators.action(detail=True, methods=["get", "post"], url_path="movimientos")
     def movimientos(self, request, pk=None):
-        insumo = self.get_queryset().get(pk=pk)
         if request.method.lower() == "get":
-            qs = insumo.movimientos.all()
-            ser = MovimientoSerializer(qs, many=True)
-            return response.Response(ser.data)
-        ser = MovimientoSerializer(data=request.data, context={"insumo": insumo})
+            insumo = self.get_object()
+            paginador = MovimientoPagination()
+            pagina = paginador.paginate_queryset(
+                insumo.movimientos.all(), request, view=self
+            )
+            ser = MovimientoSerializer(pagina, many=True)
+            return paginador.get_paginated_response(ser.data)
+        ser = MovimientoSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        mov = MovimientoInsumo.objects.create(insumo=insumo, **ser.validated_data)
+        # UPDATE condicional + INSERT en una transaccion (sin releer el insumo)
+        try:
+            mov, stock = registrar_movimiento(
+                pk,
+                paciente_id=self._get_or_create_paciente(request.user).pk,
+                **ser.validated_data,
+            )
+        except Insumo.DoesNotExist:
+            raise Http404
+        except StockNegativo as e:
+            raise serializers.ValidationError(str(e))
         return response.Response(
-            MovimientoSerializer(mov).data, status=status.HTTP_201_CREATED
+            {**MovimientoSerializer(mov).data, "stock_actual": stock},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        tags=["Insumos"],
+        request=MovimientoLoteSerializer(many=True),
+        examples=[
+            OpenApiExample(
+                "Recogida en farmacia",
+                value={
+                    "items": [
+                        {"insumo_id": 1, "cantidad": 50, "motivo": "compra"},
+                        {"insumo_id": 2, "cantidad": 10, "motivo": "compra"},
+                    ]
+                },
+                request_only=True,
+            )
+        ],
+    )
+    @decorators.action(detail=False, methods=["post"], url_path="movimientos_bulk")
+    def movimientos_bulk(self, request):
+        """
+        Varios movimientos en una transaccion. Cuerpo:
+        {"items":[{"insumo_id":1,"cantidad":-1,"motivo":"uso","nota":""}, ...]}
+        (tambien se acepta la lista directamente). Todo o nada.
+        """
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get("items")
+        if not isinstance(items, list) or not items:
+            raise serializers.ValidationError({"items": "Debe ser una lista no vacía."})
+        if len(items) > MAX_MOVIMIENTOS_LOTE:
+            raise serializers.ValidationError(
+                {"items": f"Máximo {MAX_MOVIMIENTOS_LOTE} movimientos por petición."}
+            )
+        ser = MovimientoLoteSerializer(data=items, many=True)
+        ser.is_valid(raise_exception=True)
+        paciente = self._get_or_create_paciente(request.user)
+        try:
+            movs, stocks = registrar_movimientos(paciente.pk, ser.validated_data)
+        except Insumo.DoesNotExist as e:
+            raise serializers.ValidationError({"insumo_id": str(e)})
+        except StockNegativo as e:
+            raise serializers.ValidationError({"detail": str(e), "insumos": e.insumos})
+        return response.Response(
+            {
+                "movimientos": MovimientoLoteSerializer(movs, many=True).data,
+                "stock": {str(pk): s for pk, s in stocks.items()},
+            },
+            status=status.HTTP_201_CREATED,
         )
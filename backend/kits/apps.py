@@ -1,6 +1,12 @@
+import importlib
+
 from django.apps import AppConfig
 
 
 class KitsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "kits"
+
+    def ready(self):
+        # cargo las señales al iniciar la app, sin gatillar F401
+        importlib.import_module("kits.signals")
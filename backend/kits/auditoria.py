@@ -0,0 +1,250 @@
+# auditoria de verificaciones publicas con escritura diferida (write-behind):
+# cada verificacion se apunta en un spool local, un fichero por proceso, y un
+# hilo en segundo plano la vuelca a la BD con bulk_create al llegar a
+# KIT_VERIFICACION_LOTE filas o tras KIT_VERIFICACION_FLUSH_SEGUNDOS;
+# la peticion nunca espera al INSERT. El spool debe estar en un volumen
+# persistente (KIT_VERIFICACION_SPOOL): los de procesos muertos se reproducen
+# en el siguiente volcado o con `manage.py flush_verificaciones`.
+# Durabilidad: write+flush deja la fila en el kernel (sobrevive a la caida del
+# proceso); el fsync, que protege de una caida de la maquina, se agrupa como
+# mucho uno cada KIT_VERIFICACION_FSYNC_SEGUNDOS (0 = uno por verificacion).
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Kit, VerificacionKit
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = "verificaciones-"
+
+_lock = threading.RLock()  # el fichero abierto y _estado
+_volcado = threading.Lock()  # un volcado a la vez (no bloquea a registrar)
+_estado = {
+    "pid": None,
+    "fh": None,
+    "pendientes": 0,
+    "ultimo": 0.0,
+    "timer": None,
+    "huerfanos": False,
+    "fsync": None,  # monotonic del ultimo fsync del spool abierto
+}
+
+
+def _directorio():
+    d = Path(settings.KIT_VERIFICACION_SPOOL)
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _abrir():
+    fh = open(_directorio() / f"{PREFIJO}{os.getpid()}.jsonl", "a+", encoding="utf-8")
+    fcntl.flock(fh, fcntl.LOCK_EX)
+    fh.seek(0, os.SEEK_END)
+    return fh
+
+
+def _spool():
+    # fichero propio del proceso, bloqueado (flock) mientras el proceso vive:
+    # asi otro proceso distingue un spool activo de uno huerfano
+    if _estado["pid"] != os.getpid():
+        if _estado["fh"] is not None:
+            # hijo tras un fork: suelto la copia heredada del padre
+            _estado["fh"].close()
+        fh = _abrir()
+        _estado.update(
+            pid=os.getpid(),
+            fh=fh,
+            # restos de un proceso anterior con el mismo pid: se vuelcan con lo nuevo
+            pendientes=1 if fh.tell() else 0,
+            ultimo=time.monotonic(),
+            timer=None,
+            huerfanos=False,
+            fsync=None,
+        )
+    return _estado["fh"]
+
+
+def registrar(kit_id, resultado_ok, faltantes, origen="qr"):
+    if settings.KIT_VERIFICACION_MODO != "buffer":
+        VerificacionKit.objects.create(
+            kit_id=kit_id,
+            origen=origen,
+            resultado_ok=resultado_ok,
+            faltantes_json=faltantes,
+        )
+        return
+
+    fila = {
+        "kit_id": kit_id,
+        "origen": origen,
+        "resultado_ok": resultado_ok,
+        "faltantes_json": faltantes,
+        "creado_en": timezone.now().isoformat(),
+    }
+    with _lock:
+        fh = _spool()
+        fh.write(json.dumps(fila) + "\n")
+        fh.flush()
+        ahora = time.monotonic()
+        ultimo = _estado["fsync"]
+        if ultimo is None or ahora - ultimo >= settings.KIT_VERIFICACION_FSYNC_SEGUNDOS:
+            # fsync agrupado: uno por intervalo, no uno por peticion en serie
+            os.fsync(fh.fileno())
+            _estado["fsync"] = ahora
+        _estado["pendientes"] += 1
+        lleno = _estado["pendientes"] >= settings.KIT_VERIFICACION_LOTE
+        _programar(0 if lleno else settings.KIT_VERIFICACION_FLUSH_SEGUNDOS)
+
+
+def _programar(espera):
+    # volcado en segundo plano: por tamaño en cuanto se llena el lote, por
+    # tiempo aunque no lleguen mas verificaciones
+    t = _estado["timer"]
+    if t is not None:
+        if espera or not t.interval:
+            return
+        t.cancel()
+    t = threading.Timer(espera, _volcar_en_hilo)
+    t.daemon = True
+    _estado["timer"] = t
+    t.start()
+
+
+def _volcar_en_hilo():
+    try:
+        volcar()
+    except Exception:
+        # las filas siguen en un spool: se reintenta en el siguiente volcado
+        logger.exception("no se pudo volcar el spool de verificaciones")
+    finally:
+        connection.close()  # el hilo no debe dejar conexiones abiertas
+
+
+def _leer(fh):
+    filas = []
+    for linea in fh:
+        try:
+            filas.append(json.loads(linea))
+        except ValueError:
+            # ultima linea a medias tras una caida: se descarta
+            logger.warning("linea corrupta en el spool de verificaciones")
+    return filas
+
+
+def _insertar(filas):
+    if not filas:
+        return 0
+    # un kit borrado entre la verificacion y el volcado rompe la FK del lote
+    vivos = set(
+        Kit.objects.filter(pk__in={f["kit_id"] for f in filas}).values_list(
+            "pk", flat=True
+        )
+    )
+    objs = [
+        VerificacionKit(
+            kit_id=f["kit_id"],
+            origen=f["origen"],
+            resultado_ok=f["resultado_ok"],
+            faltantes_json=f["faltantes_json"],
+            creado_en=parse_datetime(f["creado_en"]),
+        )
+        for f in filas
+        if f["kit_id"] in vivos
+    ]
+    with transaction.atomic():
+        VerificacionKit.objects.bulk_create(objs, batch_size=500)
+    return len(objs)
+
+
+def _rotar():
+    # aparto el spool lleno (sigue bloqueado por su fh) y abro uno nuevo: las
+    # peticiones siguen apuntando mientras el volcado hace el INSERT
+    fh = _estado["fh"]
+    if fh is None or _estado["pid"] != os.getpid() or not fh.tell():
+        return None
+    actual = Path(fh.name)
+    apartado = actual.with_name(f"{PREFIJO}{os.getpid()}-{time.time_ns()}.jsonl")
+    os.rename(actual, apartado)
+    _estado.update(fh=_abrir(), pendientes=0, ultimo=time.monotonic(), fsync=None)
+    return fh, apartado
+
+
+def volcar():
+    """Vuelca a la BD el spool de este proceso (y los huerfanos la primera vez)."""
+    n = 0
+    with _volcado:
+        with _lock:
+            if _estado["timer"] is not None:
+                _estado["timer"].cancel()
+                _estado["timer"] = None
+            apartado = _rotar()
+        if apartado is not None:
+            fh, path = apartado
+            try:
+                fh.seek(0)
+                n = _insertar(_leer(fh))
+            except Exception:
+                # suelto el flock: queda como huerfano y se reproduce despues
+                _estado["huerfanos"] = False
+                raise
+            else:
+                path.unlink()
+            finally:
+                fh.close()
+        if not _estado["huerfanos"]:
+            n += reproducir_huerfanos()
+            _estado["huerfanos"] = True
+    return n
+
+
+def reproducir_huerfanos():
+    """Vuelca los spools de procesos que ya no existen. Devuelve filas insertadas."""
+    d = Path(settings.KIT_VERIFICACION_SPOOL)
+    if not d.is_dir():
+        return 0
+    n = 0
+    for path in sorted(d.glob(f"{PREFIJO}*.jsonl")):
+        if path.name == f"{PREFIJO}{os.getpid()}.jsonl":
+            continue
+        try:
+            fh = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            continue  # otro worker lo volco entre el glob y el open
+        with fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # su proceso sigue vivo y lo volcara el
+            if os.fstat(fh.fileno()).st_nlink == 0:
+                continue  # otro worker lo volco y lo borro mientras esperabamos
+            n += _insertar(_leer(fh))
+            path.unlink()
+    return n
+
+
+def _cerrar():
+    # al salir del proceso: vuelco lo pendiente; si falla queda en el spool
+    try:
+        volcar()
+    except Exception:
+        logger.exception("spool de verificaciones sin volcar al salir")
+    with _lock:
+        if _estado["timer"] is not None:
+            _estado["timer"].cancel()
+        if _estado["fh"] is not None and _estado["pid"] == os.getpid():
+            _estado["fh"].close()
+        _estado.update(pid=None, fh=None, pendientes=0, timer=None)
+
+
+atexit.register(_cerrar)
@@ -0,0 +1,49 @@
+# payload publico del kit por token: los escaneos del QR no tocan la BD
+from core import cache as versiones
+from django.core.cache import cache
+
+from .models import ElementoKit, Kit
+
+KIT_PUBLICO_SEGUNDOS = 60 * 60
+NO_EXISTE = "no-existe"  # cache negativa: tokens invalidos o kits inactivos
+
+
+# version por token (core.cache, cache compartida): desactivar o rotar en un
+# worker deja de servirse en todos, y la subida tras el commit descarta lo que
+# otro lector cacheara con el estado anterior mientras tanto
+def _clave(token):
+    return versiones.clave("kit_publico", token, "payload")
+
+
+def payload_publico(token):
+    """
+    {"kit_id", "kit": {nombre, descripcion}, "elementos": [...]} del kit activo
+    con ese token, o None. Se invalida al editar/rotar/desactivar el kit o sus
+    elementos (kits.signals y KitViewSet.elementos).
+    """
+    datos = cache.get(_clave(token))
+    if datos is None:
+        kit = (
+            Kit.objects.filter(token_publico=token, activo=True)
+            .values("pk", "nombre", "descripcion")
+            .first()
+        )
+        if kit is None:
+            datos = NO_EXISTE
+        else:
+            datos = {
+                "kit_id": kit["pk"],
+                "kit": {"nombre": kit["nombre"], "descripcion": kit["descripcion"]},
+                "elementos": list(
+                    ElementoKit.objects.filter(kit_id=kit["pk"])
+                    .order_by("id")
+                    .values("etiqueta", "cantidad_requerida", "unidad")
+                ),
+            }
+        cache.set(_clave(token), datos, KIT_PUBLICO_SEGUNDOS)
+    return None if datos == NO_EXISTE else datos
+
+
+def invalidar_kit(*tokens):
+    for token in {t for t in tokens if t}:
+        versiones.invalidar("kit_publico", token)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("kits", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="verificacionkit",
+            name="creado_en",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -2,6 +2,7 @@ import secrets
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 # funcion para obtener el token
@@ -56,7 +57,8 @@ class VerificacionKit(models.Model):
     )
     resultado_ok = models.BooleanField(default=False)
     faltantes_json = models.JSONField(default=dict)  # {"Tiras": 1, "Agujas": 2}
-    creado_en = models.DateTimeField(auto_now_add=True)
+    # default y no auto_now_add: el volcado diferido conserva la hora real
+    creado_en = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["-id"]
@@ -1,27 +1,31 @@
-from django.shortcuts import get_object_or_404
+from core.http import con_etag
+from django.http import Http404
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Kit, VerificacionKit
+from . import auditoria
+from .cache import payload_publico
 from .views import QRAnonRateThrottle  # 10/min por IP
 
+# publico pero corto: un kit desactivado deja de verse en menos de un minuto
+PUBLICO_CACHE_CONTROL = "public, max-age=30"
+
 
 class PublicKitView(APIView):
     permission_classes = [AllowAny]
     throttle_classes = [QRAnonRateThrottle]
 
     def get(self, request, token):
-        kit = get_object_or_404(Kit, token_publico=token, activo=True)
-        elementos = list(
-            kit.elementos.values("etiqueta", "cantidad_requerida", "unidad")
-        )
-        return Response(
-            {
-                "kit": {"nombre": kit.nombre, "descripcion": kit.descripcion},
-                "elementos": elementos,
-            }
+        datos = payload_publico(token)
+        if datos is None:
+            raise Http404
+        # escaneos repetidos: 304 desde la cache sin tocar la BD
+        return con_etag(
+            request,
+            {"kit": datos["kit"], "elementos": datos["elementos"]},
+            PUBLICO_CACHE_CONTROL,
         )
 
 
@@ -39,7 +43,9 @@ class PublicKitVerifyView(APIView):
           ]
         }
         """
-        kit = get_object_or_404(Kit, token_publico=token, activo=True)
+        datos = payload_publico(token)
+        if datos is None:
+            raise Http404
 
         payload = request.data or {}
         items = payload.get("items", [])
@@ -60,21 +66,17 @@ class PublicKitVerifyView(APIView):
 
         # Calcula faltantes
         faltantes = {}
-        for e in kit.elementos.all():
-            req = e.cantidad_requerida
-            got = provistos.get(e.etiqueta, 0)
+        for e in datos["elementos"]:
+            req = e["cantidad_requerida"]
+            got = provistos.get(e["etiqueta"], 0)
             falt = max(0, req - got)
             if falt:
-                faltantes[e.etiqueta] = falt
+                faltantes[e["etiqueta"]] = falt
 
         ok = not faltantes
 
-        VerificacionKit.objects.create(
-            kit=kit,
-            origen="qr",
-            resultado_ok=ok,
-            faltantes_json=faltantes,
-        )
+        # write-behind: en modo buffer no espera al INSERT
+        auditoria.registrar(datos["kit_id"], ok, faltantes)
 
         return Response(
             {"resultado_ok": ok, "faltantes": faltantes},
@@ -0,0 +1,38 @@
+# imagenes QR cacheadas por contenido: la clave es el hash de la URL publica, asi
+# que una URL ya renderizada nunca se vuelve a generar (y rotar el token cambia
+# la URL y, con ella, la clave)
+import hashlib
+import io
+
+import qrcode
+from django.core.cache import cache
+from qrcode.image.svg import SvgPathImage
+
+FORMATOS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_CACHE_SEGUNDOS = 7 * 24 * 60 * 60
+
+
+def _clave(url, formato):
+    return f"qr:{formato}:{hashlib.sha256(url.encode()).hexdigest()}"
+
+
+def _render(url, formato):
+    if formato == "svg":
+        return qrcode.make(url, image_factory=SvgPathImage).to_string()
+    buf = io.BytesIO()
+    qrcode.make(url).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def imagen_qr(url, formato="png"):
+    """Bytes del QR de `url` en `formato` (png|svg), renderizado una sola vez."""
+    clave = _clave(url, formato)
+    contenido = cache.get(clave)
+    if contenido is None:
+        contenido = _render(url, formato)
+        cache.set(clave, contenido, QR_CACHE_SEGUNDOS)
+    return contenido
+
+
+def olvidar_qr(url):
+    cache.delete_many([_clave(url, f) for f in FORMATOS])
@@ -0,0 +1,38 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidar_kit
+from .models import ElementoKit, Kit
+
+
+# guardo el token anterior: al rotarlo hay que olvidar tambien el viejo
+@receiver(pre_save, sender=Kit)
+def recordar_token_anterior(sender, instance, **kwargs):
+    instance._token_anterior = None
+    if instance.pk:
+        instance._token_anterior = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("token_publico", flat=True)
+            .first()
+        )
+
+
+# edicion, rotacion, (des)activacion o borrado del kit
+@receiver(post_save, sender=Kit)
+@receiver(post_delete, sender=Kit)
+def invalidar_payload_kit(sender, instance, **kwargs):
+    invalidar_kit(instance.token_publico, getattr(instance, "_token_anterior", None))
+
+
+# cambios sueltos de elementos (admin); el bulk de la API y el borrado en
+# cascada del kit ya invalidan por su cuenta
+@receiver(post_save, sender=ElementoKit)
+@receiver(post_delete, sender=ElementoKit)
+def invalidar_payload_elemento(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, (QuerySet, Kit)):
+        return
+    token = Kit.objects.filter(pk=instance.kit_id).values_list(
+        "token_publico", flat=True
+    )
+    invalidar_kit(*token)
@@ -1,9 +1,31 @@
+import fcntl
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from core.checks import contador_throttle, spool_persistente
+from core.models import ContadorThrottle
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from kits import auditoria
+from kits import cache as kit_cache
+from kits import qr
+from kits.models import Kit, VerificacionKit
 from rest_framework.test import APITestCase
 
 
+@override_settings(KIT_VERIFICACION_MODO="sync")
 class KitsQRAPITest(APITestCase):
     def setUp(self):
+        # el throttle y las imagenes QR viven en la cache
+        cache.clear()
         User.objects.create_user("daniel", password="daniel 1234")
         r = self.client.post(
             "/api/auth/token/",
@@ -87,3 +109,457 @@ class KitsQRAPITest(APITestCase):
         assert r.status_code == 200
         assert r.data["resultado_ok"] is False
         assert r.data["faltantes"].get("Tiras") == 1
+
+    def test_qr_binario_con_etag_y_cache(self):
+        kid = self.crear_kit_con_elementos()["id"]
+        with mock.patch.object(qr, "_render", wraps=qr._render) as render:
+            r = self.client.get(f"/api/kits/{kid}/qr/?formato=png")
+            assert r.status_code == 200
+            assert r["Content-Type"] == "image/png"
+            assert r.content.startswith(b"\x89PNG")
+            etag = r["ETag"]
+            assert r["Cache-Control"]
+
+            r = self.client.get(
+                f"/api/kits/{kid}/qr/?formato=png", HTTP_IF_NONE_MATCH=etag
+            )
+            assert r.status_code == 304
+            # el JSON reutiliza el PNG ya renderizado
+            self.client.get(f"/api/kits/{kid}/qr/")
+            assert render.call_count == 1
+
+        r = self.client.get(
+            f"/api/kits/{kid}/qr/?formato=svg", HTTP_ACCEPT="image/svg+xml"
+        )
+        assert r["Content-Type"] == "image/svg+xml"
+        assert b"<svg" in r.content
+
+    def test_qr_compacto_y_formato_invalido(self):
+        kid = self.crear_kit_con_elementos()["id"]
+        data = self.client.get(f"/api/kits/{kid}/qr/?compacto=true").json()
+        assert "png" not in data
+        assert data["data_url"].startswith("data:image/png;base64,")
+        r = self.client.get(f"/api/kits/{kid}/qr/?formato=gif")
+        assert r.status_code == 400
+        # pidiendo imagen, los errores y el JSON salen igualmente en JSON
+        for url, estado in (
+            (f"/api/kits/{kid}/qr/?formato=gif", 400),
+            ("/api/kits/999999/qr/?formato=png", 404),
+            (f"/api/kits/{kid}/qr/", 200),
+        ):
+            r = self.client.get(url, HTTP_ACCEPT="image/png")
+            assert r.status_code == estado, r.content
+            assert r["Content-Type"] == "application/json"
+            assert r.json()
+
+    def test_rotate_token_invalida_qr(self):
+        k = self.crear_kit_con_elementos()
+        viejo = self.client.get(f"/api/kits/{k['id']}/qr/?formato=png")
+        url_vieja = self.client.get(f"/api/kits/{k['id']}/qr/").json()["url"]
+        assert cache.get(qr._clave(url_vieja, "png")) is not None
+
+        self.client.post(f"/api/kits/{k['id']}/rotate_token/")
+        assert cache.get(qr._clave(url_vieja, "png")) is None
+        r = self.client.get(
+            f"/api/kits/{k['id']}/qr/?formato=png",
+            HTTP_IF_NONE_MATCH=viejo["ETag"],
+        )
+        assert r.status_code == 200
+        assert r["ETag"] != viejo["ETag"]
+
+    def test_public_get_cacheado_con_etag(self):
+        k = self.crear_kit_con_elementos()
+        url = f"/qr/{k['token_publico']}"
+        self.client.credentials()  # anonimo, como un escaneo real
+        r = self.client.get(url)
+        assert r.status_code == 200 and r["ETag"]
+        assert "public" in r["Cache-Control"]
+        # la unica consulta es el contador compartido del throttle
+        with self.assertNumQueries(1):
+            r2 = self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+        assert r2.status_code == 304
+        with self.assertNumQueries(1):
+            assert self.client.get(url).data == r.data
+
+    def test_public_cache_se_invalida(self):
+        k = self.crear_kit_con_elementos()
+        kid, url = k["id"], f"/qr/{k['token_publico']}"
+        assert len(self.client.get(url).data["elementos"]) == 2
+
+        # elementos (bulk)
+        self.client.post(
+            f"/api/kits/{kid}/elementos/",
+            {"items": [{"etiqueta": "Zumo", "cantidad_requerida": 1}]},
+            format="json",
+        )
+        assert [e["etiqueta"] for e in self.client.get(url).data["elementos"]] == [
+            "Zumo"
+        ]
+        # edicion del kit
+        self.client.patch(f"/api/kits/{kid}/", {"nombre": "Kit Nuevo"}, format="json")
+        assert self.client.get(url).data["kit"]["nombre"] == "Kit Nuevo"
+        # desactivacion
+        self.client.patch(f"/api/kits/{kid}/", {"activo": False}, format="json")
+        assert self.client.get(url).status_code == 404
+        self.client.patch(f"/api/kits/{kid}/", {"activo": True}, format="json")
+        # rotacion: el token viejo deja de valer
+        self.client.post(f"/api/kits/{kid}/rotate_token/")
+        assert self.client.get(url).status_code == 404
+        r = self.client.post(f"{url}/verify", {"items": []}, format="json")
+        assert r.status_code == 404
+
+    def test_desactivar_no_deja_payload_viejo_en_cache(self):
+        k = self.crear_kit_con_elementos()
+        token = k["token_publico"]
+        viejo = kit_cache.payload_publico(token)
+        assert viejo is not None
+        with self.captureOnCommitCallbacks(execute=True):
+            kit = Kit.objects.get(pk=k["id"])
+            kit.activo = False
+            kit.save()
+            # otro worker lee la BD antes del commit y vuelve a cachear el kit
+            cache.set(kit_cache._clave(token), viejo, kit_cache.KIT_PUBLICO_SEGUNDOS)
+        assert kit_cache.payload_publico(token) is None
+        self.client.credentials()
+        assert self.client.get(f"/qr/{token}").status_code == 404
+
+    def test_elementos_diff_conserva_ids(self):
+        k = self.crear_kit_con_elementos()
+        ids = {e["etiqueta"]: e["id"] for e in k["elementos"]}
+        r = self.client.post(
+            f"/api/kits/{k['id']}/elementos/",
+            {
+                "items": [
+                    {"etiqueta": "Tiras", "cantidad_requerida": 2, "unidad": "u"},
+                    {"etiqueta": "Agujas", "cantidad_requerida": 5, "unidad": "u"},
+                    {"etiqueta": "Zumo", "cantidad_requerida": 1, "unidad": "ud"},
+                ]
+            },
+            format="json",
+        )
+        assert r.status_code == 200, r.content
+        nuevos = {e["etiqueta"]: e for e in r.data}
+        assert nuevos["Tiras"]["id"] == ids["Tiras"]
+        assert nuevos["Agujas"]["id"] == ids["Agujas"]
+        assert nuevos["Agujas"]["cantidad_requerida"] == 5
+        assert "Zumo" in nuevos
+
+        r = self.client.post(
+            f"/api/kits/{k['id']}/elementos/",
+            {"items": [{"etiqueta": "Zumo", "cantidad_requerida": 1, "unidad": "ud"}]},
+            format="json",
+        )
+        assert [e["id"] for e in r.data] == [nuevos["Zumo"]["id"]]
+
+    def test_elementos_consultas_acotadas(self):
+        kid = self.crear_kit_con_elementos()["id"]
+
+        def guardar(n):
+            items = [
+                {"etiqueta": f"E{i}", "cantidad_requerida": i + 1} for i in range(n)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.post(
+                    f"/api/kits/{kid}/elementos/", {"items": items}, format="json"
+                )
+            assert r.status_code == 200, r.content
+            return len(ctx.captured_queries)
+
+        guardar(5)
+        pocos = guardar(5)  # sin cambios
+        guardar(200)
+        muchos = guardar(200)
+        assert muchos == pocos
+
+    def test_elementos_valida_items(self):
+        kid = self.crear_kit_con_elementos()["id"]
+        r = self.client.post(
+            f"/api/kits/{kid}/elementos/",
+            {
+                "items": [
+                    {"etiqueta": "Tiras", "cantidad_requerida": 1},
+                    {"etiqueta": "Tiras", "cantidad_requerida": 2},
+                ]
+            },
+            format="json",
+        )
+        assert r.status_code == 400
+        r = self.client.post(
+            f"/api/kits/{kid}/elementos/",
+            {"items": [{"etiqueta": "Tiras", "cantidad_requerida": -1}]},
+            format="json",
+        )
+        assert r.status_code == 400
+
+
+# el volcado va en un hilo: en los tests se programa pero se lanza a mano (el
+# hilo abriria otra conexion y no veria la transaccion del test)
+class _TimerFalso:
+    def __init__(self, interval, function):
+        self.interval, self.function, self.cancelado = interval, function, False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelado = True
+
+
+class KitsVerificacionBufferTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        timer = mock.patch.object(auditoria.threading, "Timer", _TimerFalso)
+        timer.start()
+        self.addCleanup(timer.stop)
+        self.spool = tempfile.TemporaryDirectory()
+        ajustes = override_settings(
+            KIT_VERIFICACION_MODO="buffer",
+            KIT_VERIFICACION_LOTE=3,
+            KIT_VERIFICACION_FLUSH_SEGUNDOS=3600,
+            KIT_VERIFICACION_FSYNC_SEGUNDOS=3600,
+            KIT_VERIFICACION_SPOOL=self.spool.name,
+        )
+        ajustes.enable()
+        self.addCleanup(self.spool.cleanup)
+        self.addCleanup(ajustes.disable)
+        self.addCleanup(auditoria._cerrar)
+        User.objects.create_user("daniel", password="daniel 1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "daniel", "password": "daniel 1234"},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {r.data['access']}")
+        self.client.get("/api/paciente/me/")
+        k = self.client.post("/api/kits/", {"nombre": "Kit"}, format="json").data
+        self.client.post(
+            f"/api/kits/{k['id']}/elementos/",
+            {"items": [{"etiqueta": "Tiras", "cantidad_requerida": 2}]},
+            format="json",
+        )
+        self.kit = self.client.get(f"/api/kits/{k['id']}/").data
+
+    def verificar(self):
+        r = self.client.post(
+            f"/qr/{self.kit['token_publico']}/verify",
+            {"items": [{"etiqueta": "Tiras", "cantidad": 1}]},
+            format="json",
+        )
+        assert r.status_code == 200
+
+    def test_buffer_vuelca_por_tamano(self):
+        self.client.credentials()  # anonimo, como el escaneo real
+        self.client.get(f"/qr/{self.kit['token_publico']}")  # payload en cache
+        # sin INSERT: solo el contador del throttle en cada peticion
+        with mock.patch.object(auditoria.os, "fsync", wraps=os.fsync) as fsync:
+            with self.assertNumQueries(3):
+                self.verificar()
+                self.verificar()
+                # tercera: llega al lote, pero el volcado va en segundo plano
+                self.verificar()
+        assert fsync.call_count == 1  # agrupado: uno por intervalo
+        assert VerificacionKit.objects.count() == 0
+        timer = auditoria._estado["timer"]
+        assert timer.interval == 0
+
+        # mientras se vuelca, las nuevas van a un spool nuevo
+        insertar = auditoria._insertar
+
+        def insertar_con_otra(filas):
+            self.verificar()
+            return insertar(filas)
+
+        with mock.patch.object(auditoria, "_insertar", insertar_con_otra):
+            assert auditoria.volcar() == 3
+        v = VerificacionKit.objects.all()
+        assert len(v) == 3
+        assert v[0].faltantes_json == {"Tiras": 1} and not v[0].resultado_ok
+        assert auditoria.volcar() == 1
+        assert VerificacionKit.objects.count() == 4
+
+    def test_volcado_fallido_no_pierde_filas(self):
+        self.verificar()
+        with mock.patch.object(auditoria, "_insertar", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                auditoria.volcar()
+        # el spool apartado queda como huerfano y se reproduce en el siguiente
+        assert len(list(Path(self.spool.name).glob("*.jsonl"))) == 2
+        assert auditoria.volcar() == 1
+        assert VerificacionKit.objects.count() == 1
+
+    def test_fsync_por_verificacion_si_intervalo_cero(self):
+        with override_settings(KIT_VERIFICACION_FSYNC_SEGUNDOS=0):
+            with mock.patch.object(auditoria.os, "fsync") as fsync:
+                self.verificar()
+                self.verificar()
+        assert fsync.call_count == 2
+
+    def test_huerfano_ya_volcado_por_otro_worker(self):
+        huerfano = Path(self.spool.name) / "verificaciones-999999.jsonl"
+        huerfano.write_text(json.dumps({"kit_id": self.kit["id"]}) + "\n")
+        flock = fcntl.flock
+
+        def flock_y_otro_worker_lo_borra(fh, op):
+            # el otro worker tenia el flock, volco e hizo unlink; luego lo cogemos
+            huerfano.unlink()
+            return flock(fh, op)
+
+        with mock.patch.object(auditoria.fcntl, "flock", flock_y_otro_worker_lo_borra):
+            assert auditoria.reproducir_huerfanos() == 0
+        assert VerificacionKit.objects.count() == 0
+
+        # desaparece entre el glob y el open
+        huerfano.write_text(json.dumps({"kit_id": self.kit["id"]}) + "\n")
+        with mock.patch.object(
+            auditoria, "open", side_effect=FileNotFoundError, create=True
+        ):
+            assert auditoria.reproducir_huerfanos() == 0
+
+    def test_check_spool_en_volumen_persistente(self):
+        assert spool_persistente(None) == []  # el tmp de los tests esta fuera
+        with override_settings(KIT_VERIFICACION_SPOOL=str(settings.BASE_DIR / "var")):
+            assert [w.id for w in spool_persistente(None)] == ["core.W001"]
+
+    def test_listado_vuelca_pendientes(self):
+        self.verificar()
+        r = self.client.get(f"/api/kits/{self.kit['id']}/verificaciones/")
+        assert r.status_code == 200
+        assert len(r.data) == 1
+
+    def test_reproduce_spool_huerfano(self):
+        fila = {
+            "kit_id": self.kit["id"],
+            "origen": "qr",
+            "resultado_ok": True,
+            "faltantes_json": {},
+            "creado_en": "2026-01-02T03:04:05+00:00",
+        }
+        huerfano = Path(self.spool.name) / "verificaciones-999999.jsonl"
+        # la ultima linea quedo a medias: se descarta
+        huerfano.write_text(json.dumps(fila) + "\n" + '{"kit_id": ')
+        call_command("flush_verificaciones", stdout=mock.MagicMock())
+        v = VerificacionKit.objects.get()
+        assert v.creado_en.year == 2026 and v.creado_en.month == 1
+        assert not huerfano.exists()
+
+
+class QRThrottleCompartidoTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user("daniel", password="daniel 1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "daniel", "password": "daniel 1234"},
+            format="json",
+        )
+        self.auth = f"Bearer {r.data['access']}"
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+        self.client.get("/api/paciente/me/")
+        k = self.client.post("/api/kits/", {"nombre": "Kit"}, format="json").data
+        self.url = f"/qr/{k['token_publico']}"
+        self.client.credentials()  # el throttle qr solo aplica a anonimos
+
+    def test_cache_de_tests_aislada(self):
+        # el cache.clear() de los setUp no borra la cache real (core.runner)
+        tmp = tempfile.gettempdir()
+        assert settings.CACHES["default"]["LOCATION"].startswith(tmp)
+        assert settings.KIT_VERIFICACION_SPOOL.startswith(tmp)
+
+    def test_contador_compartido_entre_workers(self):
+        for _ in range(9):
+            assert self.client.get(self.url).status_code == 200
+        # otro worker = otra cache LocMem: el contador en BD no se pierde
+        cache.clear()
+        assert self.client.get(self.url).status_code == 200
+        r = self.client.get(self.url)
+        assert r.status_code == 429
+        assert 0 < int(r["Retry-After"]) <= 60
+        # la rechazada no suma
+        c = ContadorThrottle.objects.get(clave__startswith="throttle_qr_")
+        assert (c.actual, c.anterior) == (10, 0)
+
+    def modos(self):
+        # el mismo comportamiento con el contador en BD y en una cache con incr
+        # atomico (LocMem hace de Redis: su incr va bajo un lock)
+        locmem = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        for modo, ajustes in (
+            ("bd", {}),
+            ("cache", {"CACHES": locmem}),
+        ):
+            with self.subTest(modo), override_settings(
+                THROTTLE_CONTADOR=modo, **ajustes
+            ):
+                cache.clear()
+                ContadorThrottle.objects.all().delete()
+                yield modo
+
+    def test_ventana_deslizante(self):
+        for _ in self.modos():
+            with mock.patch(
+                "rest_framework.throttling.SimpleRateThrottle.timer"
+            ) as reloj:
+                reloj.return_value = 600.0  # inicio de ventana
+                for _ in range(10):
+                    assert self.client.get(self.url).status_code == 200
+                # a mitad de la siguiente la anterior pesa la mitad: 10 * 0.5 + 5
+                reloj.return_value = 690.0
+                for _ in range(5):
+                    assert self.client.get(self.url).status_code == 200
+                r = self.client.get(self.url)
+                assert r.status_code == 429
+                assert 0 < int(r["Retry-After"]) <= 30
+                # dos ventanas despues la anterior ya no cuenta
+                reloj.return_value = 780.0
+                assert self.client.get(self.url).status_code == 200
+
+    def test_reintentos_rechazados_no_alargan_el_bloqueo(self):
+        # muchos anonimos tras el NAT de un colegio reintentan sin parar
+        for _ in self.modos():
+            with mock.patch(
+                "rest_framework.throttling.SimpleRateThrottle.timer"
+            ) as reloj:
+                reloj.return_value = 600.0
+                for _ in range(10):
+                    assert self.client.get(self.url).status_code == 200
+                for _ in range(30):
+                    assert self.client.get(self.url).status_code == 429
+                # al empezar la siguiente ventana la anterior pesa entera: 1 + 10
+                reloj.return_value = 660.0
+                assert self.client.get(self.url).status_code == 429
+                # en cuanto se desliza un 10% vuelve a entrar (1 + 9)
+                reloj.return_value = 666.0
+                assert self.client.get(self.url).status_code == 200
+
+    def test_rechazo_no_escribe(self):
+        for _ in range(10):
+            assert self.client.get(self.url).status_code == 200
+        with CaptureQueriesContext(connection) as consultas:
+            assert self.client.get(self.url).status_code == 429
+        # el upsert condicional no actualiza la fila; la lectura es el Retry-After
+        assert len(consultas) == 2
+        assert consultas[1]["sql"].lstrip().upper().startswith("SELECT")
+        c = ContadorThrottle.objects.get(clave__startswith="throttle_qr_")
+        assert (c.actual, c.anterior) == (10, 0)
+
+    def test_contador_en_cache_no_toca_la_bd(self):
+        for modo in self.modos():
+            if modo != "cache":
+                continue
+            self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+            assert self.client.get("/api/kits/").status_code == 200
+            self.client.credentials()
+            assert self.client.get(self.url).status_code == 200  # payload a cache
+            # escaneos repetidos y el rechazo: ni el payload ni el throttle van a BD
+            with self.assertNumQueries(0):
+                for _ in range(9):
+                    assert self.client.get(self.url).status_code == 200
+                assert self.client.get(self.url).status_code == 429
+            assert not ContadorThrottle.objects.exists()
+
+    def test_check_contador_atomico(self):
+        assert contador_throttle(None) == []
+        with override_settings(THROTTLE_CONTADOR="cache"):
+            # la FileBasedCache no tiene incr atomico entre procesos
+            assert [e.id for e in contador_throttle(None)] == ["core.E002"]
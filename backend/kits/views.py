@@ -1,20 +1,48 @@
 import base64
-import io
 
-import qrcode
+from core.http import binario_con_etag, con_etag
+from core.throttling import VentanaDeslizanteMixin
+from django.db import transaction
 from django.urls import reverse
-from drf_spectacular.utils import OpenApiExample, extend_schema, inline_serializer
-from rest_framework import permissions, serializers, status, viewsets
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (
+    OpenApiExample,
+    OpenApiParameter,
+    extend_schema,
+    inline_serializer,
+)
+from rest_framework import permissions, serializers, viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.throttling import SimpleRateThrottle
 
+from . import auditoria
+from .cache import invalidar_kit
 from .models import ElementoKit, Kit
+from .qr import FORMATOS, imagen_qr, olvidar_qr
 from .serializers import ElementoKitSerializer, KitSerializer, VerificacionSerializer
 
+# el QR cambia si se rota el token: el cliente revalida siempre (304 barato)
+QR_CACHE_CONTROL = "private, no-cache"
+
+
+# deja pasar Accept: image/png|svg+xml en ?formato=png|svg (si no, DRF da 406).
+# Solo pinta bytes: los errores y el JSON los pasa KitViewSet a JSONRenderer
+class ImagenQRRenderer(BaseRenderer):
+    media_type = "image/*"
+    format = "imagen"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
 
 # -------- Throttle público QR (lo usa kits/public.py) --------
-class QRAnonRateThrottle(SimpleRateThrottle):
+# contador atomico compartido entre workers (core.throttling): con Redis no toca
+# la BD y un escaneo rechazado no escribe nada
+class QRAnonRateThrottle(VentanaDeslizanteMixin, SimpleRateThrottle):
     scope = "qr"
 
     def get_cache_key(self, request, view):
@@ -29,6 +57,42 @@ def _paciente(request):
     return request.user.paciente
 
 
+# diff por (kit, etiqueta): inserta las nuevas, actualiza las cambiadas y borra
+# solo las que ya no estan. Consultas acotadas sea cual sea el tamaño de la lista
+def _upsert_elementos(kit, items):
+    with transaction.atomic():
+        # bloqueo el kit: dos guardados a la vez no se pisan el diff
+        Kit.objects.select_for_update().filter(pk=kit.pk).values_list("pk").first()
+        actuales = {e.etiqueta: e for e in kit.elementos.all()}
+        nuevos, cambiados = [], []
+        for it in items:
+            unidad = it.get("unidad", "u")
+            e = actuales.pop(it["etiqueta"], None)
+            if e is None:
+                nuevos.append(
+                    ElementoKit(
+                        kit=kit,
+                        etiqueta=it["etiqueta"],
+                        cantidad_requerida=it["cantidad_requerida"],
+                        unidad=unidad,
+                    )
+                )
+            elif (e.cantidad_requerida, e.unidad) != (it["cantidad_requerida"], unidad):
+                e.cantidad_requerida, e.unidad = it["cantidad_requerida"], unidad
+                cambiados.append(e)
+        # lo que queda en `actuales` ya no viene en la lista
+        if actuales:
+            ElementoKit.objects.filter(
+                pk__in=[e.pk for e in actuales.values()]
+            ).delete()
+        if nuevos:
+            ElementoKit.objects.bulk_create(nuevos)
+        if cambiados:
+            ElementoKit.objects.bulk_update(
+                cambiados, ["cantidad_requerida", "unidad"], batch_size=500
+            )
+
+
 # -------- ViewSet privado --------
 class KitViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -40,6 +104,17 @@ class KitViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(paciente=_paciente(self.request))
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Accept: image/* con un 400/404 (o el QR en JSON): un dict no es imagen
+        if isinstance(response, Response) and isinstance(
+            getattr(response, "accepted_renderer", None), ImagenQRRenderer
+        ):
+            if not isinstance(response.data, (bytes, str)):
+                response.accepted_renderer = JSONRenderer()
+                response.accepted_media_type = JSONRenderer.media_type
+        return response
+
     @extend_schema(
         tags=["Kits"],
         request=inline_serializer(
@@ -75,20 +150,22 @@ class KitViewSet(viewsets.ModelViewSet):
         """
         Bulk upsert de elementos. Cuerpo:
         {"items":[{"etiqueta":"Tiras","cantidad_requerida":2,"unidad":"u"}, ...]}
+        La lista es el estado final: las etiquetas que no vengan se borran y las
+        que ya existian conservan su id.
         """
         kit = self.get_object()
         items = request.data.get("items", [])
         if not isinstance(items, list):
             return Response({"detail": "items debe ser lista"}, status=400)
+        ser = ElementoKitSerializer(data=items, many=True)
+        ser.is_valid(raise_exception=True)
+        etiquetas = [it["etiqueta"] for it in ser.validated_data]
+        if len(set(etiquetas)) != len(etiquetas):
+            return Response({"detail": "etiqueta repetida en items"}, status=400)
 
-        # MVP: reemplazo sencillo (borro y creo)
-        kit.elementos.all().delete()
-        objs = [
-            ElementoKit(kit=kit, **{**it, "unidad": it.get("unidad", "u")})
-            for it in items
-        ]
-        if objs:
-            ElementoKit.objects.bulk_create(objs)
+        _upsert_elementos(kit, ser.validated_data)
+        # bulk_create/update no lanzan señales: invalido el payload publico a mano
+        invalidar_kit(kit.token_publico)
 
         return Response(
             ElementoKitSerializer(kit.elementos.all(), many=True).data, status=200
@@ -97,30 +174,63 @@ class KitViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def verificaciones(self, request, pk=None):
         kit = self.get_object()
+        # lo apuntado por este proceso aun en el spool tambien cuenta
+        auditoria.volcar()
         qs = kit.verificaciones.all().order_by("-id")[:100]
         return Response(VerificacionSerializer(qs, many=True).data)
 
+    def _url_publica(self, request, token):
+        # URL pública (ruta anónima definida en kits/urls.py)
+        return request.build_absolute_uri(
+            reverse("kits_public_get", kwargs={"token": token})
+        )
+
     @action(detail=True, methods=["post"])
     def rotate_token(self, request, pk=None):
         kit = self.get_object()
+        anterior = kit.token_publico
         kit.token_publico = Kit._meta.get_field("token_publico").default()
         kit.save(update_fields=["token_publico"])
+        # el QR viejo ya no sirve: fuera de la cache
+        olvidar_qr(self._url_publica(request, anterior))
         return Response({"token_publico": kit.token_publico})
 
-    @action(detail=True, methods=["get"])
+    @action(
+        detail=True,
+        methods=["get"],
+        renderer_classes=[JSONRenderer, ImagenQRRenderer],
+    )
     @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="formato",
+                description="json (defecto) | png | svg",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="compacto",
+                description="true: en JSON solo data_url (sin el campo png duplicado)",
+                required=False,
+                type=bool,
+            ),
+        ],
         responses={
             200: inline_serializer(
                 name="KitQRResponse",
                 fields={
                     "token": serializers.CharField(),
                     "url": serializers.URLField(),
-                    "png": serializers.CharField(help_text="PNG en base64"),
+                    "png": serializers.CharField(
+                        help_text="PNG en base64 (no va con compacto=true)"
+                    ),
                     "data_url": serializers.CharField(
                         help_text="data:image/png;base64,..."
                     ),
                 },
-            )
+            ),
+            (200, "image/png"): OpenApiTypes.BINARY,
+            (200, "image/svg+xml"): OpenApiTypes.STR,
         },
         examples=[
             OpenApiExample(
@@ -139,31 +249,35 @@ class KitViewSet(viewsets.ModelViewSet):
     )
     def qr(self, request, pk=None):
         """
-        Devuelve JSON con datos del QR:
+        QR del kit. Por defecto JSON con:
         - token
         - url pública (sin auth)
-        - png (base64 crudo)
+        - png (base64 crudo; se omite con ?compacto=true)
         - data_url (data:image/png;base64,...)
+        Con ?formato=png|svg devuelve la imagen directamente. Todas las
+        respuestas llevan ETag (304 si no cambió) y la imagen sale de la cache.
         """
         kit = self.get_object()
+        public_url = self._url_publica(request, kit.token_publico)
 
-        # URL pública (ruta anónima definida en kits/urls_public.py)
-        public_url = request.build_absolute_uri(
-            reverse("kits_public_get", kwargs={"token": kit.token_publico})
-        )
-
-        # Generar PNG del QR -> base64
-        img = qrcode.make(public_url)
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        png_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
+        formato = request.query_params.get("formato", "json")
+        if formato in FORMATOS:
+            return binario_con_etag(
+                request,
+                imagen_qr(public_url, formato),
+                FORMATOS[formato],
+                QR_CACHE_CONTROL,
+            )
+        if formato != "json":
+            return Response({"detail": "formato debe ser json, png o svg"}, status=400)
 
-        return Response(
-            {
-                "token": kit.token_publico,
-                "url": public_url,
-                "png": png_b64,
-                "data_url": f"data:image/png;base64,{png_b64}",
-            },
-            status=status.HTTP_200_OK,
-        )
+        png_b64 = base64.b64encode(imagen_qr(public_url, "png")).decode("ascii")
+        datos = {
+            "token": kit.token_publico,
+            "url": public_url,
+            "data_url": f"data:image/png;base64,{png_b64}",
+        }
+        compacto = request.query_params.get("compacto", "").lower()
+        if compacto not in ("true", "1", "yes", "y"):
+            datos["png"] = png_b64
+        return con_etag(request, datos, QR_CACHE_CONTROL)
@@ -1,4 +1,6 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.db.models import QuerySet
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from pacientes.models import Paciente
@@ -9,3 +11,11 @@ def crear_paciente_automatico(sender, instance, created, **kwargs):
     if created:
         # al crear un nuevo usuario, creo un Paciente vinculado
         Paciente.objects.create(usuario=instance, nombre=instance.username)
+
+
+def borra_paciente_entero(origin):
+    """Si el post_delete viene del borrado en cascada de un paciente (o su usuario)."""
+    if origin is None:
+        return False
+    modelo = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return modelo in (Paciente, get_user_model())
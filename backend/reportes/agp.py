@@ -0,0 +1,57 @@
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.utils import timezone
+
+PERCENTILES_AGP = (5, 25, 50, 75, 95)
+
+
+def _desfases_locales(t):
+    """Desfase UTC->local (segundos) por lectura; se calcula una vez por hora."""
+    horas, inversa = np.unique((t // 3600).astype(np.int64), return_inverse=True)
+    tz = timezone.get_current_timezone()
+    desfases = np.array(
+        [
+            datetime.fromtimestamp(h * 3600, tz=dt_timezone.utc)
+            .astimezone(tz)
+            .utcoffset()
+            .total_seconds()
+            for h in horas.tolist()
+        ]
+    )
+    return desfases[inversa]
+
+
+# Perfil Ambulatorio de Glucosa: percentiles por franja horaria, sin bucles
+def bandas_agp(t, v, slot_minutos=15, percentiles=PERCENTILES_AGP):
+    """
+    t: segundos epoch, v: valores. Devuelve (n por franja, matriz franjas x
+    percentiles con NaN en franjas vacias).
+    """
+    franjas = (24 * 60) // slot_minutos
+    if len(t) == 0:
+        return np.zeros(franjas, dtype=np.int64), np.full(
+            (franjas, len(percentiles)), np.nan
+        )
+    segundo_del_dia = (t + _desfases_locales(t)) % 86400
+    franja = (segundo_del_dia // (slot_minutos * 60)).astype(np.int64)
+
+    # ordeno por (franja, valor): cada franja queda como bloque ordenado
+    orden = np.lexsort((v, franja))
+    vs = v[orden]
+    n = np.bincount(franja, minlength=franjas)
+    inicio = np.cumsum(n) - n
+
+    # percentil con interpolacion lineal (igual que np.percentile) por franja
+    q = np.asarray(percentiles, dtype=float)[None, :] / 100.0
+    pos = (np.maximum(n, 1)[:, None] - 1) * q
+    abajo = np.floor(pos).astype(np.int64)
+    arriba = np.ceil(pos).astype(np.int64)
+    base = inicio[:, None]
+    ultimo = max(len(vs) - 1, 0)
+    v_abajo = vs[np.minimum(base + abajo, ultimo)]
+    v_arriba = vs[np.minimum(base + arriba, ultimo)]
+    bandas = v_abajo + (v_arriba - v_abajo) * (pos - abajo)
+    bandas[n == 0] = np.nan
+    return n, bandas
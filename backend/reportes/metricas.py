@@ -0,0 +1,124 @@
+import heapq
+
+import numpy as np
+from glucosa.models import GlucosaRegistro
+
+# umbrales del consenso internacional de TIR (mg/dL)
+MUY_BAJO = 54
+BAJO = 70
+ALTO = 180
+MUY_ALTO = 250
+
+
+# carga la ventana del paciente una sola vez como arrays (t en segundos epoch)
+def cargar_ventana(paciente, desde, hasta):
+    filas = list(
+        GlucosaRegistro.objects.filter(
+            paciente=paciente, medido_en__gte=desde, medido_en__lte=hasta
+        )
+        .order_by("medido_en")
+        .values_list("medido_en", "valor_mg_dl")
+    )
+    t = np.fromiter((m.timestamp() for m, _ in filas), float, count=len(filas))
+    v = np.fromiter((x for _, x in filas), float, count=len(filas))
+    return t, v
+
+
+def _pct(mascara):
+    return round(100.0 * float(np.mean(mascara)), 2)
+
+
+def _extremos(v):
+    # picos y valles alternos (incluye los extremos de la serie), sin mesetas
+    v = v[np.r_[True, np.diff(v) != 0]]
+    if len(v) < 3:
+        return v
+    pendiente = np.sign(np.diff(v))
+    giros = np.flatnonzero(pendiente[1:] != pendiente[:-1]) + 1
+    return v[np.r_[0, giros, len(v) - 1]]
+
+
+def mage(v, sd):
+    """
+    MAGE por poda de extremos (estilo Baghurst/Service): mientras la excursion
+    mas pequeña entre un pico y un valle consecutivos no llegue a 1 DE, se
+    eliminan ese pico y ese valle (o solo el punto de borde de la serie).
+    Devuelve la media de las excursiones que quedan, todas >= 1 DE.
+    """
+    if len(v) < 3 or not sd:
+        return None
+    e = _extremos(v).tolist()
+    n = len(e)
+    if n < 2:
+        return None
+    # lista doblemente enlazada + heap de excursiones: O(n log n)
+    ant = list(range(-1, n - 1))
+    sig = list(range(1, n + 1))
+    sig[-1] = -1
+    vivo = [True] * n
+    heap = [(abs(e[i + 1] - e[i]), i, i + 1) for i in range(n - 1)]
+    heapq.heapify(heap)
+    vivos = n
+    while heap and vivos > 2:
+        amp, i, j = heapq.heappop(heap)
+        if not (vivo[i] and vivo[j] and sig[i] == j):
+            continue  # excursion que ya no existe
+        if amp >= sd:
+            break
+        a, b = ant[i], sig[j]
+        if a == -1:
+            quitar = [i]  # borde inicial: el primer punto no es un giro real
+        elif b == -1:
+            quitar = [j]
+        else:
+            # quitar un pico y un valle contiguos conserva la alternancia
+            quitar = [i, j]
+        for k in quitar:
+            vivo[k] = False
+            vivos -= 1
+            if ant[k] != -1:
+                sig[ant[k]] = sig[k]
+            if sig[k] != -1:
+                ant[sig[k]] = ant[k]
+        if len(quitar) == 2:
+            heapq.heappush(heap, (abs(e[b] - e[a]), a, b))
+    quedan = [e[k] for k in range(n) if vivo[k]]
+    amplitudes = np.abs(np.diff(quedan))
+    validas = amplitudes[amplitudes >= sd]
+    return round(float(validas.mean()), 2) if len(validas) else None
+
+
+def indices_riesgo(v):
+    """LBGI / HBGI de Kovatchev sobre la escala simetrizada."""
+    f = 1.509 * (np.log(v) ** 1.084 - 5.381)
+    r = 10.0 * f * f
+    lbgi = float(np.mean(np.where(f < 0, r, 0.0)))
+    hbgi = float(np.mean(np.where(f > 0, r, 0.0)))
+    return round(lbgi, 2), round(hbgi, 2)
+
+
+# todas las metricas de variabilidad en una pasada vectorizada
+def calcular_metricas(v):
+    v = np.asarray(v, dtype=float)
+    n = len(v)
+    if n == 0:
+        return {"total": 0}
+    media = float(v.mean())
+    sd = float(v.std(ddof=1)) if n > 1 else 0.0
+    lbgi, hbgi = indices_riesgo(v)
+    return {
+        "total": n,
+        "media": round(media, 2),
+        "sd": round(sd, 2),
+        "cv_pct": round(100.0 * sd / media, 2),
+        "gmi_pct": round(3.31 + 0.02392 * media, 2),
+        "hba1c_estimada_pct": round((media + 46.7) / 28.7, 2),
+        "tbr_54_pct": _pct(v < MUY_BAJO),
+        "tbr_70_pct": _pct(v < BAJO),
+        "tir_pct": _pct((v >= BAJO) & (v <= ALTO)),
+        "tar_180_pct": _pct(v > ALTO),
+        "tar_250_pct": _pct(v > MUY_ALTO),
+        "mage": mage(v, sd),
+        "lbgi": lbgi,
+        "hbgi": hbgi,
+    }
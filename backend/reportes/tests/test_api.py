@@ -1,14 +1,26 @@
 from datetime import timedelta
+from io import StringIO
 
+import numpy as np
+from core import cache as versiones
+from core.checks import cache_compartida
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
 from django.utils import timezone
-from glucosa.models import GlucosaRegistro
+from glucosa.models import GlucosaDiaria, GlucosaRegistro
 from insumos.models import Insumo
+from insumos.services import registrar_movimiento
+from reportes.metricas import calcular_metricas
+from reportes.pronostico import HORIZONTE_DIAS, pronostico_insumos
 from rest_framework.test import APITestCase
 
 
 class ReportesAPITest(APITestCase):
     def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
         self.user = User.objects.create_user("demo", password="demo1234")
         r = self.client.post(
             "/api/auth/token/",
@@ -64,6 +76,117 @@ class ReportesAPITest(APITestCase):
         assert abs(r.data["promedio"] - 116.67) < 0.01
         assert abs(r.data["en_rango_pct"] - 33.33) < 0.01
 
+    def test_glucosa_resumen_sigue_ediciones_y_borrados(self):
+        self._g(50)
+        self._g(100)
+        self._g(200)
+        g = GlucosaRegistro.objects.get(valor_mg_dl=200)
+        g.valor_mg_dl = 150
+        g.save()
+        GlucosaRegistro.objects.get(valor_mg_dl=50).delete()
+
+        dia = GlucosaDiaria.objects.get(paciente=self.paciente)
+        assert (dia.n, dia.minimo, dia.maximo, dia.en_rango) == (2, 100, 150, 2)
+        assert dia.suma_cuadrados == 100**2 + 150**2
+
+        r = self.client.get("/api/reportes/glucosa_resumen/")
+        assert r.data["total"] == 2
+        assert r.data["promedio"] == 125
+        assert r.data["en_rango_pct"] == 100
+
+    def test_glucosa_resumen_objetivo_libre_y_percentiles(self):
+        for v in (60, 95, 110, 140, 250):
+            self._g(v)
+        self._g(300, dias_offset=-2)
+        # cualquier objetivo sale del histograma diario
+        r = self.client.get(
+            "/api/reportes/glucosa_resumen/?objetivo_min=90&objetivo_max=140"
+        )
+        assert r.data["total"] == 6
+        assert abs(r.data["en_rango_pct"] - 50.0) < 0.01
+        assert r.data["mediana"] == 125
+        assert r.data["percentiles"]["p50"] == 125
+        assert r.data["percentiles"]["p95"] == 287.5
+
+    def test_rebuild_glucosa_diaria(self):
+        self._g(80)
+        self._g(90, dias_offset=-1)
+        GlucosaDiaria.objects.all().delete()
+        call_command("rebuild_glucosa_diaria", stdout=StringIO())
+        assert GlucosaDiaria.objects.filter(paciente=self.paciente).count() == 2
+        r = self.client.get("/api/reportes/glucosa_resumen/")
+        assert r.data["total"] == 2
+
+    def test_glucosa_metricas(self):
+        for v in (50, 65, 100, 150, 200, 260):
+            self._g(v)
+        r = self.client.get("/api/reportes/glucosa_metricas/")
+        assert r.status_code == 200
+        assert r.data["total"] == 6
+        assert abs(r.data["media"] - 137.5) < 0.01
+        assert abs(r.data["tbr_54_pct"] - 16.67) < 0.01
+        assert abs(r.data["tbr_70_pct"] - 33.33) < 0.01
+        assert abs(r.data["tir_pct"] - 33.33) < 0.01
+        assert abs(r.data["tar_250_pct"] - 16.67) < 0.01
+        assert abs(r.data["gmi_pct"] - (3.31 + 0.02392 * 137.5)) < 0.01
+        assert r.data["lbgi"] > 0 and r.data["hbgi"] > 0
+
+    def test_mage_con_ruido_de_sensor(self):
+        # 14 dias de senoide +-60 mg/dL: el ruido añade giros pequeños que la
+        # poda de extremos debe absorber
+        minutos = np.arange(14 * 288) * 5
+        limpia = 140 + 60 * np.sin(2 * np.pi * minutos / 1440)
+        ruido = np.random.default_rng(0).normal(0, 3, len(minutos))
+        m_limpia = calcular_metricas(limpia)["mage"]
+        m_ruido = calcular_metricas(limpia + ruido)["mage"]
+        assert m_limpia is not None and m_ruido is not None
+        assert abs(m_limpia - 120) < 5  # pico a valle de la senoide
+        assert abs(m_ruido - m_limpia) < 15
+
+    def test_glucosa_metricas_sin_datos(self):
+        r = self.client.get("/api/reportes/glucosa_metricas/")
+        assert r.status_code == 200
+        assert r.data["total"] == 0
+
+    def test_invalidar_repite_tras_el_commit(self):
+        v0 = versiones.version("glucosa", 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            versiones.invalidar("glucosa", 1)
+            v1 = versiones.version("glucosa", 1)
+            assert v1 != v0
+            # un lector concurrente cachea aqui datos aun sin commit...
+        # ...y la version del commit ya no los lee
+        assert versiones.version("glucosa", 1) not in (v0, v1)
+
+    def test_check_exige_cache_compartida(self):
+        locmem = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        with override_settings(CACHES=locmem):
+            assert [e.id for e in cache_compartida(None)] == ["core.E001"]
+        assert cache_compartida(None) == []
+
+    def test_glucosa_agp_bandas_y_cache(self):
+        for v in (80, 100, 120, 140, 160):
+            self._g(v)
+        r = self.client.get("/api/reportes/glucosa_agp/?slot=60")
+        assert r.status_code == 200
+        assert r.data["total"] == 5
+        assert len(r.data["bandas"]) == 24
+        con_datos = [b for b in r.data["bandas"] if b[1]]
+        assert len(con_datos) == 1
+        minuto, n, p5, p25, p50, p75, p95 = con_datos[0]
+        assert (n, p25, p50, p75) == (5, 100, 120, 140)
+
+        # una lectura nueva invalida la cache del paciente
+        self._g(300)
+        r = self.client.get("/api/reportes/glucosa_agp/?slot=60")
+        assert r.data["total"] == 6
+
+    def test_glucosa_agp_valida_dias(self):
+        r = self.client.get("/api/reportes/glucosa_agp/?dias=7")
+        assert r.status_code == 400
+
     # --- Inventario
     def test_inventario_resumen_bajo_minimo(self):
         # 2 bajos, 1 OK
@@ -79,3 +202,62 @@ class ReportesAPITest(APITestCase):
         # solo compruebo que existan al menos los tipos que metimos
         for t in ["TIR", "AGU", "INS"]:
             assert t in tipos
+
+    def test_inventario_pronostico_y_cache(self):
+        ins = Insumo.objects.create(
+            paciente=self.paciente,
+            nombre="Tiras",
+            tipo="TIR",
+            stock_actual=30,
+            stock_minimo=6,
+        )
+        Insumo.objects.create(
+            paciente=self.paciente, nombre="Agujas", tipo="AGU", stock_actual=5
+        )
+        url = f"/api/insumos/{ins.pk}/movimientos/"
+        for _ in range(3):
+            self.client.post(url, {"cantidad": -2, "motivo": "uso"}, format="json")
+        self.client.post(url, {"cantidad": 10, "motivo": "compra"}, format="json")
+
+        r = self.client.get("/api/reportes/inventario_pronostico/")
+        assert r.status_code == 200
+        tiras, agujas = r.data["insumos"]
+        # creado hoy: 6 unidades de uso en 1 dia -> 6/dia; stock 34
+        assert tiras["consumo_diario"] == 6
+        assert tiras["dias_hasta_agotar"] == round(34 / 6, 1)
+        assert tiras["dias_hasta_minimo"] == round(28 / 6, 1)
+        assert agujas["dias_hasta_agotar"] is None  # sin consumo, al final
+
+        # cacheado hasta el siguiente movimiento
+        Insumo.objects.filter(pk=ins.pk).update(stock_actual=0)
+        r = self.client.get("/api/reportes/inventario_pronostico/")
+        assert r.data["insumos"][0]["stock_actual"] == 34
+        self.client.post(url, {"cantidad": 1, "motivo": "compra"}, format="json")
+        r = self.client.get("/api/reportes/inventario_pronostico/")
+        assert r.data["insumos"][0]["stock_actual"] == 1
+
+    def test_pronostico_sin_fecha_mas_alla_del_horizonte(self):
+        ins = Insumo.objects.create(
+            paciente=self.paciente, nombre="Tiras", tipo="TIR", stock_actual=2**31 - 1
+        )
+        registrar_movimiento(ins.pk, -1)
+        [item] = pronostico_insumos(self.paciente, 30)
+        # ~2e9 dias: antes date + timedelta daba OverflowError
+        assert item["dias_hasta_agotar"] > HORIZONTE_DIAS
+        assert item["fecha_agotamiento"] is None
+
+    def test_compactar_invalida_el_pronostico(self):
+        ins = Insumo.objects.create(
+            paciente=self.paciente, nombre="Tiras", tipo="TIR", stock_actual=30
+        )
+        registrar_movimiento(ins.pk, -6)
+        r = self.client.get("/api/reportes/inventario_pronostico/")
+        assert r.data["insumos"][0]["consumo_diario"] == 6
+        # el "uso" pasa a un checkpoint: ya no cuenta como consumo
+        call_command("compact_movimientos", "--dias", "0", stdout=StringIO())
+        r = self.client.get("/api/reportes/inventario_pronostico/")
+        assert r.data["insumos"][0]["consumo_diario"] == 0
+
+    def test_inventario_pronostico_valida_dias(self):
+        r = self.client.get("/api/reportes/inventario_pronostico/?dias=3")
+        assert r.status_code == 400
@@ -1,6 +1,12 @@
 from django.urls import path
 
-from .views import GlucosaResumenView, InventarioResumenView
+from .views import (
+    GlucosaAGPView,
+    GlucosaMetricasView,
+    GlucosaResumenView,
+    InventarioPronosticoView,
+    InventarioResumenView,
+)
 
 urlpatterns = [
     path(
@@ -8,9 +14,20 @@ urlpatterns = [
         GlucosaResumenView.as_view(),
         name="reportes_glucosa_resumen",
     ),
+    path(
+        "glucosa_metricas/",
+        GlucosaMetricasView.as_view(),
+        name="reportes_glucosa_metricas",
+    ),
+    path("glucosa_agp/", GlucosaAGPView.as_view(), name="reportes_glucosa_agp"),
     path(
         "inventario_resumen/",
         InventarioResumenView.as_view(),
         name="reportes_inventario_resumen",
     ),
+    path(
+        "inventario_pronostico/",
+        InventarioPronosticoView.as_view(),
+        name="reportes_inventario_pronostico",
+    ),
 ]
@@ -1,15 +1,27 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from django.db.models import Avg, Count, F, Max, Min
+from core.cache import clave
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min, Sum
 from django.utils import timezone
-from glucosa.models import GlucosaRegistro
+from glucosa import histograma
+from glucosa.models import GlucosaDiaria
+from glucosa.resumen import histograma_rango
 from insumos.models import Insumo
 from pacientes.models import Paciente
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .agp import PERCENTILES_AGP, bandas_agp
+from .metricas import calcular_metricas, cargar_ventana
+from .pronostico import pronostico_insumos
+
+PERCENTILES = (5, 25, 50, 75, 95)
+AGP_CACHE_SEGUNDOS = 60 * 60
+PRONOSTICO_CACHE_SEGUNDOS = 60 * 60
+
 
 # funcion del paciente para obtener
 def _paciente(request) -> Paciente:
@@ -25,6 +37,20 @@ def _parse_yyyy_mm_dd(s: Optional[str]) -> Optional[datetime]:
     )
 
 
+# rango ?desde=&hasta= (YYYY-MM-DD); por defecto los ultimos `dias_defecto` dias
+def _rango(request, dias_defecto):
+    hoy = timezone.localdate()
+    desde = _parse_yyyy_mm_dd(request.query_params.get("desde")) or datetime.combine(
+        hoy - timedelta(days=dias_defecto),
+        datetime.min.time(),
+        tzinfo=timezone.get_current_timezone(),
+    )
+    hasta = _parse_yyyy_mm_dd(request.query_params.get("hasta")) or datetime.combine(
+        hoy, datetime.max.time(), tzinfo=timezone.get_current_timezone()
+    )
+    return desde, hasta
+
+
 # vista del resumen de la fglucosa
 class GlucosaResumenView(APIView):
     permission_classes = [IsAuthenticated]
@@ -32,20 +58,7 @@ class GlucosaResumenView(APIView):
     def get(self, request):
         p = _paciente(request)
 
-        # fechas por defecto ddejo el default en los ultimos 30 dias
-        hoy = timezone.localdate()
-        desde = _parse_yyyy_mm_dd(
-            request.query_params.get("desde")
-        ) or datetime.combine(
-            hoy - timedelta(days=30),
-            datetime.min.time(),
-            tzinfo=timezone.get_current_timezone(),
-        )
-        hasta = _parse_yyyy_mm_dd(
-            request.query_params.get("hasta")
-        ) or datetime.combine(
-            hoy, datetime.max.time(), tzinfo=timezone.get_current_timezone()
-        )
+        desde, hasta = _rango(request, dias_defecto=30)
 
         # objetivos: query → paciente → defaults
         obj_min_q = request.query_params.get("objetivo_min")
@@ -57,29 +70,27 @@ class GlucosaResumenView(APIView):
             float(obj_max_q) if obj_max_q else float(getattr(p, "objetivo_max", 180))
         )
 
-        # CORRECCIÓN 1: 'fecha' cambiado a 'medido_en'
-        qs = GlucosaRegistro.objects.filter(
-            paciente=p, medido_en__gte=desde, medido_en__lte=hasta
+        # leo el resumen diario (~1 fila por dia) en vez de las lecturas crudas
+        dias = GlucosaDiaria.objects.filter(
+            paciente=p, fecha__gte=desde.date(), fecha__lte=hasta.date()
         )
-
-        # gagregados
-        agg = qs.aggregate(
-            # CORRECCIÓN 2: 'valor' cambiado a 'valor_mg_dl'
-            promedio=Avg("valor_mg_dl"),
-            minimo=Min("valor_mg_dl"),
-            maximo=Max("valor_mg_dl"),
-            total=Count("id"),
+        agg = dias.aggregate(
+            suma=Sum("suma"),
+            minimo=Min("minimo"),
+            maximo=Max("maximo"),
+            total=Sum("n"),
         )
         total = int(agg["total"] or 0)
+        agg["promedio"] = agg["suma"] / total if total else None
+
+        # histograma acumulado: % en rango de cualquier objetivo y percentiles
+        pref = histograma.prefijos(histograma_rango(p, desde.date(), hasta.date()))
 
         # % en rango
         if total == 0:
             en_rango_pct = None
         else:
-            # CORRECCIÓN 2: 'valor' cambiado a 'valor_mg_dl'
-            en_rango = qs.filter(
-                valor_mg_dl__gte=objetivo_min, valor_mg_dl__lte=objetivo_max
-            ).count()
+            en_rango = histograma.contar_rango(pref, objetivo_min, objetivo_max)
             en_rango_pct = round(100.0 * en_rango / total, 2)
 
         data = {
@@ -91,6 +102,12 @@ class GlucosaResumenView(APIView):
             "min": agg["minimo"],
             "max": agg["maximo"],
             "en_rango_pct": en_rango_pct,
+            "mediana": histograma.percentil(pref, 50) if total else None,
+            "percentiles": (
+                {f"p{q}": histograma.percentil(pref, q) for q in PERCENTILES}
+                if total
+                else None
+            ),
             "total": total,
             "desde": desde.date().isoformat(),
             "hasta": hasta.date().isoformat(),
@@ -100,6 +117,74 @@ class GlucosaResumenView(APIView):
         return Response(data)
 
 
+# metricas de variabilidad glucemica (consenso TIR/TBR/TAR, CV, GMI, MAGE...)
+class GlucosaMetricasView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        p = _paciente(request)
+        # 14 dias es la ventana minima recomendada por el consenso
+        desde, hasta = _rango(request, dias_defecto=14)
+        # hasta (YYYY-MM-DD) incluye todo ese dia
+        fin = datetime.combine(
+            hasta.date(), datetime.max.time(), tzinfo=timezone.get_current_timezone()
+        )
+        _, valores = cargar_ventana(p, desde, fin)
+        data = calcular_metricas(valores)
+        data.update(
+            {"desde": desde.date().isoformat(), "hasta": hasta.date().isoformat()}
+        )
+        return Response(data)
+
+
+# Perfil Ambulatorio de Glucosa (AGP): bandas p5/p25/p50/p75/p95 por hora del dia
+class GlucosaAGPView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        p = _paciente(request)
+        try:
+            dias = int(request.query_params.get("dias", 14))
+            slot = int(request.query_params.get("slot", 15))
+        except ValueError:
+            return Response({"detail": "dias y slot deben ser enteros"}, status=400)
+        if not 14 <= dias <= 90:
+            return Response({"detail": "dias debe estar entre 14 y 90"}, status=400)
+        if slot not in (5, 10, 15, 20, 30, 60):
+            return Response(
+                {"detail": "slot debe ser 5, 10, 15, 20, 30 o 60"}, status=400
+            )
+
+        # dias locales completos: el resultado es estable durante el dia y se
+        # cachea hasta que entra/cambia una lectura (version "glucosa")
+        hoy = timezone.localdate()
+        key = clave("glucosa", p.pk, "agp", dias, slot, hoy.isoformat())
+        data = cache.get(key)
+        if data is None:
+            tz = timezone.get_current_timezone()
+            desde = datetime.combine(
+                hoy - timedelta(days=dias - 1), datetime.min.time(), tzinfo=tz
+            )
+            hasta = datetime.combine(hoy, datetime.max.time(), tzinfo=tz)
+            t, v = cargar_ventana(p, desde, hasta)
+            n, bandas = bandas_agp(t, v, slot)
+            data = {
+                "dias": dias,
+                "slot_minutos": slot,
+                "desde": desde.date().isoformat(),
+                "hasta": hoy.isoformat(),
+                "total": int(n.sum()),
+                "columnas": ["minuto", "n"] + [f"p{q}" for q in PERCENTILES_AGP],
+                "bandas": [
+                    [i * slot, c]
+                    + ([None] * len(fila) if c == 0 else [round(x, 1) for x in fila])
+                    for i, (c, fila) in enumerate(zip(n.tolist(), bandas.tolist()))
+                ],
+            }
+            cache.set(key, data, AGP_CACHE_SEGUNDOS)
+        return Response(data)
+
+
 # vista del resumen del inventaruio del paciente
 class InventarioResumenView(APIView):
     permission_classes = [IsAuthenticated]
@@ -128,3 +213,26 @@ class InventarioResumenView(APIView):
                 "totales_por_tipo": list(totales),
             }
         )
+
+
+# dias hasta agotar cada insumo segun el consumo reciente (cacheado por paciente)
+class InventarioPronosticoView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        p = _paciente(request)
+        try:
+            dias = int(request.query_params.get("dias", 30))
+        except ValueError:
+            return Response({"detail": "dias debe ser entero"}, status=400)
+        if not 7 <= dias <= 180:
+            return Response({"detail": "dias debe estar entre 7 y 180"}, status=400)
+
+        # version "insumos": sube con cada movimiento o edicion de insumos
+        hoy = timezone.localdate()
+        key = clave("insumos", p.pk, "pronostico", dias, hoy.isoformat())
+        data = cache.get(key)
+        if data is None:
+            data = {"dias": dias, "insumos": pronostico_insumos(p, dias, hoy)}
+            cache.set(key, data, PRONOSTICO_CACHE_SEGUNDOS)
+        return Response(data)
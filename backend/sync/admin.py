@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from .models import Borrado, OperacionSync
+
+
+@admin.register(Borrado)
+class BorradoAdmin(admin.ModelAdmin):
+    list_display = ("id", "paciente", "recurso", "objeto_id", "borrado_en")
+    list_filter = ("recurso",)
+
+
+@admin.register(OperacionSync)
+class OperacionSyncAdmin(admin.ModelAdmin):
+    list_display = ("id", "paciente", "clave", "creado_en")
+    search_fields = ("clave",)
@@ -0,0 +1,12 @@
+import importlib
+
+from django.apps import AppConfig
+
+
+class SyncConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "sync"
+
+    def ready(self):
+        # lapidas (borrados) de los modelos sincronizables
+        importlib.import_module("sync.signals")
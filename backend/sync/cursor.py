@@ -0,0 +1,78 @@
+# cursores de delta-sync: una posicion compuesta (valor, pk) por recurso, para no
+# perder filas que comparten instante (p. ej. un "atender" masivo de alertas)
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def tope():
+    """
+    Limite hasta el que el cursor puede avanzar. auto_now se fija antes del
+    commit: una transaccion lenta puede dejar filas con un instante menor que
+    lo ya entregado. Lo mas reciente que el margen se entrega igual, pero se
+    repite en la siguiente llamada (el cliente aplica por id).
+    """
+    return timezone.now() - timedelta(seconds=settings.SYNC_MARGEN_SEGUNDOS)
+
+
+def pagina(qs, campo, desde, limite, hasta):
+    """
+    Filas posteriores a desde=(valor, pk) en orden (campo, pk). Devuelve
+    (filas, nueva posicion, hay_mas). Solo las filas con campo <= hasta mueven
+    la posicion; las posteriores se añaden al final si no hay mas paginas.
+    """
+    if desde is not None:
+        valor, pk = desde
+        qs = qs.filter(**{f"{campo}__gte": valor}).filter(
+            Q(**{f"{campo}__gt": valor}) | Q(pk__gt=pk)
+        )
+    orden = (campo, "pk")
+    estables = list(
+        qs.filter(**{f"{campo}__lte": hasta}).order_by(*orden)[: limite + 1]
+    )
+    hay_mas = len(estables) > limite
+    filas = estables[:limite]
+    posicion = (getattr(filas[-1], campo), filas[-1].pk) if filas else desde
+    if not hay_mas:
+        filas += list(qs.filter(**{f"{campo}__gt": hasta}).order_by(*orden)[:limite])
+    return filas, posicion, hay_mas
+
+
+def codificar(posiciones):
+    datos = {k: [p[0].isoformat(), p[1]] if p else None for k, p in posiciones.items()}
+    crudo = json.dumps(datos, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def _instante(valor):
+    dt = parse_datetime(valor) if isinstance(valor, str) else None
+    if dt is None:
+        raise CursorInvalido(valor)
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def decodificar(valor, claves):
+    """Cursor opaco -> {clave: (valor, pk) | None}. Acepta un instante ISO suelto."""
+    if not valor:
+        return dict.fromkeys(claves)
+    if parse_datetime(valor) is not None:
+        # cursor antiguo (solo instante): todas las filas a partir de el
+        return dict.fromkeys(claves, (_instante(valor), 0))
+    try:
+        crudo = base64.urlsafe_b64decode(valor + "=" * (-len(valor) % 4))
+        datos = json.loads(crudo)
+        return {
+            k: (_instante(datos[k][0]), int(datos[k][1])) if datos.get(k) else None
+            for k in claves
+        }
+    except (ValueError, TypeError, IndexError, AttributeError) as e:
+        raise CursorInvalido(valor) from e
@@ -0,0 +1,305 @@
+from comidas.models import Comida, DosisInsulina
+from comidas.serializers import ComidaSerializer, DosisInsulinaSerializer
+from core.cache import invalidar
+from core.eventos import publicar
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from glucosa.models import GlucosaRegistro
+from glucosa.resumen import dia_local, recalcular_dias
+from glucosa.serializers import GlucosaRegistroSerializer
+from insumos.models import Insumo, MovimientoInsumo
+from insumos.serializers import MovimientoSerializer
+from insumos.services import StockNegativo, registrar_movimiento
+from rest_framework import serializers
+
+from .models import OperacionSync
+
+MAX_OPERACIONES = 500
+
+# recursos que acepta el lote: nombre -> (modelo, serializer)
+RECURSOS_LOTE = {
+    "glucemias": (GlucosaRegistro, GlucosaRegistroSerializer),
+    "comidas": (Comida, ComidaSerializer),
+    "dosis": (DosisInsulina, DosisInsulinaSerializer),
+    "movimientos": (MovimientoInsumo, MovimientoSerializer),
+}
+OPS = ("create", "update", "delete")
+
+
+class OperacionInvalida(Exception):
+    pass
+
+
+def _ok(op, **extra):
+    return {"clave": op.get("clave"), "estado": "ok", **extra}
+
+
+def _error(op, errores):
+    return {"clave": op.get("clave"), "estado": "error", "errores": errores}
+
+
+def _validar_forma(op):
+    if not isinstance(op, dict):
+        raise OperacionInvalida("Operación inválida.")
+    clave = op.get("clave")
+    if not isinstance(clave, str) or not 0 < len(clave) <= 64:
+        raise OperacionInvalida("clave obligatoria (1-64 caracteres).")
+    if op.get("recurso") not in RECURSOS_LOTE:
+        raise OperacionInvalida(f"recurso debe ser uno de: {', '.join(RECURSOS_LOTE)}")
+    if op.get("op") not in OPS:
+        raise OperacionInvalida(f"op debe ser uno de: {', '.join(OPS)}")
+    if op["recurso"] == "movimientos" and op["op"] != "create":
+        raise OperacionInvalida("Los movimientos solo admiten create.")
+    if op["op"] != "create" and not isinstance(op.get("id"), int):
+        raise OperacionInvalida("id obligatorio para update/delete.")
+    if op["op"] != "delete" and not isinstance(op.get("datos"), dict):
+        raise OperacionInvalida("datos debe ser un objeto.")
+
+
+def _reclamar_on_conflict(paciente_id, claves, ahora):
+    tabla = connection.ops.quote_name(OperacionSync._meta.db_table)
+    valores = ", ".join(["(%s, %s, %s, %s)"] * len(claves))
+    ts = connection.ops.adapt_datetimefield_value(ahora)
+    params = []
+    for clave in claves:
+        params += [paciente_id, clave, "{}", ts]
+    sql = (
+        f"INSERT INTO {tabla} (paciente_id, clave, resultado, creado_en) "
+        f"VALUES {valores} "
+        "ON CONFLICT (paciente_id, clave) DO NOTHING RETURNING clave"
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return {fila[0] for fila in cur.fetchall()}
+
+
+def _reclamar_por_filas(paciente_id, claves):
+    nuevas = set()
+    for clave in claves:
+        try:
+            with transaction.atomic():
+                OperacionSync.objects.create(paciente_id=paciente_id, clave=clave)
+            nuevas.add(clave)
+        except IntegrityError:
+            pass  # ya tenia dueño
+    return nuevas
+
+
+# reclama las claves ANTES de aplicar nada: un lote repetido a la vez se bloquea
+# en el INSERT hasta el commit del primero y luego ve el conflicto
+def reclamar_claves(paciente_id, claves):
+    """Inserta las claves del lote; devuelve las que eran nuevas."""
+    claves = sorted(claves)  # mismo orden en todos los lotes: sin interbloqueos
+    if not claves:
+        return set()
+    if connection.features.can_return_columns_from_insert and (
+        connection.features.supports_update_conflicts_with_target
+    ):
+        return _reclamar_on_conflict(paciente_id, claves, timezone.now())
+    return _reclamar_por_filas(paciente_id, claves)
+
+
+class _Lote:
+    """Aplica una lista ordenada de operaciones de un paciente en una transaccion."""
+
+    def __init__(self, request, ops):
+        self.request = request
+        self.paciente = request.user.paciente
+        self.ops = ops
+        self.resultados = [None] * len(ops)
+        self.pendientes = []  # creates consecutivos del mismo recurso
+        self.vistas = set()  # claves ya tratadas en este lote
+        self.dias_glucosa = set()
+
+    # -- idempotencia: las claves se reclaman dentro de la transaccion del lote
+    def _reclamar(self):
+        claves = {
+            op["clave"]
+            for op in self.ops
+            if isinstance(op, dict)
+            and isinstance(op.get("clave"), str)
+            and 0 < len(op["clave"]) <= 64
+        }
+        self.reclamadas = reclamar_claves(self.paciente.pk, claves)
+        self.ya_aplicadas = dict(
+            OperacionSync.objects.filter(
+                paciente=self.paciente, clave__in=claves - self.reclamadas
+            ).values_list("clave", "resultado")
+        )
+
+    def _repetida(self, op):
+        resultado = self.ya_aplicadas.get(op["clave"])
+        if not resultado:
+            # reclamada por otro lote que aun no ha terminado (sin bloqueo de filas)
+            return _error(op, ["Operación en curso en otro lote."])
+        return {**resultado, "repetida": True}
+
+    def _guardar_resultados(self):
+        # las que salieron bien guardan su resultado; las fallidas sueltan la
+        # clave para que el cliente pueda reintentarlas
+        bien = {}
+        for op, res in zip(self.ops, self.resultados):
+            if res["estado"] == "ok" and not res.get("repetida"):
+                bien[op["clave"]] = res
+        OperacionSync.objects.filter(
+            paciente=self.paciente, clave__in=self.reclamadas - set(bien)
+        ).delete()
+        filas = list(
+            OperacionSync.objects.filter(paciente=self.paciente, clave__in=bien)
+        )
+        for fila in filas:
+            fila.resultado = bien[fila.clave]
+        OperacionSync.objects.bulk_update(filas, ["resultado"], batch_size=500)
+
+    # -- precarga: una consulta por recurso para todo el lote
+    def _precargar(self):
+        ids = {nombre: set() for nombre in RECURSOS_LOTE}
+        for op in self.ops:
+            # solo las bien formadas: un update de movimientos (sin paciente)
+            # rompería la consulta de todo el lote; su error sale por operacion
+            try:
+                _validar_forma(op)
+            except OperacionInvalida:
+                continue
+            if op["op"] in ("update", "delete"):
+                ids[op["recurso"]].add(op["id"])
+        self.instancias = {
+            nombre: modelo.objects.filter(paciente=self.paciente).in_bulk(ids[nombre])
+            for nombre, (modelo, _) in RECURSOS_LOTE.items()
+            if ids[nombre]
+        }
+
+    # -- creates en bloque
+    def _vaciar_pendientes(self):
+        if not self.pendientes:
+            return
+        recurso = self.ops[self.pendientes[0][0]]["recurso"]
+        modelo, _ = RECURSOS_LOTE[recurso]
+        pendientes, self.pendientes = self.pendientes, []
+
+        if recurso == "glucemias":
+            # la restriccion unica haria fallar todo el INSERT: quito repetidas
+            existentes = set(
+                GlucosaRegistro.objects.filter(
+                    paciente=self.paciente,
+                    medido_en__in=[d["medido_en"] for _, d in pendientes],
+                ).values_list("medido_en", "fuente")
+            )
+            validas = []
+            for i, datos in pendientes:
+                clave = (datos["medido_en"], datos.get("fuente", "manual"))
+                if clave in existentes:
+                    self.resultados[i] = _error(
+                        self.ops[i], ["Ya existe una lectura con esa fecha y fuente."]
+                    )
+                else:
+                    existentes.add(clave)
+                    validas.append((i, datos))
+            pendientes = validas
+
+        try:
+            with transaction.atomic():
+                objs = modelo.objects.bulk_create(
+                    [modelo(paciente=self.paciente, **datos) for _, datos in pendientes]
+                )
+        except IntegrityError:
+            for i, _ in pendientes:
+                self.resultados[i] = _error(self.ops[i], ["Conflicto de integridad."])
+            return
+        for (i, _), obj in zip(pendientes, objs):
+            self.resultados[i] = _ok(self.ops[i], id=obj.pk)
+        if recurso == "glucemias":
+            self.dias_glucosa |= {dia_local(o.medido_en) for o in objs}
+
+    def _create(self, i, op, serializer_cls):
+        ser = serializer_cls(data=op["datos"], context={"request": self.request})
+        ser.is_valid(raise_exception=True)
+        if (
+            self.pendientes
+            and self.ops[self.pendientes[0][0]]["recurso"] != op["recurso"]
+        ):
+            self._vaciar_pendientes()
+        self.pendientes.append((i, ser.validated_data))
+
+    def _movimiento(self, i, op):
+        if not isinstance(op.get("insumo"), int):
+            raise OperacionInvalida("insumo no encontrado.")
+        ser = MovimientoSerializer(data=op["datos"])
+        ser.is_valid(raise_exception=True)
+        try:
+            mov, stock = registrar_movimiento(
+                op["insumo"], paciente_id=self.paciente.pk, **ser.validated_data
+            )
+        except Insumo.DoesNotExist:
+            raise OperacionInvalida("insumo no encontrado.")
+        except StockNegativo as e:
+            raise OperacionInvalida(str(e))
+        self.resultados[i] = _ok(op, id=mov.pk, stock_actual=stock)
+
+    def _update(self, i, op, serializer_cls):
+        obj = self.instancias.get(op["recurso"], {}).get(op["id"])
+        if obj is None:
+            raise OperacionInvalida("No encontrado.")
+        ser = serializer_cls(
+            obj, data=op["datos"], partial=True, context={"request": self.request}
+        )
+        ser.is_valid(raise_exception=True)
+        with transaction.atomic():
+            ser.save()
+        self.resultados[i] = _ok(op, id=obj.pk)
+
+    def _delete(self, i, op):
+        obj = self.instancias.get(op["recurso"], {}).pop(op["id"], None)
+        if obj is None:
+            raise OperacionInvalida("No encontrado.")
+        with transaction.atomic():
+            obj.delete()
+        self.resultados[i] = _ok(op, id=op["id"])
+
+    def aplicar(self):
+        with transaction.atomic():
+            self._reclamar()
+            self._precargar()
+            for i, op in enumerate(self.ops):
+                try:
+                    _validar_forma(op)
+                    if op["clave"] in self.vistas:
+                        raise OperacionInvalida("clave repetida en el lote.")
+                    self.vistas.add(op["clave"])
+                    if op["clave"] not in self.reclamadas:
+                        self.resultados[i] = self._repetida(op)
+                        continue
+                    _, serializer_cls = RECURSOS_LOTE[op["recurso"]]
+                    if op["op"] == "create" and op["recurso"] != "movimientos":
+                        self._create(i, op, serializer_cls)
+                        continue
+                    # cualquier otra operacion respeta el orden: vacio los creates
+                    self._vaciar_pendientes()
+                    if op["recurso"] == "movimientos":
+                        self._movimiento(i, op)
+                    elif op["op"] == "update":
+                        self._update(i, op, serializer_cls)
+                    else:
+                        self._delete(i, op)
+                except OperacionInvalida as e:
+                    self.resultados[i] = _error(
+                        op if isinstance(op, dict) else {}, [str(e)]
+                    )
+                except serializers.ValidationError as e:
+                    self.resultados[i] = _error(op, e.detail)
+                except IntegrityError:
+                    self.resultados[i] = _error(op, ["Conflicto de integridad."])
+            self._vaciar_pendientes()
+
+            # las lecturas creadas en bloque no pasan por señales
+            if self.dias_glucosa:
+                recalcular_dias(self.paciente.pk, self.dias_glucosa)
+                invalidar("glucosa", self.paciente.pk)
+                publicar(self.paciente.pk)
+
+            self._guardar_resultados()
+        return self.resultados
+
+
+def aplicar_lote(request, ops):
+    return _Lote(request, ops).aplicar()
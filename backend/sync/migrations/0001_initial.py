@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("pacientes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Borrado",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("recurso", models.CharField(max_length=20)),
+                ("objeto_id", models.BigIntegerField()),
+                ("borrado_en", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "paciente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="borrados",
+                        to="pacientes.paciente",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["borrado_en"],
+                "indexes": [
+                    models.Index(
+                        fields=["paciente", "borrado_en"], name="borrado_pac_idx"
+                    )
+                ],
+            },
+        ),
+    ]
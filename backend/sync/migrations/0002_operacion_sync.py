@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pacientes", "0001_initial"),
+        ("sync", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OperacionSync",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("clave", models.CharField(max_length=64)),
+                ("resultado", models.JSONField(default=dict)),
+                ("creado_en", models.DateTimeField(auto_now_add=True)),
+                (
+                    "paciente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="operaciones_sync",
+                        to="pacientes.paciente",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("paciente", "clave"), name="operacion_sync_unica"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import models
+from django.utils import timezone
+
+
+# lapida de un registro borrado, para que los clientes lo quiten en el delta-sync
+class Borrado(models.Model):
+    paciente = models.ForeignKey(
+        "pacientes.Paciente", on_delete=models.CASCADE, related_name="borrados"
+    )
+    recurso = models.CharField(max_length=20)  # glucemias, comidas, dosis...
+    objeto_id = models.BigIntegerField()
+    borrado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["borrado_en"]
+        indexes = [
+            models.Index(fields=["paciente", "borrado_en"], name="borrado_pac_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recurso}#{self.objeto_id} ({self.borrado_en:%Y-%m-%d %H:%M})"
+
+
+# resultado de una operacion offline ya aplicada (idempotencia por clave del cliente)
+class OperacionSync(models.Model):
+    paciente = models.ForeignKey(
+        "pacientes.Paciente", on_delete=models.CASCADE, related_name="operaciones_sync"
+    )
+    clave = models.CharField(max_length=64)
+    resultado = models.JSONField(default=dict)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["paciente", "clave"], name="operacion_sync_unica"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente_id}:{self.clave}"
@@ -0,0 +1,24 @@
+from alertas.models import Alerta
+from alertas.serializers import AlertaSerializer
+from comidas.models import Comida, DosisInsulina
+from comidas.serializers import ComidaSerializer, DosisInsulinaSerializer
+from glucosa.models import GlucosaRegistro
+from glucosa.serializers import GlucosaRegistroSerializer
+from insumos.models import Insumo
+from insumos.serializers import InsumoSerializer
+
+# recursos sincronizables: nombre en la API -> (modelo, serializer)
+RECURSOS = {
+    "glucemias": (GlucosaRegistro, GlucosaRegistroSerializer),
+    "comidas": (Comida, ComidaSerializer),
+    "dosis": (DosisInsulina, DosisInsulinaSerializer),
+    "insumos": (Insumo, InsumoSerializer),
+    "alertas": (Alerta, AlertaSerializer),
+}
+
+
+def recurso_de(modelo):
+    for nombre, (m, _) in RECURSOS.items():
+        if m is modelo:
+            return nombre
+    return None
@@ -0,0 +1,33 @@
+from comidas.models import Comida, DosisInsulina
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from pacientes.signals import borra_paciente_entero
+
+from .models import Borrado
+from .recursos import RECURSOS, recurso_de
+
+
+def registrar_borrado(sender, instance, origin=None, **kwargs):
+    # si se borra el paciente (o su usuario) no hay a quien sincronizar
+    if borra_paciente_entero(origin):
+        return
+    Borrado.objects.create(
+        paciente_id=instance.paciente_id,
+        recurso=recurso_de(sender),
+        objeto_id=instance.pk,
+    )
+
+
+for _modelo, _ in RECURSOS.values():
+    post_delete.connect(
+        registrar_borrado,
+        sender=_modelo,
+        dispatch_uid=f"sync_borrado_{_modelo._meta.label_lower}",
+    )
+
+
+# el SET_NULL de dosis.comida es un UPDATE sin auto_now: marco las dosis a mano
+@receiver(pre_delete, sender=Comida)
+def tocar_dosis_de_comida(sender, instance, **kwargs):
+    DosisInsulina.objects.filter(comida=instance).update(actualizado_en=timezone.now())
@@ -0,0 +1,221 @@
+# stream SSE (text/event-stream) de glucemias y alertas del paciente. Servido por
+# ASGI (diaflow.asgi): un worker atiende muchas conexiones abiertas a la vez
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from core.eventos import despertar, desuscribir, suscribir, suscritos
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from pacientes.models import Paciente
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .cursor import CursorInvalido, codificar, decodificar, pagina, tope
+from .recursos import RECURSOS
+
+# recurso -> nombre del evento
+EVENTOS = {"glucemias": "glucemia", "alertas": "alerta"}
+LIMITE_POR_CONSULTA = 200
+TICKET_SALT = "sync.eventos"
+
+
+def crear_ticket(paciente_id):
+    return signing.dumps(paciente_id, salt=TICKET_SALT)
+
+
+def _paciente_id(request):
+    # EventSource no deja poner cabeceras: ?ticket= de POST /api/sync/eventos/ticket
+    # (firmado, solo vale para este stream y caduca en SSE_TICKET_SEGUNDOS). El
+    # JWT nunca va en la URL, que acaba en los logs de proxies y servidores
+    ticket = request.GET.get("ticket")
+    if ticket:
+        try:
+            return signing.loads(
+                ticket, salt=TICKET_SALT, max_age=settings.SSE_TICKET_SEGUNDOS
+            )
+        except signing.BadSignature:
+            return None
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if not raw:
+        return None
+    try:
+        usuario = auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return Paciente.objects.filter(usuario=usuario).values_list("pk", flat=True).first()
+
+
+def _desde(request):
+    # al reconectar el navegador manda Last-Event-ID con el ultimo id recibido
+    valor = request.headers.get("Last-Event-ID") or request.GET.get("since")
+    try:
+        desde = decodificar(valor, EVENTOS)
+    except CursorInvalido:
+        desde = {}
+    # sin cursor (o invalido): solo lo que llegue a partir de ahora
+    ahora = (timezone.now(), 0)
+    return {nombre: desde.get(nombre) or ahora for nombre in EVENTOS}
+
+
+def _nuevos(paciente_id, desde, enviados):
+    """
+    Cambios posteriores a las posiciones `desde` (indices paciente+actualizado_en).
+    Devuelve (trozos SSE en orden, nuevas posiciones, hay_mas). `enviados`
+    recuerda lo ya emitido dentro del margen de sync para no repetirlo en cada
+    sondeo; con hay_mas quedan filas tras LIMITE_POR_CONSULTA por leer.
+    """
+    hasta = tope()
+    filas, nuevas, hay_mas = [], {}, False
+    for nombre, evento in EVENTOS.items():
+        modelo, serializer = RECURSOS[nombre]
+        objetos, nuevas[nombre], mas = pagina(
+            modelo.objects.filter(paciente_id=paciente_id),
+            "actualizado_en",
+            desde[nombre],
+            LIMITE_POR_CONSULTA,
+            hasta,
+        )
+        hay_mas = hay_mas or mas
+        for o in objetos:
+            marca = (nombre, o.actualizado_en, o.pk)
+            if marca in enviados:
+                continue
+            if o.actualizado_en > hasta:
+                enviados.add(marca)  # se repetira hasta quedar estable
+            filas.append((o.actualizado_en, o.pk, nombre, serializer(o).data))
+    # lo que ya quedo detras de su posicion no puede volver
+    enviados.difference_update({m for m in enviados if (m[1], m[2]) <= nuevas[m[0]]})
+
+    # el id de cada evento es el cursor hasta ese punto (solo filas estables)
+    trozos, posiciones = [], dict(desde)
+    for t, pk, nombre, data in sorted(filas, key=lambda f: f[:2]):
+        if t <= hasta:
+            posiciones[nombre] = (t, pk)
+        trozos.append(
+            f"id: {codificar(posiciones)}\nevent: {EVENTOS[nombre]}\n"
+            f"data: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+        )
+    return trozos, nuevas, hay_mas
+
+
+def _con_cambios(paciente_ids, desde, vistos):
+    """
+    Cuales de esos pacientes tienen glucemias o alertas cambiadas desde `desde`
+    que el sondeo no haya visto ya. `vistos` guarda (recurso, pk, actualizado_en)
+    de lo ya avisado dentro del margen: una fila se avisa una vez, aunque se
+    relea en cada sondeo mientras siga dentro, y un commit tardio (auto_now por
+    detras de lo visto) se avisa igual. Lo que sale del margen se olvida.
+    """
+    cambiados = set()
+    for nombre in EVENTOS:
+        modelo, _ = RECURSOS[nombre]
+        filas = modelo.objects.filter(
+            paciente_id__in=paciente_ids, actualizado_en__gt=desde
+        ).values_list("paciente_id", "pk", "actualizado_en")
+        for paciente_id, pk, actualizado_en in filas:
+            marca = (nombre, pk, actualizado_en)
+            if marca not in vistos:
+                vistos.add(marca)
+                cambiados.add(paciente_id)
+    vistos.difference_update({m for m in vistos if m[2] <= desde})
+    return cambiados
+
+
+# una tarea de sondeo por bucle de eventos (uno por worker) para todas sus
+# conexiones: los cambios hechos en otros procesos no pasan por el pub/sub
+_sondeos = {}
+
+
+async def _sondear(loop):
+    margen = timedelta(seconds=settings.SYNC_MARGEN_SEGUNDOS)
+    desde = timezone.now()
+    vistos = set()
+    while True:
+        await asyncio.sleep(settings.SSE_POLL_SEGUNDOS)
+        ids = suscritos(loop)
+        if not ids:
+            _sondeos.pop(loop, None)
+            return
+        ahora = timezone.now()
+        # con margen: tambien los commits tardios con un auto_now anterior
+        despertar(await sync_to_async(_con_cambios)(ids, desde - margen, vistos))
+        desde = ahora
+
+
+def _arrancar_sondeo(loop):
+    tarea = _sondeos.get(loop)
+    if tarea is None or tarea.done():
+        _sondeos[loop] = loop.create_task(_sondear(loop))
+
+
+def _parar_sondeo(loop):
+    # sin conexiones en este bucle no se espera al siguiente sondeo
+    if not suscritos(loop):
+        tarea = _sondeos.pop(loop, None)
+        if tarea is not None:
+            tarea.cancel()
+
+
+async def _stream(paciente_id, desde):
+    loop = asyncio.get_running_loop()
+    aviso = suscribir(paciente_id)
+    _arrancar_sondeo(loop)
+    enviados = set()
+    fin = loop.time() + settings.SSE_MAX_DURACION
+    ultimo_envio = loop.time()
+    try:
+        yield "retry: 1000\n\n"
+        aviso.set()  # primera lectura: lo pendiente desde el cursor
+        while loop.time() < fin:
+            # solo se consulta la BD cuando el pub/sub o el sondeo avisan
+            espera = min(
+                settings.SSE_PING_SEGUNDOS - (loop.time() - ultimo_envio),
+                fin - loop.time(),
+            )
+            try:
+                await asyncio.wait_for(aviso.wait(), timeout=max(0, espera))
+            except asyncio.TimeoutError:
+                if loop.time() < fin:
+                    yield ": ping\n\n"  # mantiene vivos proxies y balanceadores
+                    ultimo_envio = loop.time()
+                continue
+            # limpio antes de leer: un aviso durante la consulta no se pierde
+            aviso.clear()
+            trozos, desde, hay_mas = await sync_to_async(_nuevos)(
+                paciente_id, desde, enviados
+            )
+            for trozo in trozos:
+                yield trozo
+            if trozos:
+                ultimo_envio = loop.time()
+            if hay_mas:
+                aviso.set()  # quedan filas tras el limite: se leen sin esperar
+    finally:
+        desuscribir(paciente_id, aviso)
+        _parar_sondeo(loop)
+
+
+@require_GET
+async def eventos(request):
+    """
+    GET /api/sync/eventos?ticket=<ticket>[&since=<cursor|iso>]. Eventos "glucemia"
+    y "alerta" (alta o cambio) con el objeto serializado; el id es el cursor.
+    La conexion se cierra tras SSE_MAX_DURACION s y el cliente reconecta.
+    """
+    paciente_id = await sync_to_async(_paciente_id)(request)
+    if paciente_id is None:
+        return JsonResponse({"detail": "Ticket invalido o caducado."}, status=401)
+    resp = StreamingHttpResponse(
+        _stream(paciente_id, _desde(request)), content_type="text/event-stream"
+    )
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # sin buffer en nginx
+    return resp
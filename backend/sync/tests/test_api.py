@@ -0,0 +1,390 @@
+import asyncio
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import quote
+
+from alertas.models import Alerta
+from asgiref.sync import sync_to_async
+from core.eventos import desuscribir, publicar, suscribir
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from glucosa.models import GlucosaRegistro
+from rest_framework.test import APITestCase
+from sync import lotes, sse
+
+
+# margen 0: el cursor avanza hasta ahora mismo (el margen tiene su propio test)
+@override_settings(SYNC_MARGEN_SEGUNDOS=0)
+class SyncChangesAPITest(APITestCase):
+    def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
+        User.objects.create_user("movil", password="movil1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "movil", "password": "movil1234"},
+            format="json",
+        )
+        assert r.status_code == 200, r.content
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {r.data['access']}")
+        self.client.get("/api/paciente/me/")
+
+    # helpers
+    def glucemia(self, valor, medido_en):
+        r = self.client.post(
+            "/api/glucemias/",
+            {"valor_mg_dl": valor, "medido_en": medido_en},
+            format="json",
+        )
+        assert r.status_code == 201, r.content
+        return r.data["id"]
+
+    def test_delta_con_cambios_y_borrados(self):
+        g1 = self.glucemia(100, "2025-11-10T08:00:00Z")
+        r = self.client.get("/api/sync/changes")
+        assert r.status_code == 200
+        assert [g["id"] for g in r.data["cambios"]["glucemias"]] == [g1]
+        cursor = r.data["cursor"]
+
+        # sin cambios: nada que descargar y el cursor no se mueve
+        r = self.client.get("/api/sync/changes", {"since": cursor})
+        assert all(not v for v in r.data["cambios"].values())
+        assert r.data["cursor"] == cursor
+
+        g2 = self.glucemia(110, "2025-11-10T09:00:00Z")
+        self.client.patch(f"/api/glucemias/{g1}/", {"notas": "x"}, format="json")
+        self.client.delete(f"/api/glucemias/{g2}/")
+        r = self.client.get("/api/sync/changes", {"since": cursor})
+        assert [g["id"] for g in r.data["cambios"]["glucemias"]] == [g1]
+        assert r.data["borrados"]["glucemias"] == [g2]
+        assert r.data["cursor"] != cursor
+
+    def test_paginado_por_limite(self):
+        for i in range(5):
+            self.glucemia(100 + i, f"2025-11-10T0{i}:00:00Z")
+        vistos, cursor = [], None
+        for _ in range(10):
+            params = {"limite": 2}
+            if cursor:
+                params["since"] = cursor
+            r = self.client.get("/api/sync/changes", params)
+            vistos += [g["id"] for g in r.data["cambios"]["glucemias"]]
+            cursor = r.data["cursor"]
+            if not r.data["hay_mas"]:
+                break
+        assert len(set(vistos)) == 5
+
+    def test_paginado_no_pierde_filas_del_mismo_instante(self):
+        # un "atender" masivo deja muchas filas con el mismo actualizado_en
+        paciente = User.objects.get(username="movil").paciente
+        Alerta.objects.bulk_create(
+            [
+                Alerta(paciente=paciente, tipo="stock_bajo", mensaje=str(i))
+                for i in range(5)
+            ]
+        )
+        Alerta.objects.filter(paciente=paciente).update(actualizado_en=timezone.now())
+        vistos, cursor = [], None
+        for _ in range(10):
+            params = {"limite": 2, **({"since": cursor} if cursor else {})}
+            r = self.client.get("/api/sync/changes", params)
+            vistos += [a["id"] for a in r.data["cambios"]["alertas"]]
+            cursor = r.data["cursor"]
+            if not r.data["hay_mas"]:
+                break
+        assert len(vistos) == len(set(vistos)) == 5
+
+    @override_settings(SYNC_MARGEN_SEGUNDOS=30)
+    def test_margen_recoge_commits_tardios(self):
+        ahora = timezone.now()
+        vieja = self.glucemia(100, "2025-11-10T08:00:00Z")
+        reciente = self.glucemia(110, "2025-11-10T09:00:00Z")
+        GlucosaRegistro.objects.filter(pk=vieja).update(
+            actualizado_en=ahora - timedelta(seconds=60)
+        )
+        r = self.client.get("/api/sync/changes")
+        assert {g["id"] for g in r.data["cambios"]["glucemias"]} == {vieja, reciente}
+
+        # una transaccion lenta hace commit ahora con un instante ya pasado
+        tardia = self.glucemia(120, "2025-11-10T10:00:00Z")
+        GlucosaRegistro.objects.filter(pk=tardia).update(
+            actualizado_en=ahora - timedelta(seconds=20)
+        )
+        r = self.client.get("/api/sync/changes", {"since": r.data["cursor"]})
+        # la reciente se repite (dentro del margen) y la tardia no se pierde
+        assert [g["id"] for g in r.data["cambios"]["glucemias"]] == [tardia, reciente]
+
+    def test_since_invalido(self):
+        r = self.client.get("/api/sync/changes", {"since": "no-es-cursor"})
+        assert r.status_code == 400
+
+
+class SyncBatchAPITest(APITestCase):
+    def setUp(self):
+        # el throttle por usuario vive en la cache y los ids se reutilizan
+        cache.clear()
+        User.objects.create_user("offline", password="offline1234")
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "offline", "password": "offline1234"},
+            format="json",
+        )
+        assert r.status_code == 200, r.content
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {r.data['access']}")
+        self.client.get("/api/paciente/me/")
+        r = self.client.post(
+            "/api/insumos/",
+            {"nombre": "Tiras", "tipo": "TIR", "stock_actual": 3, "stock_minimo": 0},
+            format="json",
+        )
+        self.insumo_id = r.data["id"]
+        r = self.client.post(
+            "/api/comidas/",
+            {"carbohidratos_g": 40, "descripcion": "vieja"},
+            format="json",
+        )
+        self.comida_id = r.data["id"]
+
+    def lote(self):
+        return {
+            "ops": [
+                {
+                    "clave": "g1",
+                    "op": "create",
+                    "recurso": "glucemias",
+                    "datos": {"valor_mg_dl": 120, "medido_en": "2025-11-11T08:00:00Z"},
+                },
+                {
+                    "clave": "g2",
+                    "op": "create",
+                    "recurso": "glucemias",
+                    "datos": {"valor_mg_dl": 5, "medido_en": "2025-11-11T08:05:00Z"},
+                },
+                {
+                    "clave": "m1",
+                    "op": "create",
+                    "recurso": "movimientos",
+                    "insumo": self.insumo_id,
+                    "datos": {"cantidad": -2, "motivo": "uso"},
+                },
+                {
+                    "clave": "c1",
+                    "op": "update",
+                    "recurso": "comidas",
+                    "id": self.comida_id,
+                    "datos": {"descripcion": "editada"},
+                },
+                {
+                    "clave": "c2",
+                    "op": "delete",
+                    "recurso": "comidas",
+                    "id": self.comida_id,
+                },
+            ]
+        }
+
+    def test_aplica_en_orden_con_resultado_por_operacion(self):
+        r = self.client.post("/api/sync/batch", self.lote(), format="json")
+        assert r.status_code == 200, r.content
+        estados = [x["estado"] for x in r.data["resultados"]]
+        assert estados == ["ok", "error", "ok", "ok", "ok"]
+        assert (
+            self.client.get(f"/api/insumos/{self.insumo_id}/").data["stock_actual"] == 1
+        )
+        assert self.client.get("/api/comidas/").data["count"] == 0
+        assert self.client.get("/api/glucemias/").data["count"] == 1
+
+    def test_reintento_idempotente(self):
+        self.client.post("/api/sync/batch", self.lote(), format="json")
+        r = self.client.post("/api/sync/batch", self.lote(), format="json")
+        assert r.status_code == 200, r.content
+        # las que ya se aplicaron no se repiten; la invalida sigue fallando
+        assert [x.get("repetida", False) for x in r.data["resultados"]] == [
+            True,
+            False,
+            True,
+            True,
+            True,
+        ]
+        assert (
+            self.client.get(f"/api/insumos/{self.insumo_id}/").data["stock_actual"] == 1
+        )
+        assert self.client.get("/api/glucemias/").data["count"] == 1
+
+    def test_update_de_movimiento_da_error_por_operacion(self):
+        ops = [
+            {"clave": "m1", "op": "update", "recurso": "movimientos", "id": 1},
+            {"clave": "m2", "op": "delete", "recurso": "movimientos", "id": 1},
+            {
+                "clave": "c1",
+                "op": "update",
+                "recurso": "comidas",
+                "id": self.comida_id,
+                "datos": {"descripcion": "editada"},
+            },
+        ]
+        r = self.client.post("/api/sync/batch", {"ops": ops}, format="json")
+        assert r.status_code == 200, r.content
+        assert [x["estado"] for x in r.data["resultados"]] == ["error", "error", "ok"]
+        assert "create" in r.data["resultados"][0]["errores"][0]
+
+    def test_replays_intercalados_no_duplican(self):
+        ops = [
+            {
+                "clave": "k1",
+                "op": "create",
+                "recurso": "comidas",
+                "datos": {"carbohidratos_g": 30, "descripcion": "offline"},
+            },
+            {
+                "clave": "k2",
+                "op": "create",
+                "recurso": "movimientos",
+                "insumo": self.insumo_id,
+                "datos": {"cantidad": -1, "motivo": "uso"},
+            },
+        ]
+        precargar = lotes._Lote._precargar
+        segundo = []
+
+        def intercalar(lote):
+            # el mismo lote reenviado llega mientras el primero aun se aplica
+            if not segundo:
+                segundo.append(None)
+                segundo[0] = lotes.aplicar_lote(lote.request, ops)
+            return precargar(lote)
+
+        with mock.patch.object(lotes._Lote, "_precargar", intercalar):
+            r = self.client.post("/api/sync/batch", {"ops": ops}, format="json")
+        assert [x["estado"] for x in r.data["resultados"]] == ["ok", "ok"]
+        assert [x["estado"] for x in segundo[0]] == ["error", "error"]
+        assert self.client.get("/api/comidas/").data["count"] == 2
+        assert (
+            self.client.get(f"/api/insumos/{self.insumo_id}/").data["stock_actual"] == 2
+        )
+        # terminado el primero, un nuevo reintento ve el resultado guardado
+        r = self.client.post("/api/sync/batch", {"ops": ops}, format="json")
+        assert [x.get("repetida") for x in r.data["resultados"]] == [True, True]
+
+
+@override_settings(SSE_MAX_DURACION=1, SSE_POLL_SEGUNDOS=0.1, SYNC_MARGEN_SEGUNDOS=0)
+class SyncEventosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("sse", password="sse12345")
+        self.paciente = self.user.paciente
+        r = self.client.post(
+            "/api/auth/token/",
+            {"username": "sse", "password": "sse12345"},
+            content_type="application/json",
+        )
+        self.token = r.json()["access"]
+        r = self.client.post(
+            "/api/sync/eventos/ticket", HTTP_AUTHORIZATION=f"Bearer {self.token}"
+        )
+        assert r.status_code == 200, r.content
+        self.ticket = r.json()["ticket"]
+
+    async def _leer(self, url, **extra):
+        r = await AsyncClient().get(url, **extra)
+        assert r.status_code == 200, r.status_code
+        assert r["Content-Type"] == "text/event-stream"
+        return "".join([t.decode() async for t in r.streaming_content])
+
+    async def test_stream_envia_glucemias_y_alertas(self):
+        antes = timezone.now() - timedelta(seconds=1)
+        g = await GlucosaRegistro.objects.acreate(
+            paciente=self.paciente, valor_mg_dl=150, medido_en=timezone.now()
+        )
+        await Alerta.objects.acreate(
+            paciente=self.paciente, tipo="stock_bajo", mensaje="x"
+        )
+        cuerpo = await self._leer(
+            f"/api/sync/eventos?ticket={self.ticket}&since={quote(antes.isoformat())}"
+        )
+        assert cuerpo.startswith("retry: 1000")
+        assert "event: glucemia" in cuerpo and f'"id": {g.pk}' in cuerpo
+        assert "event: alerta" in cuerpo
+
+        # Last-Event-ID: al reconectar no se repite lo ya recibido
+        ultimo = [ln for ln in cuerpo.splitlines() if ln.startswith("id: ")][-1]
+        cuerpo = await self._leer(
+            f"/api/sync/eventos?ticket={self.ticket}&since={quote(antes.isoformat())}",
+            headers={"Last-Event-ID": ultimo[4:]},
+        )
+        assert "event:" not in cuerpo
+
+    async def test_stream_exige_ticket(self):
+        r = await AsyncClient().get("/api/sync/eventos")
+        assert r.status_code == 401
+        r = await AsyncClient().get("/api/sync/eventos?ticket=basura")
+        assert r.status_code == 401
+        # el JWT ya no se acepta en la URL (acaba en los logs)
+        r = await AsyncClient().get(f"/api/sync/eventos?token={self.token}")
+        assert r.status_code == 401
+        # un ticket caducado tampoco
+        with override_settings(SSE_TICKET_SEGUNDOS=-1):
+            r = await AsyncClient().get(f"/api/sync/eventos?ticket={self.ticket}")
+        assert r.status_code == 401
+        # con cabecera (clientes que no son EventSource) sigue valiendo el JWT
+        r = await AsyncClient().get(
+            "/api/sync/eventos", headers={"Authorization": f"Bearer {self.token}"}
+        )
+        assert r.status_code == 200
+        [t async for t in r.streaming_content]
+
+    async def test_mas_filas_que_el_limite_sin_esperar_aviso(self):
+        antes = timezone.now() - timedelta(seconds=1)
+        await GlucosaRegistro.objects.abulk_create(
+            GlucosaRegistro(
+                paciente=self.paciente, valor_mg_dl=100, medido_en=timezone.now()
+            )
+            for _ in range(sse.LIMITE_POR_CONSULTA + 5)
+        )
+        cuerpo = await self._leer(
+            f"/api/sync/eventos?ticket={self.ticket}&since={quote(antes.isoformat())}"
+        )
+        # sin pub/sub ni sondeo (filas anteriores a la conexion): segunda pagina
+        # porque la primera llego al limite
+        assert cuerpo.count("event: glucemia") == sse.LIMITE_POR_CONSULTA + 5
+
+    # con margen: la fila sigue dentro en todos los sondeos y solo despierta una vez
+    @override_settings(SYNC_MARGEN_SEGUNDOS=30)
+    async def test_sondeo_compartido_entre_conexiones(self):
+        # dos conexiones: la BD solo se lee al empezar y cuando el sondeo (uno
+        # para todo el worker) ve un cambio hecho en otro proceso, sin pub/sub
+        nuevos = sse._nuevos
+        lecturas = []
+
+        def contar(*args):
+            lecturas.append(args[0])
+            return nuevos(*args)
+
+        async def escribir_en_otro_proceso():
+            await asyncio.sleep(0.3)
+            await GlucosaRegistro.objects.acreate(
+                paciente=self.paciente, valor_mg_dl=99, medido_en=timezone.now()
+            )
+
+        url = f"/api/sync/eventos?ticket={self.ticket}"
+        with mock.patch.object(sse, "_nuevos", contar):
+            cuerpos = await asyncio.gather(
+                self._leer(url), self._leer(url), escribir_en_otro_proceso()
+            )
+        assert all('"valor_mg_dl": 99' in c for c in cuerpos[:2])
+        assert len(lecturas) == 4  # inicial + tras el cambio, por conexion
+        assert not sse._sondeos
+
+    async def test_pubsub_despierta_al_suscriptor(self):
+        def publicar_y_confirmar():
+            with self.captureOnCommitCallbacks(execute=True):
+                publicar(self.paciente.pk)
+
+        aviso = suscribir(self.paciente.pk)
+        try:
+            await sync_to_async(publicar_y_confirmar)()
+            await asyncio.wait_for(aviso.wait(), timeout=1)
+        finally:
+            desuscribir(self.paciente.pk, aviso)
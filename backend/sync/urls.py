@@ -0,0 +1,11 @@
+from django.urls import path
+
+from .sse import eventos
+from .views import SyncBatchView, SyncChangesView, SyncTicketView
+
+urlpatterns = [
+    path("changes", SyncChangesView.as_view(), name="sync_changes"),
+    path("batch", SyncBatchView.as_view(), name="sync_batch"),
+    path("eventos", eventos, name="sync_eventos"),
+    path("eventos/ticket", SyncTicketView.as_view(), name="sync_eventos_ticket"),
+]
@@ -0,0 +1,193 @@
+from django.conf import settings
+from drf_spectacular.utils import (
+    OpenApiExample,
+    OpenApiParameter,
+    extend_schema,
+    inline_serializer,
+)
+from rest_framework import serializers
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cursor import CursorInvalido, codificar, decodificar, pagina, tope
+from .lotes import MAX_OPERACIONES, OPS, RECURSOS_LOTE, aplicar_lote
+from .models import Borrado
+from .recursos import RECURSOS
+from .sse import crear_ticket
+
+LIMITE_DEFECTO = 500
+LIMITE_MAX = 2000
+
+
+# delta-sync: solo lo cambiado (y borrado) desde el cursor, una consulta por modelo
+class SyncChangesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["Sync"],
+        parameters=[
+            OpenApiParameter(
+                name="since",
+                description=(
+                    "Cursor opaco devuelto por la llamada anterior (vacio = todo). "
+                    "Las filas de los ultimos SYNC_MARGEN_SEGUNDOS pueden repetirse."
+                ),
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limite",
+                description=f"Filas maximas por recurso (<= {LIMITE_MAX})",
+                required=False,
+                type=int,
+            ),
+        ],
+    )
+    def get(self, request):
+        paciente = request.user.paciente
+        claves = [*RECURSOS, "borrados"]
+        try:
+            desde = decodificar(request.query_params.get("since"), claves)
+        except CursorInvalido:
+            return Response({"detail": "since no es un cursor valido"}, status=400)
+        try:
+            limite = min(
+                int(request.query_params.get("limite", LIMITE_DEFECTO)), LIMITE_MAX
+            )
+        except ValueError:
+            return Response({"detail": "limite debe ser entero"}, status=400)
+
+        # cada recurso avanza su propia posicion (actualizado_en, id)
+        hasta = tope()
+        cambios, borrados, posiciones = {}, {}, {}
+        hay_mas = False
+        for nombre, (modelo, serializer) in RECURSOS.items():
+            filas, posiciones[nombre], mas = pagina(
+                modelo.objects.filter(paciente=paciente),
+                "actualizado_en",
+                desde[nombre],
+                limite,
+                hasta,
+            )
+            cambios[nombre] = serializer(filas, many=True).data
+            hay_mas |= mas
+
+        lapidas, posiciones["borrados"], mas = pagina(
+            Borrado.objects.filter(paciente=paciente),
+            "borrado_en",
+            desde["borrados"],
+            limite,
+            hasta,
+        )
+        hay_mas |= mas
+        for nombre in RECURSOS:
+            borrados[nombre] = [b.objeto_id for b in lapidas if b.recurso == nombre]
+
+        return Response(
+            {
+                "cursor": codificar(posiciones),
+                "hay_mas": hay_mas,
+                "cambios": cambios,
+                "borrados": borrados,
+            }
+        )
+
+
+# lote offline: operaciones mixtas en orden, en una sola transaccion
+class SyncBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["Sync"],
+        request=inline_serializer(
+            name="SyncBatch",
+            fields={
+                "ops": serializers.ListField(
+                    child=inline_serializer(
+                        name="SyncBatchOp",
+                        fields={
+                            "clave": serializers.CharField(
+                                help_text="Clave de idempotencia del cliente"
+                            ),
+                            "op": serializers.ChoiceField(choices=OPS),
+                            "recurso": serializers.ChoiceField(
+                                choices=list(RECURSOS_LOTE)
+                            ),
+                            "id": serializers.IntegerField(required=False),
+                            "insumo": serializers.IntegerField(required=False),
+                            "datos": serializers.DictField(required=False),
+                        },
+                    )
+                )
+            },
+        ),
+        examples=[
+            OpenApiExample(
+                "Lote offline",
+                value={
+                    "ops": [
+                        {
+                            "clave": "a1",
+                            "op": "create",
+                            "recurso": "glucemias",
+                            "datos": {
+                                "valor_mg_dl": 120,
+                                "medido_en": "2025-11-11T08:35:00Z",
+                            },
+                        },
+                        {
+                            "clave": "a2",
+                            "op": "create",
+                            "recurso": "movimientos",
+                            "insumo": 3,
+                            "datos": {"cantidad": -1, "motivo": "uso"},
+                        },
+                        {"clave": "a3", "op": "delete", "recurso": "comidas", "id": 8},
+                    ]
+                },
+                request_only=True,
+            )
+        ],
+    )
+    def post(self, request):
+        ops = request.data.get("ops") if isinstance(request.data, dict) else None
+        if not isinstance(ops, list):
+            return Response({"detail": "ops debe ser lista"}, status=400)
+        if len(ops) > MAX_OPERACIONES:
+            return Response(
+                {"detail": f"Máximo {MAX_OPERACIONES} operaciones por lote."},
+                status=400,
+            )
+        resultados = aplicar_lote(request, ops)
+        return Response(
+            {
+                "aplicadas": sum(r["estado"] == "ok" for r in resultados),
+                "errores": sum(r["estado"] == "error" for r in resultados),
+                "resultados": resultados,
+            }
+        )
+
+
+# EventSource no admite cabeceras: ticket corto para abrir /api/sync/eventos
+class SyncTicketView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["Sync"],
+        request=None,
+        responses=inline_serializer(
+            name="SyncTicket",
+            fields={
+                "ticket": serializers.CharField(),
+                "expira_en": serializers.IntegerField(help_text="Segundos"),
+            },
+        ),
+    )
+    def post(self, request):
+        return Response(
+            {
+                "ticket": crear_ticket(request.user.paciente.pk),
+                "expira_en": settings.SSE_TICKET_SEGUNDOS,
+            }
+        )
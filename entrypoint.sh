@@ -4,4 +4,6 @@ set -e
 cd /app/backend
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput || true
-exec gunicorn --bind 0.0.0.0:8000 diaflow.wsgi:application
+# verificaciones QR que quedaron en el spool si el contenedor cayo
+python manage.py flush_verificaciones
+exec gunicorn --bind 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker diaflow.asgi:application